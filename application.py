@@ -1,7 +1,10 @@
 from flask import Flask, render_template, request, redirect, escape
 import os, sys, signal
 
-import page_view, page_edit, page_new
+import page_view, page_edit, page_new, page_search, page_math, page_history
+import page_edit_tree
+import backup
+from sqlops import Db, configure
 
 app = Flask(__name__)
 app.secret_key = os.urandom(128 // 8)
@@ -31,6 +34,34 @@ def new():
     else:
         return page_new.handle_post(app_config)
 
+@app.route('/tree', methods=['POST'])
+def tree():
+    return page_edit_tree.handle_post(app_config)
+
+@app.route('/search')
+def search():
+    return page_search.handle(app_config)
+
+@app.route('/math')
+def math():
+    return page_math.handle(app_config)
+
+@app.route('/history')
+def history():
+    return page_history.handle_list(app_config)
+
+@app.route('/revision')
+def revision():
+    return page_history.handle_view(app_config)
+
+@app.route('/backup', methods=['POST'])
+def make_backup():
+    if not app_config['backup_dir']:
+        return 'No backup_dir in the config\n', 404
+    path = backup.backup(app_config['db_uri'], app_config['backup_dir'],
+                         app_config['backup_keep'])
+    return 'Backed up to %s\n' % path.name
+
 @app.route('/shutdown', methods=['POST'])
 def shutdown():
     func = request.environ.get('werkzeug.server.shutdown')
@@ -48,4 +79,14 @@ def main(bind, port, config):
     app_config['db_uri'] = str(app_config['db_path'])
     del app_config['db_path']
 
+    # set up the schema before the first request
+    configure(app_config['db_uri'], app_config)
+    with Db(app_config['db_uri']):
+        pass
+
+    if app_config['backup_dir'] and app_config['backup_interval']:
+        backup.start_periodic(app_config['db_uri'], app_config['backup_dir'],
+                              app_config['backup_interval'],
+                              app_config['backup_keep'])
+
     app.run(bind, port, debug=True, use_reloader=False)
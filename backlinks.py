@@ -0,0 +1,50 @@
+from parsing import ParserAcc
+from sqlops import Db, slug_to_link
+
+class DbLinks(Db):
+    def get_backlinks(self, page_id, slug):
+        """(title, link) of the listed pages that link to `slug`"""
+        with self.auto_rollback() as c:
+            c.execute("""
+            SELECT DISTINCT toc.title, toc.slug FROM links
+            INNER JOIN toc ON toc.id = links.from_page
+            WHERE links.to_slug = ? AND links.from_page != ?
+            AND toc.unlisted IS NOT 1
+            ORDER BY toc.title
+            """, (slug, page_id))
+            return [(row[0], slug_to_link(row[1])) for row in c]
+
+    @staticmethod
+    def write_links(c, page_id, fragments):
+        """The old links of the fragments go away with their content rows"""
+        c.executemany("""
+        INSERT OR IGNORE INTO links (from_page, from_content, to_slug)
+        VALUES (?, ?, ?)
+        """, ((page_id, f.content_id, slug)
+              for f in fragments for slug in f.slugs))
+
+    def rebuild_links(self, new_parser):
+        """Parses every paragraph in the notebook again.
+        new_parser: slug -> Parser"""
+        parsers = {}
+        links = []
+        with self.auto_rollback() as c:
+            c.execute("""
+            SELECT content.id, content.parent_id, content.content, toc.slug
+            FROM content INNER JOIN toc ON toc.id = content.parent_id
+            """)
+            for content_id, page_id, text, slug in c.fetchall():
+                parser = parsers.get(slug)
+                if parser is None:
+                    parser = parsers[slug] = new_parser(slug)
+                parser.acc = ParserAcc()
+                parser.parse_string(text, content_id)
+                for to_slug in parser.acc.slugs():
+                    links.append((page_id, content_id, to_slug))
+
+            c.execute('DELETE FROM links')
+            c.executemany("""
+            INSERT INTO links (from_page, from_content, to_slug)
+            VALUES (?, ?, ?)
+            """, links)
+        return len(links)
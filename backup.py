@@ -0,0 +1,100 @@
+"""Online backups with SQLite's backup API. The copy is made a few pages at a
+time, with a pause after each step, so that /view and /edit keep going.
+Backups are written next to their final name and renamed when complete,
+so there is never a torn copy in the backup directory."""
+
+from pathlib import Path
+from threading import Thread, Lock
+import os
+import re
+import sqlite3
+import sys
+import time
+from sqlops import Db
+
+# pages copied per step, and seconds to pause after each step
+STEP_PAGES = 256
+STEP_PAUSE = 0.01
+
+NAME_FORMAT = '%Y%m%d-%H%M%S'
+# the stamp is followed by a sequence number, for backups in the same second
+NAME_REGEX = r'\d{8}-\d{6}-\d{3}'
+SUFFIX = '.db'
+
+_lock = Lock()
+
+def backup_name(address, when=None, sequence=0):
+    stamp = time.strftime(NAME_FORMAT, time.localtime(when))
+    return '%s-%s-%03d%s' % (Path(address).stem, stamp, sequence, SUFFIX)
+
+def new_backup_path(address, directory):
+    """A path in `directory` that no backup has taken yet"""
+    when = time.time()
+    sequence = 0
+    path = Path(directory) / backup_name(address, when)
+    while path.exists():
+        sequence += 1
+        path = Path(directory) / backup_name(address, when, sequence)
+    return path
+
+def list_backups(address, directory):
+    """The backups of `address` in `directory`, oldest first. Other files
+    are left out, even if their names start the same way."""
+    pattern = re.compile('%s-%s%s' % (re.escape(Path(address).stem),
+                                      NAME_REGEX, re.escape(SUFFIX)))
+    return sorted(path for path in Path(directory).iterdir()
+                  if pattern.fullmatch(path.name))
+
+def rotate(address, directory, keep):
+    """Deletes all but the newest `keep` backups. Returns the deleted paths."""
+    if not keep or keep < 1:
+        return []
+    old = list_backups(address, directory)[:-keep]
+    for path in old:
+        path.unlink()
+    return old
+
+class DbBackup(Db):
+    def __init__(self, address):
+        # never writes to the notebook
+        super().__init__(address, readonly=True)
+
+    def backup_to(self, path, pages=STEP_PAGES, pause=STEP_PAUSE):
+        """Copies the notebook into a new database at `path`"""
+        path = Path(path)
+        partial = path.with_name(path.name + '.partial')
+        if partial.exists():
+            partial.unlink()
+        target = sqlite3.connect(str(partial))
+        try:
+            self.conn.backup(target, pages=pages,
+                             progress=lambda *_: time.sleep(pause))
+        finally:
+            target.close()
+        os.replace(str(partial), str(path))
+        return path
+
+def backup(address, directory, keep=None, pages=STEP_PAGES,
+           pause=STEP_PAUSE):
+    """Makes a new backup in `directory` and rotates the old ones out.
+    Backups of one process run one at a time. Returns the new path."""
+    with _lock:
+        path = new_backup_path(address, directory)
+        with DbBackup(address) as db:
+            db.backup_to(path, pages, pause)
+        rotate(address, directory, keep)
+        return path
+
+def start_periodic(address, directory, interval, keep=None):
+    """Backs up every `interval` seconds in a daemon thread"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                path = backup(address, directory, keep)
+                print(' * Backed up to', path, file=sys.stderr)
+            except Exception as e:
+                print(' * Backup failed:', e, file=sys.stderr)
+    thread = Thread(target=loop, name='backup', daemon=True)
+    thread.start()
+    return thread
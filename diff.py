@@ -31,15 +31,20 @@ def _lcs(p, q):
 
 def print_diff(p, q):
     mem = _lcs(p, q)
-    yield from _print_diff(p, q, mem, len(p), len(q))
+    yield from reversed(_print_diff(p, q, mem, len(p), len(q)))
 
 def _print_diff(p, q, mem, x, y):
-    if x > 0 and y > 0 and p[x - 1] == q[y - 1]:
-        yield from _print_diff(p, q, mem, x - 1, y - 1)
-        yield (' ', p[x - 1])
-    elif y > 0 and (x == 0 or mem[x][y - 1] >= mem[x - 1][y]):
-        yield from _print_diff(p, q, mem, x, y - 1)
-        yield ('+', q[y - 1])
-    elif x > 0 and (y == 0 or mem[x][y - 1] < mem[x - 1][y]):
-        yield from _print_diff(p, q, mem, x - 1, y)
-        yield ('-', p[x - 1])
+    # walks back from the end, so the result is in reverse order
+    # (a loop rather than recursion, because pages can be long)
+    result = []
+    while x > 0 or y > 0:
+        if x > 0 and y > 0 and p[x - 1] == q[y - 1]:
+            result.append((' ', p[x - 1]))
+            x, y = x - 1, y - 1
+        elif y > 0 and (x == 0 or mem[x][y - 1] >= mem[x - 1][y]):
+            result.append(('+', q[y - 1]))
+            y -= 1
+        else:
+            result.append(('-', p[x - 1]))
+            x -= 1
+    return result
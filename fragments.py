@@ -0,0 +1,117 @@
+from hashlib import sha1
+from parsing import compile_paragraph, ParserAcc, Cons
+from sqlops import Db, is_busy
+
+# bump this when the HTML output of the compiler changes
+FRAGMENT_VERSION = 1
+
+def text_hash(text):
+    key = '%d:%s' % (FRAGMENT_VERSION, text)
+    return sha1(key.encode('utf-8')).hexdigest()
+
+def is_exception(ast):
+    if not ast.params:
+        return False
+    first = ast.params[0]
+    return isinstance(first, Cons) and first.data == '.exception'
+
+def exception_location(ast):
+    """(content_id, line) of a paragraph that failed to parse"""
+    params = ast.params[0].params
+    return int(params[1]), int(params[2])
+
+class Fragment(object):
+    __slots__ = ('content_id', 'text', 'ast', 'slugs', 'html', 'math')
+
+    def __init__(self, content_id, text, ast, slugs):
+        self.content_id = content_id
+        self.text = text
+        self.ast = ast
+        self.slugs = slugs
+        self.html = None
+        # (tex, display) pairs, known after compiling
+        self.math = None
+
+    def cacheable(self):
+        # error messages contain the page slug, so we don't keep them
+        return self.html is not None and not is_exception(self.ast)
+
+def parse_fragments(parser, pairs, programs=None):
+    """Parse (string, content_id) pairs, one ParserAcc per paragraph.
+    Returns the fragments and a ParserAcc that has all the slugs.
+    If `programs` is given, the parser must be a PDAParser."""
+    fragments = []
+    merged = ParserAcc()
+    for string, content_id in pairs:
+        parser.acc = ParserAcc()
+        if programs is None:
+            ast = parser.parse_string(string, content_id)
+        else:
+            ast = parser.parse_cached(string, content_id, programs)
+        fragments.append(Fragment(content_id, string, ast,
+                                  parser.acc.slugs()))
+        merged.update(parser.acc)
+    parser.acc = merged
+    return fragments, merged
+
+def compile_fragments(fragments, parser_acc):
+    for fragment in fragments:
+        acc = compile_paragraph(fragment.ast, parser_acc)
+        fragment.html = ''.join(acc.output)
+        fragment.math = acc.math
+
+class DbFragment(Db):
+    def load_fragments(self, page_id, pairs):
+        """Returns {content_id: html} for fragments that are up to date"""
+        result = {}
+        with self.auto_rollback() as c:
+            c.execute("""
+            SELECT fragment.content_id, hash, html FROM fragment
+            INNER JOIN content ON content.id = fragment.content_id
+            WHERE content.parent_id = ?
+            """, (page_id,))
+            hashes = {}
+            for row in c:
+                hashes[row[0]] = (row[1], row[2])
+            # a linked page changed its title, was created or was deleted
+            c.execute("""
+            SELECT DISTINCT fragment_dep.content_id FROM fragment_dep
+            INNER JOIN content ON content.id = fragment_dep.content_id
+            LEFT JOIN toc ON toc.slug = fragment_dep.slug
+            WHERE content.parent_id = ? AND toc.title IS NOT fragment_dep.title
+            """, (page_id,))
+            for row in c:
+                hashes.pop(row[0], None)
+
+        for string, content_id in pairs:
+            entry = hashes.get(content_id)
+            if entry is not None and entry[0] == text_hash(string):
+                result[content_id] = entry[1]
+        return result
+
+    def store_fragments(self, fragments, parser_acc):
+        fragments = [f for f in fragments if f.cacheable()]
+        if not fragments:
+            return
+        try:
+            with self.write_transaction(wait=False) as c:
+                self.write_fragments(c, fragments, parser_acc)
+        except Exception as e:
+            # somebody is saving; the next view will store them
+            if not is_busy(e):
+                raise e from e
+
+    @staticmethod
+    def write_fragments(c, fragments, parser_acc):
+        c.executemany('DELETE FROM fragment_dep WHERE content_id = ?',
+                      ((f.content_id,) for f in fragments))
+        # the paragraph may have been deleted since it was read
+        c.executemany("""
+        INSERT OR REPLACE INTO fragment (content_id, hash, html)
+        SELECT id, ?, ? FROM content WHERE id = ?
+        """, ((text_hash(f.text), f.html, f.content_id) for f in fragments))
+        c.executemany("""
+        INSERT INTO fragment_dep (content_id, slug, title)
+        SELECT content_id, ?, ? FROM fragment WHERE content_id = ?
+        """, ((slug, parser_acc.get(slug), f.content_id)
+              for f in fragments for slug in f.slugs))
@@ -0,0 +1,156 @@
+"""Schema changes on top of schema.sql, applied in order at startup.
+schema.sql creates the tables of a new database; everything after that
+(indexes, new columns, data fixes) is a migration, so that old databases
+get it too. Never change a migration that has been released."""
+
+MIGRATIONS = []
+
+def migration(version):
+    def decorator(func):
+        MIGRATIONS.append((version, func))
+        MIGRATIONS.sort(key=lambda pair: pair[0])
+        return func
+    return decorator
+
+@migration(1)
+def index_tree_and_content(c):
+    # the tree queries, and the paragraphs of a page
+    c.execute('CREATE INDEX IF NOT EXISTS "toc_parent_id" ON "toc" '
+              '("parent_id")')
+    c.execute('CREATE INDEX IF NOT EXISTS "toc_next_id" ON "toc" '
+              '("next_id")')
+    c.execute('CREATE INDEX IF NOT EXISTS "content_parent_id" ON "content" '
+              '("parent_id")')
+    c.execute('CREATE INDEX IF NOT EXISTS "content_next_id" ON "content" '
+              '("next_id")')
+
+@migration(2)
+def rebuild_search(c):
+    # index the notes that were written before the search table existed
+    c.execute("INSERT INTO search (search) VALUES ('rebuild')")
+    c.execute("INSERT INTO search (search, rank) "
+              "VALUES ('rank', 'bm25(5.0, 1.0)')")
+
+@migration(3)
+def order_content_by_position(c):
+    # the paragraphs used to be a linked list: toc.first_content_id, then
+    # content.next_id. Rows that cannot be reached keep a NULL position.
+    c.execute('ALTER TABLE content ADD COLUMN position INTEGER')
+    c.execute("""
+    WITH RECURSIVE walk (id, n) AS (
+        SELECT first_content_id, 1 FROM toc
+        WHERE first_content_id IS NOT NULL
+        UNION ALL
+        SELECT content.next_id, walk.n + 1 FROM walk
+        INNER JOIN content ON content.id = walk.id
+        WHERE content.next_id IS NOT NULL
+        AND walk.n <= (SELECT count(*) FROM content)
+    )
+    SELECT id, n FROM walk
+    """)
+    positions = [(n * 1024, content_id) for content_id, n in c.fetchall()]
+    c.executemany('UPDATE content SET position = ? WHERE id = ?', positions)
+    c.execute('CREATE INDEX IF NOT EXISTS "content_position" ON "content" '
+              '("parent_id", "position")')
+
+@migration(4)
+def order_pages_by_position(c):
+    # sibling pages used to be a linked list too: toc.first_child_id, then
+    # toc.next_id. Pages that cannot be reached go after the others.
+    c.execute('ALTER TABLE toc ADD COLUMN position INTEGER NOT NULL DEFAULT 0')
+    c.execute("""
+    WITH RECURSIVE walk (id, n) AS (
+        SELECT id, 1 FROM toc
+        WHERE id IN (SELECT first_child_id FROM toc)
+        OR (parent_id IS NULL AND id NOT IN (
+            SELECT next_id FROM toc WHERE next_id IS NOT NULL
+        ))
+        UNION ALL
+        SELECT toc.next_id, walk.n + 1 FROM walk
+        INNER JOIN toc ON toc.id = walk.id
+        WHERE toc.next_id IS NOT NULL
+        AND walk.n <= (SELECT count(*) FROM toc)
+    )
+    SELECT id, max(n) FROM walk GROUP BY id
+    """)
+    positions = dict(c.fetchall())
+    c.execute('SELECT id, parent_id FROM toc ORDER BY id')
+    rows = c.fetchall()
+    last = {}
+    for page_id, parent_id in rows:
+        if page_id in positions:
+            last[parent_id] = max(last.get(parent_id, 0), positions[page_id])
+    for page_id, parent_id in rows:
+        if page_id not in positions:
+            last[parent_id] = last.get(parent_id, 0) + 1
+            positions[page_id] = last[parent_id]
+    c.executemany('UPDATE toc SET position = ? WHERE id = ?',
+                  [(n * 1024, page_id) for page_id, n in positions.items()])
+    c.execute('CREATE INDEX IF NOT EXISTS "toc_position" ON "toc" '
+              '("parent_id", "position")')
+    # the closure table of the pages that are already there
+    c.execute('DELETE FROM toc_closure')
+    c.execute("""
+    WITH RECURSIVE walk (ancestor, descendant, depth) AS (
+        SELECT id, id, 0 FROM toc
+        UNION ALL
+        SELECT walk.ancestor, toc.id, walk.depth + 1 FROM walk
+        INNER JOIN toc ON toc.parent_id = walk.descendant
+        WHERE walk.depth < (SELECT count(*) FROM toc)
+    )
+    INSERT OR IGNORE INTO toc_closure (ancestor, descendant, depth)
+    SELECT ancestor, descendant, depth FROM walk
+    """)
+
+@migration(5)
+def index_page_references(c):
+    # deleting a page looks for the rows that point to it
+    c.execute('CREATE INDEX IF NOT EXISTS "links_from_page" ON "links" '
+              '("from_page")')
+    c.execute('CREATE INDEX IF NOT EXISTS "math_page_id" ON "math" '
+              '("page_id")')
+
+@migration(6)
+def hash_bytecode(c):
+    # the hash of the text that each program was compiled from (see
+    # fragments.text_hash); the old programs have none, so they are compiled
+    # again when they are needed
+    c.execute('ALTER TABLE bytecode ADD COLUMN hash TEXT')
+
+@migration(7)
+def drop_linked_list_indexes(c):
+    # nothing looks up toc.next_id or content.next_id since positions
+    c.execute('DROP INDEX IF EXISTS "toc_next_id"')
+    c.execute('DROP INDEX IF EXISTS "content_next_id"')
+
+def read_version(c):
+    c.execute("SELECT value_int FROM metadata WHERE key = 'schema_version'")
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def migrate(conn):
+    """Applies the pending migrations in one transaction.
+    Returns the number of migrations that were applied."""
+    c = conn.cursor()
+    # cheap check first, so that we don't take the write lock for nothing
+    if read_version(c) >= latest_version():
+        return 0
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        version = read_version(c)
+        pending = [(v, f) for (v, f) in MIGRATIONS if v > version]
+        for v, func in pending:
+            func(c)
+        if pending:
+            c.execute("""
+            INSERT OR REPLACE INTO metadata (key, value_int)
+            VALUES ('schema_version', ?)
+            """, (pending[-1][0],))
+        c.execute('COMMIT')
+    except Exception as e:
+        c.execute('ROLLBACK')
+        raise e from e
+    return len(pending)
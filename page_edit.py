@@ -1,5 +1,13 @@
 from flask import request, render_template, url_for, redirect
-from page_view import DbTree, QueryBuilder
+from page_view import DbTree
+from parsing import new_parser, PDAParser
+from fragments import DbFragment, parse_fragments, compile_fragments
+from fragments import is_exception, exception_location
+from programs import DbBytecode, Programs
+from backlinks import DbLinks
+from page_math import DbMath
+from page_history import DbHistory
+from title_index import get_title_index, lookup_titles, read_generation
 from functools import wraps
 from sqlops import PageNotFoundError, Content, is_valid_slug, slug_to_link
 from sqlite3 import IntegrityError
@@ -9,7 +17,40 @@ from diff import print_diff
 import time
 from operator import itemgetter
 
-db_query = str(QueryBuilder().upward())
+# paragraphs are ordered by content.position; new ones go in the middle of
+# the gap between their neighbours, until there is no gap left
+POSITION_GAP = 1024
+
+def plan_positions(positions):
+    """Fills in the positions of the new paragraphs (None) between the old
+    ones, which must be in order. Everything is renumbered if there is no
+    room left between two old paragraphs."""
+    result = list(positions)
+    i = 0
+    while i < len(result):
+        if result[i] is not None:
+            i += 1
+            continue
+        j = i
+        while j < len(result) and result[j] is None:
+            j += 1
+        lo = result[i - 1] if i > 0 else None
+        hi = result[j] if j < len(result) else None
+        n = j - i
+        if lo is None and hi is None:
+            new = [(k + 1) * POSITION_GAP for k in range(n)]
+        elif hi is None:
+            new = [lo + (k + 1) * POSITION_GAP for k in range(n)]
+        elif lo is None:
+            new = [hi - (n - k) * POSITION_GAP for k in range(n)]
+        elif hi - lo > n:
+            step = (hi - lo) // (n + 1)
+            new = [lo + (k + 1) * step for k in range(n)]
+        else:
+            return [(k + 1) * POSITION_GAP for k in range(len(result))]
+        result[i:j] = new
+        i = j
+    return result
 
 class ConcurrentEditError(IntegrityError):
     def __init__(self):
@@ -25,16 +66,42 @@ def needs_page_id(func):
     return result
 
 class EditPageDbReader(DbTree):
-    def get_tree_cte(self):
-        return db_query
+    def get_tree_rows(self, toc_snapshot, page_id):
+        return toc_snapshot.path_rows(page_id)
+
+def render_paragraphs(c, page_id, parser, pairs, programs):
+    """Writes the fragments, links and math of the (text, content_id) pairs
+    of a page, in the transaction that wrote them. Returns the location
+    (content_id, line) of the first markup error, or None."""
+    if isinstance(parser, PDAParser):
+        fragments, parser_acc = parse_fragments(parser, pairs, programs)
+    else:
+        fragments, parser_acc = parse_fragments(parser, pairs)
+    # the index does not have the uncommitted changes yet
+    lookup_titles(c, parser_acc.unprocessed_slugs(), parser_acc)
+    compile_fragments(fragments, parser_acc)
+    DbFragment.write_fragments(
+        c, [f for f in fragments if f.cacheable()], parser_acc
+    )
+    DbLinks.write_links(c, page_id, fragments)
+    DbMath.write_math(c, page_id, fragments)
+    for fragment in fragments:
+        if is_exception(fragment.ast):
+            return exception_location(fragment.ast)
+    return None
 
 class EditPageDbWriter(DbTree):
     def __init__(self, db_uri):
         super().__init__(db_uri)
         self.page_id = None
         self.content_pair_iter = None
+        self.content_position_iter = None
+        self.programs = Programs()
 
-    def handle_change(self, form):
+    def handle_change(self, form, parser=None):
+        """Saves the page, and renders the new paragraphs into the fragment
+        store. Returns the location (content_id, line) of the first markup
+        error, or None."""
         old_slug = form.get('old_slug', '')
         new_slug = form.get('new_slug', '')
         title = form.get('title', '')
@@ -42,23 +109,43 @@ class EditPageDbWriter(DbTree):
         lock = form.get('content_lock', '')
         unlisted = form.get('unlisted', '') == '1'
 
-        with self.auto_rollback() as c:
+        error = None
+        with self.write_transaction() as c:
+            before = read_generation(c)
             self.register(c, old_slug)
             self.check_and_change_lock(c, lock)
+            DbHistory.begin_revision(c, self.page_id, map(
+                itemgetter(0), self.content_pair_iter()
+            ))
             self.change_metadata(c, new_slug, title, unlisted)
-            self.patch_page(c, self.generate_patch(text_list))
+            patch = list(self.generate_patch(text_list))
+            inserted = self.patch_page(c, patch)
+            DbHistory.write_revision(c, self.page_id, patch)
+            if parser is None:
+                parser = new_parser(new_slug.strip())
+            error = self.render_inserted(c, parser, inserted)
+            after = read_generation(c)
+        get_title_index(self.address).change(
+            old_slug, new_slug.strip(), title.strip(), before, after
+        )
+        return error
+
+    def render_inserted(self, c, parser, pairs):
+        """Unchanged paragraphs keep their fragments and links, so only the
+        inserted ones are rendered"""
+        return render_paragraphs(c, self.page_id, parser, pairs,
+                                 self.programs)
 
     def register(self, c, old_slug):
-        c.execute('SELECT id, first_content_id FROM toc WHERE slug = ?',
-                  (old_slug,))
+        c.execute('SELECT id FROM toc WHERE slug = ?', (old_slug,))
         row = c.fetchone()
         if not row:
             raise PageNotFoundError(old_slug)
         self.page_id = row[0]
         content = Content()
         DbTree._load_content(c, self.page_id, content)
-        content.register_content_id(row[1])
         self.content_pair_iter = content.content_pair_iter
+        self.content_position_iter = content.content_position_iter
 
     def check_and_change_lock(self, c, lock):
         if lock == '': lock = None
@@ -94,104 +181,55 @@ class EditPageDbWriter(DbTree):
         filtered = filter(str.__len__, map(str.strip, text_list))
         return print_diff(list(content_list), list(filtered))
 
+    @needs_page_id
     def patch_page(self, c, patch):
-        content_ids = map(itemgetter(1), self.content_pair_iter())
-        last_id = 'front'
+        """Returns the (content, content_id) pairs that were inserted.
+        The new order is worked out first, then written all at once."""
+        old_rows = zip(self.content_pair_iter(), self.content_position_iter())
+        order = []  # [content_id, position, text or None if unchanged]
+        deleted = []
         for action, operand in patch:
             if action == '+':
-                self.insert_paragraph(c, last_id, operand)
-                last_id = 'lastinsert'
+                order.append([None, None, operand])
             elif action == '-':
-                self.delete_paragraph(c, next(content_ids))
-                # don't update last_id, but still move on
+                (_, content_id), _ = next(old_rows)
+                deleted.append((content_id, self.page_id))
             else:
-                last_id = next(content_ids)
-
-    @needs_page_id
-    def append(self, c, content):
-        c.execute("""
-        INSERT INTO content (parent_id, next_id, content)
-        VALUES (?, NULL, ?)
-        """, (self.page_id, content))
-
-        c.execute("""
-        UPDATE content SET next_id = last_insert_rowid()
-        WHERE id != last_insert_rowid() AND next_id IS NULL
-        """)
-
-    def _check_is_front(self, c, paragraph_id):
-        c.execute("""
-        SELECT first_content_id FROM toc
-        WHERE id = ? AND
-        (SELECT parent_id FROM content where id = ?) = ?
-        """, (self.page_id, paragraph_id, self.page_id))
-        row = c.fetchone()
-        # also checks if row exists, and the if the parent is correct
-        if not row:
+                (_, content_id), position = next(old_rows)
+                order.append([content_id, position, None])
+
+        positions = plan_positions([p for _, p, _ in order])
+        c.execute('SELECT coalesce(max(id), 0) FROM content')
+        next_id = c.fetchone()[0] + 1
+        moved = []
+        inserted = []
+        for row, position in zip(order, positions):
+            content_id, old_position, text = row
+            if content_id is None:
+                inserted.append((text, next_id))
+                row[0] = next_id
+                next_id += 1
+            elif position != old_position:
+                moved.append((position, content_id))
+            row[1] = position
+
+        c.executemany('DELETE FROM content WHERE id = ? AND parent_id = ?',
+                      deleted)
+        if deleted and c.rowcount != len(deleted):
             raise IntegrityError('Row DNE')
-
-        return row[0] == paragraph_id
-
-    @needs_page_id
-    def delete_paragraph(self, c, paragraph_id):
-        is_front = self._check_is_front(c, paragraph_id)
-        if is_front:
-            # front = current.next
-            c.execute("""
-            UPDATE toc SET first_content_id = (
-                SELECT next_id FROM content WHERE id = ?
-            ) WHERE id = ?
-            """, (paragraph_id, self.page_id))
-        else:
-            # prev.next = current.next
-            c.execute("""
-            UPDATE content SET next_id = (
-                SELECT next_id FROM content WHERE id = ?
-            ) WHERE next_id = ?
-            """, (paragraph_id, paragraph_id))
-        # delete current
-        c.execute('DELETE FROM content WHERE id = ?', (paragraph_id,))
-
-    @needs_page_id
-    def insert_paragraph(self, c, after_content_id, content):
-        if after_content_id == 'front':
-            self._insert_at_front(c, content)
-        elif after_content_id == 'lastinsert':
-            c.execute('SELECT last_insert_rowid()')
-            self._insert(c, c.fetchone()[0], content)
-        else:
-            self._insert(c, after_content_id, content)
-
-    def _insert_at_front(self, c, content):
-        c.execute("""
-        INSERT INTO content (parent_id, next_id, content) VALUES
-        (:pid,
-         (SELECT first_content_id FROM toc where id = :pid),
-         :content)
-        """, {'pid': self.page_id, 'content': content})
-
-        c.execute("""
-        UPDATE toc SET first_content_id = last_insert_rowid()
-        WHERE id = ?
-        """, (self.page_id,))
-
-    def _insert(self, c, after_content_id, content):
-        # check if id exists
-        c.execute('SELECT parent_id, next_id FROM content WHERE id = ?',
-                  (after_content_id,))
-        row = c.fetchone()
-        if not row:
-            raise IntegrityError('after_content_id not found')
-
-        c.execute("""
-        INSERT INTO content (parent_id, next_id, content) VALUES
-        (?, ?, ?)
-        """, (row[0], row[1], content))
-
-        c.execute("""
-        UPDATE content SET next_id = last_insert_rowid()
-        WHERE id = ?
-        """, (after_content_id,))
+        c.executemany('UPDATE content SET position = ? WHERE id = ?', moved)
+        c.executemany("""
+        INSERT INTO content (id, parent_id, position, content)
+        VALUES (?, ?, ?, ?)
+        """, ((content_id, self.page_id, position, text)
+              for content_id, position, text in order if text is not None))
+        programs = DbBytecode.write_programs(
+            c, ((content_id, text) for text, content_id in inserted)
+        )
+        for text, content_id in inserted:
+            if content_id in programs:
+                self.programs.put(content_id, programs[content_id], text)
+        return inserted
 
 def handle_get(app_config):
     slug = request.args.get(':')
@@ -199,6 +237,10 @@ def handle_get(app_config):
         content_id = int(request.args.get('id', ''))
     except ValueError:
         content_id = None
+    try:
+        error_line = int(request.args.get('line', ''))
+    except ValueError:
+        error_line = None
 
     with EditPageDbReader(app_config['db_uri']) as db:
         page_info = db.get_page_info(slug)
@@ -213,6 +255,7 @@ def handle_get(app_config):
                            path=path,
                            unlisted=page_info.unlisted,
                            focus=content_id,
+                           error_line=error_line,
                            content_pair_iter=page_info.content_pair_iter(),
                            content_lock=page_info.content_lock)
 
@@ -221,8 +264,17 @@ def handle_post(app_config):
     if request.form.get('button') != 'submit':
         return 'You are not submitting'
 
+    new_slug = request.form.get('new_slug', '').strip()
+    parser = new_parser(new_slug, app_config['parser'],
+                        app_config['tokenizer'])
     with EditPageDbWriter(app_config['db_uri']) as db:
-        db.handle_change(request.form)
-
+        error = db.handle_change(request.form, parser)
+
+    if error is not None:
+        # the page is saved, but the paragraph needs fixing
+        content_id, line = error
+        return redirect('{}{}&id={}&line={}'.format(
+            url_for('edit'), slug_to_link(new_slug), content_id, line
+        ))
     return redirect('{}{}'.format(url_for('view'),
                                   slug_to_link(request.form['new_slug'])))
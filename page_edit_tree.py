@@ -1,18 +1,181 @@
+"""Moving and deleting whole branches of the page tree. Every operation is
+one statement per table over toc_closure, however big the branch is: the
+closure triggers in schema.sql move the descendants along with the page."""
+
+from flask import request, redirect, url_for
+from sqlite3 import IntegrityError
+from sqlops import Db, PageNotFoundError, slug_to_link
+from page_edit import POSITION_GAP
+from title_index import get_title_index
+import time
+
+# not a valid slug, so it cannot be linked to or taken by a page
 TRASH = '.trash'
 
+last_position_query = """
+SELECT coalesce(max(position), 0) + ? FROM toc WHERE parent_id IS ?
+"""
+
 class DbEditTree(Db):
-    def create_trash_if_dne(self):
-        raise DatabaseError("Not yet implemented")
+    @staticmethod
+    def create_trash_if_dne(c):
+        """Returns the id of the page that holds the trash"""
+        c.execute('SELECT id FROM toc WHERE slug = ?', (TRASH,))
+        row = c.fetchone()
+        if row:
+            return row[0]
+        c.execute(last_position_query, (POSITION_GAP, None))
+        c.execute("""
+        INSERT INTO toc (slug, title, unlisted, position)
+        VALUES (?, 'Trash', 1, ?)
+        """, (TRASH, c.fetchone()[0]))
+        return c.lastrowid
+
+    @staticmethod
+    def _page_row(c, slug):
+        if slug == TRASH:
+            raise IntegrityError('The trash cannot be moved')
+        page_id = Db.check_page_id(c, slug)
+        c.execute('SELECT id, parent_id, position FROM toc WHERE id = ?',
+                  (page_id,))
+        return c.fetchone()
+
+    @staticmethod
+    def _in_trash(c, page_id):
+        c.execute("""
+        SELECT 1 FROM toc_closure
+        WHERE ancestor = (SELECT id FROM toc WHERE slug = ?)
+        AND descendant = ?
+        """, (TRASH, page_id))
+        return c.fetchone() is not None
+
+    @staticmethod
+    def _move(c, page_id, parent_id, position=None):
+        if position is None:
+            c.execute(last_position_query, (POSITION_GAP, parent_id))
+            position = c.fetchone()[0]
+        c.execute('UPDATE toc SET parent_id = ?, position = ? WHERE id = ?',
+                  (parent_id, position, page_id))
 
-    def delete_page(self, c, slug):
-        # TODO: recursively delete branches in the tree
-        raise DatabaseError("Not yet implemented")
+    @staticmethod
+    def _delete_subtree(c, page_id, min_depth=0):
+        """Deletes the page (or only its descendants, with min_depth=1) and
+        everything below it. Returns the number of pages deleted."""
+        subtree = """
+        SELECT descendant FROM toc_closure WHERE ancestor = ? AND depth >= ?
+        """
+        c.execute('DELETE FROM content WHERE parent_id IN (%s)' % subtree,
+                  (page_id, min_depth))
+        # most of the closure rows in one go, leaving the ones that say what
+        # the subtree is; toc_closure_delete takes care of the rest
+        c.execute("""
+        DELETE FROM toc_closure WHERE descendant IN (%s) AND ancestor != ?
+        """ % subtree, (page_id, min_depth, page_id))
+        c.execute('DELETE FROM toc WHERE id IN (%s)' % subtree,
+                  (page_id, min_depth))
+        return c.rowcount
 
-        row = Db._fetch_page_row(c, slug)
-        c.execute('DELETE FROM toc WHERE id = ?',
-                    (row['id'],))
-        c.execute('DELETE FROM content WHERE parent_id = ?',
-                    (row['first_content_id'],))
+    def move_page(self, slug, parent_slug=None):
+        """Moves the page and its descendants to the end of the children of
+        `parent_slug`, or to the top level"""
+        with self.write_transaction() as c:
+            row = DbEditTree._page_row(c, slug)
+            parent_id = None
+            if parent_slug:
+                parent_id = Db.check_page_id(c, parent_slug)
+                if DbEditTree._in_trash(c, parent_id):
+                    raise IntegrityError('Cannot move pages into the trash')
+            # toc_closure_cycle refuses to move a page under itself
+            DbEditTree._move(c, row['id'], parent_id)
+            c.execute('DELETE FROM trash WHERE page_id = ?', (row['id'],))
+        self._changed()
 
     def recycle_page(self, slug):
-        raise DatabaseError("Not yet implemented")
+        """Moves the page and its descendants to the trash"""
+        with self.write_transaction() as c:
+            row = DbEditTree._page_row(c, slug)
+            if DbEditTree._in_trash(c, row['id']):
+                raise IntegrityError('The page is already in the trash')
+            trash_id = DbEditTree.create_trash_if_dne(c)
+            c.execute("""
+            INSERT INTO trash (page_id, parent_id, position, mtime)
+            VALUES (?, ?, ?, ?)
+            """, (row['id'], row['parent_id'], row['position'],
+                  int(time.time())))
+            DbEditTree._move(c, row['id'], trash_id)
+        self._changed()
+
+    def restore_page(self, slug):
+        """Puts a page from the trash back where it was. It goes to the top
+        level if its old parent is gone or in the trash too."""
+        with self.write_transaction() as c:
+            row = DbEditTree._page_row(c, slug)
+            c.execute("""
+            SELECT trash.parent_id, trash.position, toc.id FROM trash
+            LEFT JOIN toc ON toc.id = trash.parent_id
+            WHERE trash.page_id = ?
+            """, (row['id'],))
+            trashed = c.fetchone()
+            if trashed is None:
+                raise IntegrityError('The page is not in the trash')
+            parent_id, position, parent_exists = trashed
+            if parent_id is not None and (
+                    parent_exists is None or
+                    DbEditTree._in_trash(c, parent_id)):
+                parent_id, position = None, None
+            c.execute('DELETE FROM trash WHERE page_id = ?', (row['id'],))
+            DbEditTree._move(c, row['id'], parent_id, position)
+        self._changed()
+
+    def delete_page(self, slug):
+        """Deletes the page and its descendants for good.
+        Returns the number of pages deleted."""
+        with self.write_transaction() as c:
+            row = DbEditTree._page_row(c, slug)
+            count = DbEditTree._delete_subtree(c, row['id'])
+        self._changed()
+        return count
+
+    def empty_trash(self):
+        with self.write_transaction() as c:
+            c.execute('SELECT id FROM toc WHERE slug = ?', (TRASH,))
+            row = c.fetchone()
+            if row is None:
+                return 0
+            count = DbEditTree._delete_subtree(c, row[0], min_depth=1)
+        self._changed()
+        return count
+
+    def _changed(self):
+        # after the commit: the title index cannot tell these writes from
+        # somebody else's
+        get_title_index(self.address).invalidate()
+
+def handle_post(app_config):
+    try:
+        return change_tree(app_config)
+    except PageNotFoundError as e:
+        return 'No such page: %s' % e, 400
+    except IntegrityError as e:
+        return str(e), 400
+
+def change_tree(app_config):
+    action = request.form.get('action')
+    slug = request.form.get(':', '')
+    with DbEditTree(app_config['db_uri']) as db:
+        if action == 'move':
+            db.move_page(slug, request.form.get('parent_slug', '').strip())
+        elif action == 'trash':
+            db.recycle_page(slug)
+            return redirect(url_for('view'))
+        elif action == 'restore':
+            db.restore_page(slug)
+        elif action == 'delete':
+            db.delete_page(slug)
+            return redirect(url_for('view'))
+        elif action == 'empty_trash':
+            db.empty_trash()
+            return redirect(url_for('view'))
+        else:
+            return 'Unknown action', 400
+    return redirect('{}{}'.format(url_for('view'), slug_to_link(slug)))
@@ -0,0 +1,189 @@
+from flask import request, render_template, url_for
+from urllib.parse import urlencode
+from parsing import new_parser
+from fragments import parse_fragments, compile_fragments
+from page_view import DbTitle, utc_to_local_with_title
+from sqlops import Db, slug_to_link
+from hashlib import sha1
+import json
+
+# a full copy of the page at least every SNAPSHOT_EVERY revisions, so that
+# loading a revision replays fewer than SNAPSHOT_EVERY deltas
+SNAPSHOT_EVERY = 16
+PAGE_SIZE = 50
+
+def encode_delta(patch):
+    """Turns a diff.print_diff patch into a list of operations:
+    n > 0 keeps n paragraphs, n < 0 drops -n paragraphs, and a string is a
+    new paragraph. The unchanged paragraphs at the end are left out."""
+    delta = []
+    for action, operand in patch:
+        if action == '+':
+            delta.append(operand)
+            continue
+        step = -1 if action == '-' else 1
+        if delta and isinstance(delta[-1], int) and \
+           (delta[-1] > 0) == (step > 0):
+            delta[-1] += step
+        else:
+            delta.append(step)
+    if delta and isinstance(delta[-1], int) and delta[-1] > 0:
+        delta.pop()
+    return delta
+
+def paragraphs_hash(paragraphs):
+    return sha1(json.dumps(paragraphs).encode('utf-8')).hexdigest()
+
+def apply_delta(paragraphs, delta):
+    result = []
+    i = 0
+    for op in delta:
+        if isinstance(op, str):
+            result.append(op)
+        elif op > 0:
+            result.extend(paragraphs[i:i + op])
+            i += op
+        else:
+            i -= op
+    result.extend(paragraphs[i:])
+    return result
+
+class DbHistory(DbTitle):
+    @staticmethod
+    def _insert(c, page_id, number, snapshot, data, digest):
+        c.execute("""
+        INSERT INTO revision (page_id, number, mtime, slug, title, snapshot,
+                              data, hash)
+        SELECT id, ?, mtime, slug, title, ?, ?, ? FROM toc WHERE id = ?
+        """, (number, int(snapshot), json.dumps(data), digest, page_id))
+
+    @staticmethod
+    def begin_revision(c, page_id, paragraphs):
+        """Call before saving, with the paragraphs as they are now. Records
+        them as a snapshot if the newest revision is not the same, e.g. for
+        pages that have no history yet, or that were changed without the
+        editor."""
+        paragraphs = list(paragraphs)
+        digest = paragraphs_hash(paragraphs)
+        c.execute("""
+        SELECT number, hash FROM revision WHERE page_id = ?
+        ORDER BY number DESC LIMIT 1
+        """, (page_id,))
+        row = c.fetchone()
+        if row is None or row[1] != digest:
+            number = row[0] + 1 if row else 1
+            DbHistory._insert(c, page_id, number, True, paragraphs, digest)
+
+    @staticmethod
+    def write_revision(c, page_id, patch):
+        """Records a save, after toc and content have been written.
+        patch: the diff from the paragraphs given to begin_revision."""
+        c.execute("""
+        SELECT number, snapshot FROM revision WHERE page_id = ?
+        ORDER BY number DESC LIMIT ?
+        """, (page_id, SNAPSHOT_EVERY))
+        rows = c.fetchall()
+        number = rows[0][0] + 1 if rows else 1
+        chain = next((i for i, row in enumerate(rows) if row[1]), None)
+        delta = encode_delta(patch)
+        new = [operand for action, operand in patch if action != '-']
+        digest = paragraphs_hash(new)
+        if chain is None or chain + 1 >= SNAPSHOT_EVERY or \
+           len(json.dumps(delta)) >= len(json.dumps(new)):
+            DbHistory._insert(c, page_id, number, True, new, digest)
+        else:
+            DbHistory._insert(c, page_id, number, False, delta, digest)
+        return number
+
+    def list_revisions(self, slug, before=None, limit=PAGE_SIZE):
+        """Newest first; `before` is the revision number to continue from"""
+        with self.auto_rollback() as c:
+            page_id = Db.check_page_id(c, slug)
+            if before is None:
+                condition, params = '', (page_id, limit)
+            else:
+                condition, params = 'AND number < ?', (page_id, before, limit)
+            c.execute("""
+            SELECT number, mtime, slug, title FROM revision
+            WHERE page_id = ? {}
+            ORDER BY number DESC LIMIT ?
+            """.format(condition), params)
+            return c.fetchall()
+
+    def load_revision(self, slug, number):
+        """Returns the revision row and its paragraphs, or None"""
+        with self.auto_rollback() as c:
+            page_id = Db.check_page_id(c, slug)
+            c.execute("""
+            SELECT number, mtime, slug, title, snapshot, data FROM revision
+            WHERE page_id = ? AND number <= ? AND number >= (
+                SELECT max(number) FROM revision
+                WHERE page_id = ? AND number <= ? AND snapshot = 1
+            )
+            ORDER BY number
+            """, (page_id, number, page_id, number))
+            rows = c.fetchall()
+        if not rows or rows[-1]['number'] != number:
+            return None
+        paragraphs = []
+        for row in rows:
+            data = json.loads(row['data'])
+            paragraphs = data if row['snapshot'] else \
+                apply_delta(paragraphs, data)
+        return rows[-1], paragraphs
+
+def parse_number(string):
+    try:
+        return int(string)
+    except ValueError:
+        return None
+
+def handle_list(app_config):
+    slug = request.args.get(':', '')
+    before = parse_number(request.args.get('before', ''))
+    with DbHistory(app_config['db_uri'],
+                   bool(app_config['read_only_view'])) as db:
+        revisions = db.list_revisions(slug, before, PAGE_SIZE + 1)
+
+    next_link = None
+    if len(revisions) > PAGE_SIZE:
+        revisions.pop()
+        next_link = '{}?{}'.format(url_for('history'), urlencode({
+            ':': slug, 'before': revisions[-1]['number']
+        }))
+    revisions = [(row['number'], row['title'],
+                  row['mtime'] and utc_to_local_with_title(row['mtime']))
+                 for row in revisions]
+    return render_template('history.html',
+                           title='History of %s' % slug,
+                           slug=slug,
+                           revisions=revisions,
+                           view=url_for('view') + slug_to_link(slug),
+                           revision=url_for('revision'),
+                           next_link=next_link)
+
+def handle_view(app_config):
+    slug = request.args.get(':', '')
+    number = parse_number(request.args.get('n', ''))
+    with DbHistory(app_config['db_uri'],
+                   bool(app_config['read_only_view'])) as db:
+        result = db.load_revision(slug, number)
+        if result is None:
+            return 'No such revision', 404
+        row, paragraphs = result
+        # the paragraph numbers stand in for content ids
+        parser = new_parser(slug, app_config['parser'],
+                            app_config['tokenizer'])
+        fragments, parser_acc = parse_fragments(
+            parser, [(text, i) for i, text in enumerate(paragraphs)]
+        )
+        db.put_titles_in(parser_acc)
+    compile_fragments(fragments, parser_acc)
+    return render_template('revision.html',
+                           title='%s (revision %d)' % (row['title'], number),
+                           article_title=row['title'],
+                           number=number,
+                           mtime_str=row['mtime'] and
+                           utc_to_local_with_title(row['mtime']),
+                           history=url_for('history') + slug_to_link(slug),
+                           notes_html_list=[f.html for f in fragments])
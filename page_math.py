@@ -0,0 +1,105 @@
+from flask import request, jsonify, url_for
+from parsing import ParserAcc, compile_paragraph
+from sqlops import Db, slug_to_link
+import re
+
+MAX_RESULTS = 200
+
+tex_token = re.compile(r'\\[a-zA-Z]+|\\.|\s+|.', re.DOTALL)
+
+def normalize_tex(tex):
+    """Drops the whitespace that TeX ignores, so that `\\Z [i]` and `\\Z[i]`
+    are the same. A space after a control word is kept if a letter follows,
+    because `\\alpha x` is not `\\alphax`. (Spaces in \\text{} are dropped
+    too; that's fine for looking things up.)"""
+    result = []
+    pending_space = False
+    for token in tex_token.findall(tex):
+        if token.isspace():
+            pending_space = True
+            continue
+        if pending_space and result and result[-1][0] == '\\' and \
+           result[-1][1:].isalpha() and token[0].isalpha():
+            result.append(' ')
+        pending_space = False
+        result.append(token)
+    return ''.join(result)
+
+def prefix_upper_bound(prefix):
+    # every string that starts with `prefix` sorts below this one
+    return prefix + '\U0010ffff'
+
+class DbMath(Db):
+    @staticmethod
+    def write_math(c, page_id, fragments):
+        """Old entries of the fragments go away with their content rows"""
+        c.executemany("""
+        INSERT OR IGNORE INTO math (tex, content_id, display, page_id)
+        VALUES (?, ?, ?, ?)
+        """, ((normalize_tex(tex), f.content_id, int(display), page_id)
+              for f in fragments if f.math
+              for tex, display in f.math))
+
+    def lookup(self, tex, prefix=False, limit=MAX_RESULTS):
+        tex = normalize_tex(tex)
+        if prefix:
+            condition = 'math.tex >= ? AND math.tex < ?'
+            params = (tex, prefix_upper_bound(tex), limit)
+        else:
+            condition = 'math.tex = ?'
+            params = (tex, limit)
+        with self.auto_rollback() as c:
+            c.execute("""
+            SELECT math.tex, math.display, math.content_id,
+            toc.slug, toc.title FROM math
+            INNER JOIN toc ON toc.id = math.page_id
+            WHERE {}
+            ORDER BY math.tex, math.content_id LIMIT ?
+            """.format(condition), params)
+            return c.fetchall()
+
+    def rebuild_math(self, new_parser):
+        """Compiles every paragraph in the notebook again. Needs a request
+        context for url_for. new_parser: slug -> Parser"""
+        parsers = {}
+        entries = []
+        with self.auto_rollback() as c:
+            c.execute("""
+            SELECT content.id, content.parent_id, content.content, toc.slug
+            FROM content INNER JOIN toc ON toc.id = content.parent_id
+            """)
+            for content_id, page_id, text, slug in c.fetchall():
+                parser = parsers.get(slug)
+                if parser is None:
+                    parser = parsers[slug] = new_parser(slug)
+                parser.acc = ParserAcc()
+                ast = parser.parse_string(text, content_id)
+                for tex, display in compile_paragraph(ast, parser.acc).math:
+                    entries.append((normalize_tex(tex), content_id,
+                                    int(display), page_id))
+
+            c.execute('DELETE FROM math')
+            c.executemany("""
+            INSERT OR IGNORE INTO math (tex, content_id, display, page_id)
+            VALUES (?, ?, ?, ?)
+            """, entries)
+        return len(entries)
+
+def handle(app_config):
+    tex = request.args.get('tex', '')
+    prefix = request.args.get('prefix', '') == '1'
+    if not tex.strip():
+        return jsonify(error='Needs ?tex='), 400
+
+    with DbMath(app_config['db_uri']) as db:
+        rows = db.lookup(tex, prefix)
+
+    view = url_for('view')
+    return jsonify(results=[{
+        'tex': row['tex'],
+        'display': bool(row['display']),
+        'content_id': row['content_id'],
+        'title': row['title'],
+        'link': '{}{}&id={}'.format(view, slug_to_link(row['slug']),
+                                    row['content_id'])
+    } for row in rows])
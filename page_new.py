@@ -1,11 +1,157 @@
-from flask import render_template
-from sqlops import Db
+from flask import request, render_template, redirect, url_for, jsonify
+from sqlops import Db, is_valid_slug, slug_to_link
+from page_edit import POSITION_GAP, render_paragraphs
+from page_history import DbHistory
+from programs import DbBytecode, Programs
+from parsing import new_parser
+from title_index import get_title_index
+import json
+import time
+
+def check_item(item):
+    """Returns the (parent_slug, slug, title, paragraphs) of a page to
+    create, or raises ValueError"""
+    if not isinstance(item, dict):
+        raise ValueError('Not an object')
+    slug = item.get('slug')
+    if not isinstance(slug, str) or not is_valid_slug(slug):
+        raise ValueError('Invalid slug')
+    parent_slug = item.get('parent_slug') or None
+    if parent_slug is not None and (not isinstance(parent_slug, str) or
+                                    not is_valid_slug(parent_slug)):
+        raise ValueError('Invalid parent slug')
+    title = item.get('title')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError('You need a title')
+    paragraphs = item.get('paragraphs', [])
+    if not isinstance(paragraphs, list) or \
+       not all(isinstance(text, str) for text in paragraphs):
+        raise ValueError('The paragraphs must be a list of strings')
+    paragraphs = [text for text in map(str.strip, paragraphs) if text]
+    return parent_slug, slug, title.strip(), paragraphs
 
 class DbCreate(Db):
-    pass
+    def create_pages(self, items, engine=None, tokenizer=None):
+        """Creates the pages in one transaction. A page goes after the
+        children that its parent already has, and its parent can be a page
+        that comes before it in `items`. The paragraphs are rendered as the
+        editor does when saving. Returns one (page_id, error) pair for each
+        item; the items with errors are left out."""
+        results = []
+        pages = []
+        for item in items:
+            try:
+                pages.append(check_item(item))
+                results.append([None, None])
+            except ValueError as e:
+                pages.append(None)
+                results.append([None, str(e)])
+
+        slugs = {slug for page in pages if page for slug in page[:2] if slug}
+        with self.write_transaction() as c:
+            c.execute("""
+            SELECT slug, id FROM toc
+            WHERE slug IN (SELECT value FROM json_each(?))
+            """, (json.dumps(sorted(slugs)),))
+            page_ids = dict(c.fetchall())
+            c.execute('SELECT coalesce(max(id), 0) FROM toc')
+            next_id = c.fetchone()[0] + 1
+
+            new_pages = []
+            for page, result in zip(pages, results):
+                if page is None:
+                    continue
+                parent_slug, slug, title, paragraphs = page
+                if slug in page_ids:
+                    result[1] = 'The slug is taken'
+                elif parent_slug is not None and parent_slug not in page_ids:
+                    result[1] = 'No parent page %s' % parent_slug
+                else:
+                    page_ids[slug] = result[0] = next_id
+                    new_pages.append((next_id, page_ids.get(parent_slug),
+                                      slug, title, paragraphs))
+                    next_id += 1
+
+            # the last position under each parent that already has children
+            c.execute("""
+            SELECT parent_id, max(position) FROM toc
+            WHERE parent_id IN (SELECT value FROM json_each(?))
+            OR parent_id IS NULL
+            GROUP BY parent_id
+            """, (json.dumps([p for _, p, _, _, _ in new_pages
+                              if p is not None]),))
+            positions = dict(c.fetchall())
+            rows = []
+            for page_id, parent_id, slug, title, _ in new_pages:
+                positions[parent_id] = positions.get(parent_id, 0) + \
+                    POSITION_GAP
+                rows.append((page_id, parent_id, slug, title,
+                             positions[parent_id]))
+
+            mtime = int(time.time())
+            c.executemany("""
+            INSERT INTO toc (id, parent_id, slug, title, position, mtime)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (row + (mtime,) for row in rows))
+
+            c.execute('SELECT coalesce(max(id), 0) FROM content')
+            last_id = c.fetchone()[0]
+            pairs = {}  # page_id -> [(text, content_id)]
+            for page_id, _, _, _, paragraphs in new_pages:
+                pairs[page_id] = [(text, last_id + i)
+                                  for i, text in enumerate(paragraphs, 1)]
+                last_id += len(paragraphs)
+            c.executemany("""
+            INSERT INTO content (id, parent_id, position, content)
+            VALUES (?, ?, ?, ?)
+            """, ((content_id, page_id, (i + 1) * POSITION_GAP, text)
+                  for page_id, page_pairs in pairs.items()
+                  for i, (text, content_id) in enumerate(page_pairs)))
+
+            compiled = DbBytecode.write_programs(
+                c, ((content_id, text) for page_pairs in pairs.values()
+                    for text, content_id in page_pairs)
+            )
+            programs = Programs()
+            for page_pairs in pairs.values():
+                for text, content_id in page_pairs:
+                    if content_id in compiled:
+                        programs.put(content_id, compiled[content_id], text)
+            for page_id, _, slug, _, paragraphs in new_pages:
+                DbHistory.begin_revision(c, page_id, paragraphs)
+                render_paragraphs(c, page_id,
+                                  new_parser(slug, engine, tokenizer),
+                                  pairs[page_id], programs)
+        get_title_index(self.address).invalidate()
+        return [tuple(result) for result in results]
 
 def handle_get(config):
     return render_template('new.html')
 
 def handle_post(config):
-    return
+    if request.is_json:
+        return handle_batch(config)
+    item = {key: request.form.get(key, '').strip()
+            for key in ('parent_slug', 'slug', 'title')}
+    with DbCreate(config['db_uri']) as db:
+        (_, error), = db.create_pages([item], config['parser'],
+                                      config['tokenizer'])
+    if error is not None:
+        return error, 400
+    return redirect('{}{}'.format(url_for('edit'), slug_to_link(item['slug'])))
+
+def handle_batch(config):
+    """JSON: {"pages": [{"parent_slug", "slug", "title", "paragraphs"}]}"""
+    body = request.get_json(silent=True)
+    items = body.get('pages') if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        return jsonify(error='Needs {"pages": [...]}'), 400
+    with DbCreate(config['db_uri']) as db:
+        results = db.create_pages(items, config['parser'],
+                                  config['tokenizer'])
+    return jsonify(results=[
+        {'slug': item.get('slug') if isinstance(item, dict) else None,
+         'status': 'error' if error else 'created',
+         'id': page_id, 'error': error}
+        for item, (page_id, error) in zip(items, results)
+    ])
@@ -0,0 +1,99 @@
+from flask import request, render_template, escape, url_for, Markup
+from urllib.parse import urlencode
+from sqlops import Db
+
+PAGE_SIZE = 20
+
+# snippet() marks the matches with these, so that the rest can be escaped
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+def to_match_query(string):
+    """Every word must appear. The words are quoted, so that the user does
+    not need to know the FTS5 query syntax."""
+    terms = string.split()
+    return ' '.join('"%s"' % t.replace('"', '""') for t in terms)
+
+def mark(snippet):
+    html = str(escape(snippet))
+    html = html.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return Markup(html)
+
+def parse_cursor(string):
+    """The position after the last result of the previous page"""
+    try:
+        rank, content_id = string.split(',')
+        return float(rank), int(content_id)
+    except ValueError:
+        return None
+
+class SearchResult(object):
+    __slots__ = ('content_id', 'rank', 'slug', 'title', 'snippet')
+
+    def __init__(self, content_id, rank):
+        self.content_id = content_id
+        self.rank = rank
+        self.slug = None
+        self.title = None
+        self.snippet = None
+
+class DbSearch(Db):
+    def search(self, string, after=None, limit=PAGE_SIZE):
+        """Best matches first. Pass the (rank, content_id) of the last
+        result as `after` to get the next page."""
+        query = to_match_query(string)
+        if not query:
+            return []
+        if after is None:
+            after = (float('-inf'), 0)
+        with self.auto_rollback() as c:
+            c.execute("""
+            SELECT rowid, rank FROM search WHERE search MATCH :query
+            AND (rank > :rank OR (rank = :rank AND rowid > :id))
+            ORDER BY rank, rowid LIMIT :limit
+            """, {'query': query, 'rank': after[0], 'id': after[1],
+                  'limit': limit})
+            results = [SearchResult(row[0], row[1]) for row in c]
+            if results:
+                self._load_snippets(c, query, results)
+            return results
+
+    @staticmethod
+    def _load_snippets(c, query, results):
+        # only for this page, because snippet() is much slower than rank
+        by_id = {r.content_id: r for r in results}
+        c.execute("""
+        SELECT search.rowid, toc.slug,
+        highlight(search, 0, ?, ?), snippet(search, 1, ?, ?, '...', 16)
+        FROM search
+        INNER JOIN content ON content.id = search.rowid
+        INNER JOIN toc ON toc.id = content.parent_id
+        WHERE search MATCH ? AND search.rowid IN ({})
+        """.format(','.join('?' * len(by_id))),
+                  (MARK_START, MARK_END, MARK_START, MARK_END, query,
+                   *by_id))
+        for row in c:
+            result = by_id[row[0]]
+            result.slug = row[1]
+            result.title = mark(row[2])
+            result.snippet = mark(row[3])
+
+def handle(app_config):
+    string = request.args.get('q', '')
+    after = parse_cursor(request.args.get('after', ''))
+    with DbSearch(app_config['db_uri']) as db:
+        results = db.search(string, after, PAGE_SIZE + 1)
+
+    next_link = None
+    if len(results) > PAGE_SIZE:
+        results.pop()
+        last = results[-1]
+        next_link = '{}?{}'.format(url_for('search'), urlencode({
+            'q': string, 'after': '%r,%d' % (last.rank, last.content_id)
+        }))
+    return render_template('search.html',
+                           title='Search',
+                           query=string,
+                           results=results,
+                           view=url_for('view'),
+                           next_link=next_link)
@@ -1,13 +1,19 @@
 from flask import request, render_template, escape, Response, url_for
-from parsing import compile_notes, Parser
-from sidebar import compile_tree
+from flask import current_app, stream_with_context
+from parsing import new_parser, ParserAcc, PDAParser
+from fragments import DbFragment, parse_fragments, compile_fragments
+from programs import DbBytecode
+from title_index import get_title_index
+from toc_cache import get_toc_cache
+from backlinks import DbLinks
+from render_pool import RenderPool
+from sidebar import compile_tree_cached
 from pathlib import Path
-from sqlops import Db, is_valid_slug, slug_to_link, QueryBuilder, Tree, Content
+from sqlops import Db, is_valid_slug, slug_to_link, Tree, Content
+from sqlops import PageNotFoundError
 from collections import deque
 from datetime import datetime, timezone
 
-tree_query_cte = str(QueryBuilder().forward().backward().upward().downward())
-
 def row_to_link_tuple(row):
     if not row:
         return None
@@ -28,8 +34,10 @@ class PageInfo(Content):
         super().__init__()
         self.acc = {}
         self.page_id = page_id
+        self.toc_snapshot = None
 
         self.content_lock = None
+        self.mtime = None
         self.tree = None
         self.path = None
         self.title = None
@@ -38,12 +46,11 @@ class PageInfo(Content):
         self.next = None
         self.unlisted = False
 
-    def load_tree_row(self, row):
-        if row['next_id'] == self.page_id:
-            self.prev = row_to_link_tuple(row)
-        if row['id'] == self.page_id:
-            self.content_lock = row['content_lock']
+    def load_page_row(self, row):
+        self.content_lock = row['content_lock']
+        self.mtime = row['mtime']
 
+    def load_tree_row(self, row):
         self.acc[row['id']] = row
 
     def reverse_path_iter(self):
@@ -67,61 +74,150 @@ class PageInfo(Content):
 
     def compute(self):
         current_row = self.acc[self.page_id]
-        self.next = row_to_link_tuple(self.acc.get(current_row['next_id']))
+        tree = Tree(self.acc, self.page_id)
+        prev_row, next_row = tree.neighbours()
+        self.prev = row_to_link_tuple(prev_row)
+        self.next = row_to_link_tuple(next_row)
         self.title = current_row['title']
         self.unlisted = current_row['unlisted'] == 1
 
-        if current_row['mtime'] is not None:
-            self.mtime_str = utc_to_local_with_title(current_row['mtime'])
+        if self.mtime is not None:
+            self.mtime_str = utc_to_local_with_title(self.mtime)
 
-        self.tree = Tree(self.acc, self.page_id).into()
+        self.tree = tree.into()
         self.path = self.compute_path()
-        id_start = self.acc[self.page_id]['first_content_id']
-        self.register_content_id(id_start)
 
 class DbTree(Db):
     @staticmethod
     def _load_content(c, page_id, page_info):
         c.execute("""
-        SELECT id, next_id, content FROM content WHERE parent_id = ?
+        SELECT id, position, content FROM content
+        WHERE parent_id = ? AND position IS NOT NULL
+        ORDER BY position
         """, (page_id,))
-        for row in c.fetchall():
+        for row in c:
             page_info.load_content_row(row)
 
-    def get_page_info(self, slug):
+    def get_page_info(self, slug, with_content=True):
         result = None
         with self.auto_rollback() as c:
-            page_id = Db.check_page_id(c, slug)
-            result = PageInfo(page_id)
-            self.populate_page_info(c, page_id, result)
+            c.execute('SELECT id, mtime, content_lock FROM toc WHERE slug = ?',
+                      (slug,))
+            row = c.fetchone()
+            if not row:
+                raise PageNotFoundError(slug)
+            result = PageInfo(row['id'])
+            result.load_page_row(row)
+            self.populate_page_info(c, row['id'], result, with_content)
         result.compute()
         return result
 
-    def get_tree_cte(self):
-        return tree_query_cte
+    def get_tree_rows(self, toc_snapshot, page_id):
+        return toc_snapshot.tree_rows(page_id)
 
-    def populate_page_info(self, c, page_id, page_info):
+    def populate_page_info(self, c, page_id, page_info, with_content=True):
         """Get all page content, and part of the tree"""
-        # adjacent articles
-        c.execute(self.get_tree_cte(), {'id': page_id})
-        # convert rows into dict
-        for row in c.fetchall():
+        # adjacent articles, from memory unless toc has changed
+        toc_cache = get_toc_cache(self.address)
+        toc_cache.refresh(c)
+        page_info.toc_snapshot = toc_cache.snapshot
+        for row in self.get_tree_rows(page_info.toc_snapshot, page_id):
             page_info.load_tree_row(row)
         # load content
-        DbTree._load_content(c, page_id, page_info)
+        if with_content:
+            DbTree._load_content(c, page_id, page_info)
 
 class DbTitle(Db):
     def put_titles_in(self, parser_acc):
         unproc = list(parser_acc.unprocessed_slugs())
         if not unproc:
             return
-        query = 'SELECT slug, title FROM toc WHERE slug in ({})'.format(
-            ','.join(map(lambda _: '?', unproc))
-        )
         with self.auto_rollback() as c:
-            c.execute(query, unproc)
-            for row in c:
-                parser_acc.put_title(row[0], row[1])
+            get_title_index(self.address).put_titles_in(c, unproc,
+                                                        parser_acc)
+
+class DbNotes(DbFragment, DbBytecode, DbTitle):
+    def load_content(self, page_info):
+        with self.auto_rollback() as c:
+            DbTree._load_content(c, page_info.page_id, page_info)
+
+    def render_notes(self, parser, page_id, pairs, batch_size=None,
+                     pool=None):
+        """Yields the HTML of each paragraph, in order.
+        Paragraphs that are not in the fragment store are compiled in batches
+        of `batch_size`, or all at once (with one title lookup) if None.
+        Large batches are compiled in `pool` if there is one.
+        The PDA engine replays the stored bytecode of the paragraphs."""
+        html_map = self.load_fragments(page_id, pairs)
+        programs = None
+        if isinstance(parser, PDAParser) and len(html_map) < len(pairs):
+            programs = self.load_programs(page_id)
+        parser_acc = ParserAcc()
+        compiled = []
+        order = []
+        misses = []
+        for string, content_id in pairs:
+            order.append(content_id)
+            if content_id not in html_map:
+                misses.append((string, content_id))
+            if batch_size and (not misses or len(misses) >= batch_size):
+                compiled += self._compile_misses(parser, misses, parser_acc,
+                                                 html_map, pool, programs)
+                yield from (html_map[i] for i in order)
+                order = []
+                misses = []
+        # whatever is left
+        compiled += self._compile_misses(parser, misses, parser_acc,
+                                         html_map, pool, programs)
+        yield from (html_map[i] for i in order)
+        self.store_fragments(compiled, parser_acc)
+        if programs is not None:
+            self.store_programs(programs)
+
+    def _compile_misses(self, parser, misses, parser_acc, html_map, pool,
+                        programs=None):
+        if not misses:
+            return []
+        parallel = pool is not None and pool.wants(misses)
+        if parallel:
+            fragments, acc = pool.parse_fragments(parser.slug, misses)
+        else:
+            fragments, acc = parse_fragments(parser, misses, programs)
+        # titles are looked up once for all paragraphs
+        parser_acc.update(acc)
+        self.put_titles_in(parser_acc)
+        if parallel:
+            pool.compile_fragments(fragments, parser_acc)
+        else:
+            compile_fragments(fragments, parser_acc)
+        for fragment in fragments:
+            html_map[fragment.content_id] = fragment.html
+        return fragments
+
+class DbPage(DbTree, DbLinks):
+    pass
+
+def render_notes(app_config, slug, page_info, streaming=False):
+    parser = new_parser(slug, app_config['parser'], app_config['tokenizer'])
+    pool = RenderPool(app_config['render_workers'],
+                      app_config['render_pool_threshold'],
+                      app_config['parser'], app_config['tokenizer'])
+    with DbNotes(app_config['db_uri'],
+                 bool(app_config['read_only_view'])) as db:
+        if streaming:
+            # the content is not loaded with the page, so that the header
+            # does not wait for it
+            db.load_content(page_info)
+        pairs = list(page_info.content_pair_iter())
+        yield from db.render_notes(parser, page_info.page_id, pairs,
+                                   batch_size=(1 if streaming else None),
+                                   pool=pool)
+
+def stream_template(template_name, **context):
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.stream(context)))
 
 def handle(app_config):
     slug = request.args.get(':')
@@ -130,29 +226,35 @@ def handle(app_config):
     if not is_valid_slug(slug):
         return 'Invalid page ID'
 
-    with DbTree(app_config['db_uri']) as db:
-        page_info = db.get_page_info(slug)
+    streaming = bool(app_config['stream_view'])
+    with DbPage(app_config['db_uri'],
+                bool(app_config['read_only_view'])) as db:
+        page_info = db.get_page_info(slug, with_content=not streaming)
+        backlinks = db.get_backlinks(page_info.page_id, slug)
 
-    tree_html = compile_tree(page_info.tree)
-    parser = Parser(slug)
-    ast_list = [parser.parse_string(string, content_id)
-                for string, content_id in page_info.content_pair_iter()]
-    with DbTitle(app_config['db_uri']) as db:
-        db.put_titles_in(parser.acc)
-    notes_html_list = (compile_notes(cons, parser.acc) for cons in ast_list)
+    tree_html = [compile_tree_cached(page_info.toc_snapshot,
+                                     page_info.page_id, page_info.tree)]
+    notes_html_list = render_notes(app_config, slug, page_info, streaming)
+    if not streaming:
+        notes_html_list = list(notes_html_list)
 
     # use the "directory" part only
     page_info.path.pop()
 
-    return render_template(
-        'view.html',
+    context = dict(
         title=page_info.title,
         nav_edit=url_for('edit') + slug_to_link(slug),
+        nav_history=url_for('history') + slug_to_link(slug),
         unlisted=page_info.unlisted,
         directory_of_page=page_info.path,
         prev_article=page_info.prev,
         next_article=page_info.next,
         mtime_str=page_info.mtime_str,
         sidebar_html=tree_html,
-        notes_html_list=notes_html_list
+        notes_html_list=notes_html_list,
+        backlinks=backlinks
     )
+    if streaming:
+        return stream_template('view.html', **context)
+    else:
+        return render_template('view.html', **context)
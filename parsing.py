@@ -6,8 +6,11 @@ from pyparsing import alphas, nums, quotedString
 from pyparsing import nestedExpr, locatedExpr, ParserElement, ParseResults
 from sqlops import is_valid_slug, slug_to_link
 from itertools import chain
+from collections import deque
 import sys
 import traceback
+import pda
+import tokenizing
 
 # make \n significant
 ParserElement.setDefaultWhitespaceChars(' \t')
@@ -28,6 +31,16 @@ scribble = OneOrMore(text_body | line_break | list_stuff)
 
 lstrip_regex = re.compile('^[ \t\r]+')
 
+# same grammar as `scribble`, as one compiled regex (for the fast tokenizer)
+token_regex = re.compile(r'''
+  (?P<text>[^@\n|{}]+)
+| (?P<bar>\|)
+| (?P<lines>\n+)
+| @[ \t]*(?:(?P<cmd>[a-zA-Z0-9_-]{1,100}))?[ \t]*(?P<opener>\{+|[|{]+)
+| (?P<open>\{+)
+| (?P<close>[}|]+)
+''', re.VERBOSE)
+
 class Cons(object):
     __slots__ = ('data', 'params')
 
@@ -38,6 +51,23 @@ class Cons(object):
     def __repr__(self):
         return 'Cons(%r, %r)' % (self.data, self.params)
 
+class Located(object):
+    """Same interface as the results of pyparsing's `locatedExpr`"""
+    __slots__ = ('locn_start', 'value', 'locn_end')
+
+    def __init__(self, locn_start, value, locn_end):
+        self.locn_start = locn_start
+        self.value = value
+        self.locn_end = locn_end
+
+    def __repr__(self):
+        return 'Located(%r, %r, %r)' % (self.locn_start,
+                                        self.value,
+                                        self.locn_end)
+
+# tokens that are not plain strings
+LOCATED = (ParseResults, Located)
+
 class ParserError(RuntimeError):
     def __init__(self, parser):
         super().__init__()
@@ -78,6 +108,56 @@ def rescan_for_line_breaks(params):
     if linewrap_acc > 0:
         yield ('\n' * linewrap_acc)
 
+def pyparsing_tokenize(string):
+    tokens = scribble.parseString(string.replace('\r', ''))
+    return rescan_for_line_breaks(tokens)
+
+def regex_tokenize(string):
+    """Single-pass replacement of `pyparsing_tokenize`.
+    Matches the `scribble` grammar with one compiled regex, and does the work
+    of `rescan_for_line_breaks` on the fly. Like pyparsing, it stops at the
+    first position where nothing matches, and it expands tabs the same way
+    `parseString` does."""
+    string = string.replace('\r', '').expandtabs()
+    match = token_regex.match
+    end = len(string)
+    pos = 0
+    linewrap_acc = 0
+    if match(string) is None:
+        raise ValueError('Cannot tokenize %r' % string[:20])
+    while pos < end:
+        m = match(string, pos)
+        if m is None:
+            break
+        kind = m.lastgroup
+        if kind == 'text' or kind == 'bar':
+            text = m.group(kind)
+            if not lstrip_regex.fullmatch(text):
+                if linewrap_acc > 0:
+                    yield ('\n' * linewrap_acc)
+                    linewrap_acc = 0
+                yield text
+        elif kind == 'lines':
+            linewrap_acc += m.end() - pos
+        elif kind == 'opener':
+            if linewrap_acc > 0:
+                yield ('\n' * linewrap_acc)
+                linewrap_acc = 0
+            yield '@'
+            if m.start('cmd') >= 0:
+                yield Located(m.start('cmd'), m.group('cmd'), m.end('cmd'))
+            yield Located(m.start('opener'), m.group('opener'), m.end())
+        else:
+            yield Located(pos, m.group(kind), m.end())
+        pos = m.end()
+    if linewrap_acc > 0:
+        yield ('\n' * linewrap_acc)
+
+TOKENIZERS = {
+    'pyparsing': pyparsing_tokenize,
+    'regex': regex_tokenize
+}
+
 class ParserAcc(object):
     __slots__ = ('_slugs', 'slug_title_map')
 
@@ -95,6 +175,13 @@ class ParserAcc(object):
     def get(self, slug, default=None):
         return self.slug_title_map.get(slug, default)
 
+    def slugs(self):
+        return frozenset(self._slugs)
+
+    def update(self, other):
+        self._slugs.update(other._slugs)
+        self.slug_title_map.update(other.slug_title_map)
+
     def unprocessed_slugs(self):
         for slug in self._slugs:
             if slug not in self.slug_title_map:
@@ -142,20 +229,20 @@ class Parser(object):
                  'line_counter',
                  'last_open_bracket',
                  'acc',
-                 'slug')
+                 'slug',
+                 'tokenizer')
 
-    def __init__(self, slug):
+    def __init__(self, slug, tokenizer=None):
         self.unesc_mode = False
         self.bracket_counter = 0
         self.line_counter = 1
         self.last_open_bracket = None
         self.acc = ParserAcc()
         self.slug = slug
+        self.tokenizer = TOKENIZERS[tokenizer or 'pyparsing']
 
     def tokenize(self, string):
-        tokens = scribble.parseString(string.replace('\r', ''))
-        tokens = rescan_for_line_breaks(tokens)
-        return iter(tokens)
+        return iter(self.tokenizer(string))
 
     def parse_string(self, string, pid):
         self.line_counter = 1
@@ -194,7 +281,7 @@ class Parser(object):
                 else:
                     # just strings
                     result.params.append(token)
-            elif isinstance(token, ParseResults):
+            elif isinstance(token, LOCATED):
                 raise TypeError('Unexpected stuff')
             else:
                 raise TypeError()
@@ -213,7 +300,7 @@ class Parser(object):
         # get operator name
         operator_name = None
         mode = None
-        if not isinstance(token, ParseResults):
+        if not isinstance(token, LOCATED):
             raise ValueError('Expecting an operator, or list')
         if token.value in ('{', '|{'):
             # list start "open bracket"
@@ -243,8 +330,8 @@ class Parser(object):
     def handle_list_unesc(self, tokens, result):
         # read everything as string until the first '}|'
         token = next(tokens)
-        while not(isinstance(token, ParseResults) and token.value == '}|'):
-            if isinstance(token, ParseResults):
+        while not(isinstance(token, LOCATED) and token.value == '}|'):
+            if isinstance(token, LOCATED):
                 result.params.append(token.value)
             else:
                 if token.startswith('\n'):
@@ -258,7 +345,7 @@ class Parser(object):
     def handle_list_regular(self, tokens, result):
         # read the contents following (strings or signs of cons start)
         token = next(tokens)
-        while not(isinstance(token, ParseResults) and token.value == '}'):
+        while not(isinstance(token, LOCATED) and token.value == '}'):
             if isinstance(token, str):
                 if token.startswith('\n'):
                     # if \n, increase line counter
@@ -280,6 +367,111 @@ class Parser(object):
         slug, title = extract_slug_and_title(current_node.params)
         self.acc.add_slug(slug)
 
+class ConsVM(pda.VM):
+    """Replays PDA bytecode into the same AST as `Parser`"""
+    def __init__(self, parser):
+        self.parser = parser
+        self.root = Cons('p', [])
+        self.current_node = self.root
+        self.stack = deque()
+        self.linewrap_acc = 0
+
+    def _append(self, item):
+        self.current_node.params.append(item)
+
+    def _flush_lines(self):
+        # like rescan_for_line_breaks, line breaks are emitted right before
+        # the next string, so they can move past the end of a list
+        if self.linewrap_acc == 1:
+            self._append('\n')
+        elif self.linewrap_acc >= 2:
+            self._append('\n\n')
+        self.linewrap_acc = 0
+
+    def open_list(self, line):
+        self._flush_lines()
+        self.parser.line_counter = line
+        node = Cons(None, [])
+        self._append(node)
+        self.stack.append(self.current_node)
+        self.current_node = node
+
+    def close_list(self):
+        self.parser.put_links_in_accumulator(self.current_node)
+        self.current_node = self.stack.pop()
+
+    def add_symbol(self, symbol):
+        if symbol not in HANDLERS:
+            raise ValueError('Unknown operator %s' % symbol)
+        self.current_node.data = symbol
+
+    def add_string(self, string):
+        if not lstrip_regex.fullmatch(string):
+            self._flush_lines()
+            self._append(string)
+
+    def add_lines(self, n):
+        self.parser.line_counter += n
+        self.linewrap_acc += n
+
+    def finish(self):
+        self._flush_lines()
+        return self.root
+
+    vector = (open_list,
+              close_list,
+              add_symbol,
+              add_string,
+              add_lines)
+
+class PDAParser(Parser):
+    """Same interface as `Parser`, backed by `pda.PDA`"""
+    __slots__ = ()
+
+    def parse_string(self, string, pid):
+        self.line_counter = 1
+
+        try:
+            return self.parse_bytecode(self.compile(string))
+        except ParserError as e:
+            return self.exception_to_list(pid, sys.exc_info())
+
+    def parse_cached(self, string, pid, programs):
+        """Same as parse_string, but replays the bytecode in `programs` if
+        there is one. Newly compiled bytecode is put into `programs`."""
+        self.line_counter = 1
+
+        try:
+            asm = programs.get(pid, string)
+            if asm is None:
+                asm = self.compile(string)
+                programs.put(pid, asm, string)
+            return self.parse_bytecode(asm)
+        except ParserError as e:
+            return self.exception_to_list(pid, sys.exc_info())
+
+    def compile(self, string):
+        try:
+            return pda.PDA().compile(tokenizing.tokenize(string))
+        except pda.PDAError as e:
+            self.line_counter = e.line
+            raise ParserError(self) from e
+
+    @convert_error
+    def parse_bytecode(self, asm):
+        vm = ConsVM(self)
+        for instruction in asm:
+            vm.execute(*instruction)
+        return vm.finish()
+
+PARSERS = {
+    'pyparsing': Parser,
+    'pda': PDAParser
+}
+
+def new_parser(slug, engine=None, tokenizer=None):
+    return PARSERS[engine or 'pyparsing'](slug, tokenizer)
+
 # 1st pass: tokenize
 # 2nd pass: convert tokens into Cons (AST)
 # 3rd pass: convert AST into HTML
@@ -290,6 +482,7 @@ class Accumulator:
     def __init__(self, parser_acc):
         self.output = []
         self.footnotes = []
+        self.math = []
         self.parser_acc = parser_acc
 
     def append(self, s):
@@ -310,6 +503,10 @@ def handles(name):
     return decorator
 
 def compile_notes(ast, parser_acc):
+    return compile_paragraph(ast, parser_acc).output
+
+def compile_paragraph(ast, parser_acc):
+    """Same as compile_notes, but returns the Accumulator"""
     acc = Accumulator(parser_acc)
     acc.append('\n<!-- compilation starts -->\n')
     continuation = iter(ast.params)
@@ -327,7 +524,7 @@ def compile_notes(ast, parser_acc):
         # by looping back, we continue processing, with the new `continuation`
 
     acc.append('\n<!-- compilation ends -->\n')
-    return acc.output
+    return acc
 
 def _compile_notes(params, acc, use_p=True):
     if use_p:
@@ -396,6 +593,7 @@ def compile_inline_math(params, acc):
 
 def _compile_math(params, acc, display):
     math = ''.join(params)
+    acc.math.append((math, display))
     escaped_string = escape(math)
     cls = 'tex-display' if display else 'tex-inline'
     dollar_sign = '$$' if display else '$'
@@ -9,6 +9,7 @@ class State(IntEnum):
     CMD_NAME = 1,
     UNEXPECT = 2,
     ACCEPTING = 3,
+    RAW = 4,
 
 class Stack(IntEnum):
     DOLLAR = 0,
@@ -30,10 +31,76 @@ class Bytecode(IntEnum):
 
 from tokenizing import InputTuple, token_iter, ParserError
 
+# bump this when the meaning of the bytecode changes
+BYTECODE_VERSION = 3
+BYTECODE_MAGIC = b'EDN'
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(blob, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = blob[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def encode(asm):
+    """Compact binary form of a program: a header with the version, then
+    one opcode byte per instruction, followed by its operand (if any).
+    Numbers are varints, and strings are length-prefixed UTF-8."""
+    out = bytearray(BYTECODE_MAGIC)
+    out.append(BYTECODE_VERSION)
+    for instruction in asm:
+        opcode = instruction[0]
+        out.append(opcode)
+        if opcode in (Bytecode.OPEN_LIST, Bytecode.ADD_LINES):
+            _write_varint(out, instruction[1])
+        elif opcode in (Bytecode.ADD_SYMBOL, Bytecode.ADD_STRING):
+            data = instruction[1].encode('utf-8')
+            _write_varint(out, len(data))
+            out += data
+    return bytes(out)
+
+def decode(blob):
+    """Returns the program, or None if it was encoded by another version"""
+    header_size = len(BYTECODE_MAGIC) + 1
+    if blob[:header_size] != BYTECODE_MAGIC + bytes([BYTECODE_VERSION]):
+        return None
+    asm = []
+    pos = header_size
+    while pos < len(blob):
+        opcode = Bytecode(blob[pos])
+        pos += 1
+        if opcode in (Bytecode.OPEN_LIST, Bytecode.ADD_LINES):
+            n, pos = _read_varint(blob, pos)
+            asm.append((opcode, n))
+        elif opcode in (Bytecode.ADD_SYMBOL, Bytecode.ADD_STRING):
+            size, pos = _read_varint(blob, pos)
+            asm.append((opcode, blob[pos:pos + size].decode('utf-8')))
+            pos += size
+        else:
+            asm.append((opcode,))
+    return asm
+
 class PDAError(ParserError):
-    pass
+    def __init__(self, line, message):
+        super().__init__(line, message)
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        return 'At line %d: %s' % (self.line, self.message)
 
 class Registry:
+    entering_handlers = {}
     leaving_handlers = {}
     routing_handlers = {}
 
@@ -82,9 +149,7 @@ class BasePDA:
 
         # Call the leaving handler
         if self.state != to_state:
-            handler = Registry.leaving_handlers.get(self.state)
-            if handler is not None:
-                handler(self)
+            self.leaving_handler()
 
         # Switch to another state
         return to_state
@@ -92,7 +157,8 @@ class BasePDA:
     def route(self, to_state, old_stack_top, new_stack_top):
         new_state = self.try_route(to_state, old_stack_top, new_stack_top)
         if new_state is None:
-            raise PDAError('Cannot find a suitable edge to %r' % to_state)
+            raise PDAError(self.line,
+                           'Cannot find a suitable edge to %r' % to_state)
         else:
             return new_state
 
@@ -103,13 +169,13 @@ class BasePDA:
         # select which state to go to (leaving handler will be called)
         self.state = Registry.routing_handlers[self.state](self)
 
-    def execute_asm(self):
-        vm = VM()
+    def execute_asm(self, vm=None):
+        vm = vm or VM()
         for instruction in self.asm:
             vm.execute(*instruction)
         return vm.root
 
-    def run(self, tokens):
+    def consume(self, tokens):
         line = 1
         for (text, param) in token_iter(tokens):
             self.process_token(text, param, line)
@@ -118,10 +184,24 @@ class BasePDA:
 
         if not self.is_in_accepting_state():
             raise PDAError(line, 'Expect more content after this token')
-        else:
-            return self.finish_up()
 
-regex = re.compile('[a-zA-Z0-9_-]')
+    def run(self, tokens, vm=None):
+        self.consume(tokens)
+        return self.finish_up(vm)
+
+    def compile(self, tokens):
+        """Returns the bytecode instead of executing it"""
+        self.consume(tokens)
+        self.leaving_handler()
+        return list(self.asm)
+
+    def leaving_handler(self):
+        handler = Registry.leaving_handlers.get(self.state)
+        if handler is not None:
+            handler(self)
+
+# command name, with optional whitespace around it
+regex = re.compile('[ \t]*([a-zA-Z0-9_-]{0,100})[ \t]*')
 
 class PDA(BasePDA):
     def __init__(self):
@@ -132,11 +212,11 @@ class PDA(BasePDA):
         self.string_acc = io.StringIO()
 
     def is_in_accepting_state(self):
-        return self.stack[0] == Stack.DOLLAR
+        return self.state == State.TEXT and self.stack[0] == Stack.DOLLAR
 
-    def finish_up(self):
-        self.leaving_text()
-        return self.execute_asm()
+    def finish_up(self, vm=None):
+        self.leaving_handler()
+        return self.execute_asm(vm)
 
     def _output(self, instruction):
         self._flush_and_reset_string_acc()
@@ -157,20 +237,28 @@ class PDA(BasePDA):
             return self.route(State.CMD_NAME, None, None)
 
         # check if we are closing anything
-        if self.text == '}':
+        if self.text == '}|' and self.stack[0] in (Stack.CMD_OPEN, Stack.OPEN):
+            # '}' followed by a plain '|'
+            self.text = '}'
+            self.select_an_edge_from_state_text()
+            self.text = '|'
+            self.on_text()
+            return self.route(State.TEXT, None, None)
+        elif self.text == '}':
             if self.stack[0] == Stack.CMD_OPEN:
                 self._output((Bytecode.CLOSE_LIST,))
                 return self.route(State.TEXT, Stack.CMD_OPEN, None)
             elif self.stack[0] == Stack.OPEN:
                 self.string_acc.write(self.text)
                 return self.route(State.TEXT, Stack.OPEN, None)
+            elif self.stack[0] == Stack.DOLLAR:
+                return self.route_from_state_unexpect()
         elif self.text == '}|':
-            if self.stack[0] == Stack.CMD_OPEN_ALT:
-                self._output((Bytecode.CLOSE_LIST,))
-                return self.route(State.TEXT, Stack.CMD_OPEN_ALT, None)
-            elif self.stack[0] == Stack.OPEN_ALT:
+            if self.stack[0] == Stack.OPEN_ALT:
                 self.string_acc.write(self.text)
                 return self.route(State.TEXT, Stack.OPEN_ALT, None)
+            elif self.stack[0] == Stack.DOLLAR:
+                return self.route_from_state_unexpect()
 
         if self.text == '{':
             self.string_acc.write(self.text)
@@ -200,31 +288,58 @@ class PDA(BasePDA):
         if self.text == '{':
             return self.route(State.TEXT, None, Stack.CMD_OPEN)
         elif self.text == '|{':
-            return self.route(State.TEXT, None, Stack.CMD_ALT_OPEN)
-        else:
-            self.on_cmd_name()
+            # raw mode: everything is text until the next '}|'
+            return self.route(State.RAW, None, Stack.CMD_OPEN_ALT)
+        elif self.symbol_acc.tell() == 0 and self.on_cmd_name():
             return self.route(State.CMD_NAME, None, None)  # self loop
+        else:
+            return self.route_from_state_unexpect()
 
     def on_cmd_name(self):
-        if self.text.isspace():
-            return
-        elif regex.match(self.text):
-            self.symbol_acc.write(self.text)
-        else:
-            raise PDAError('Symbol')
+        """Returns False if the text cannot be a command name"""
+        if self.param is not None:
+            return False
+        match = regex.fullmatch(self.text)
+        if match is None:
+            return False
+        self.symbol_acc.write(match.group(1))
+        return True
 
     @Registry.leaving(State.CMD_NAME)
     def leaving_cmd_name(self):
         self._output((Bytecode.OPEN_LIST, self.line))
-        if self.symbol_acc.tell() > 0:
-            self.symbol_acc.seek(0)
-            self._output((Bytecode.ADD_SYMBOL, self.symbol_acc.read()))
-            self.symbol_acc.seek(0)
-            self.symbol_acc.truncate(0)
+        # anonymous lists, such as @{...}, are called 'list'
+        self.symbol_acc.seek(0)
+        symbol = self.symbol_acc.read() or 'list'
+        self._output((Bytecode.ADD_SYMBOL, symbol))
+        self.symbol_acc.seek(0)
+        self.symbol_acc.truncate(0)
+
+    @Registry.route_from(State.RAW)
+    def select_an_edge_from_state_raw(self):
+        if self.text == '}|':
+            self._output((Bytecode.CLOSE_LIST,))
+            return self.route(State.TEXT, Stack.CMD_OPEN_ALT, None)
+        elif isinstance(self.text, str) and self.text and \
+             not self.text.strip(' \t\r'):
+            # like parsing.Parser, which drops the strings that are only
+            # whitespace, e.g. the one before '}|'
+            return self.route(State.RAW, None, None)
+        else:
+            self.on_text()
+            return self.route(State.RAW, None, None)  # self loop
+
+    @Registry.leaving(State.RAW)
+    def leaving_raw(self):
+        self._flush_and_reset_string_acc()
 
     @Registry.route_from(State.UNEXPECT)
     def route_from_state_unexpect(self):
-        raise PDAError(line, 'Unexpected token %s' % repr(text))
+        if self.param is not None:
+            text = self.text * self.param
+        else:
+            text = self.text
+        raise PDAError(self.line, 'Unexpected token %r' % text)
 
 
 class VM:
@@ -235,7 +350,7 @@ class VM:
 
     def execute(self, opcode, *params):
         idx = int(opcode)
-        VM.vector[idx](self, *params)
+        self.vector[idx](self, *params)
 
     def _append(self, car):
         if self.current_node.car is None:
@@ -0,0 +1,161 @@
+"""The notebook as plain text: one SLUG.scrbl file for each page, and the
+children of the page in a directory named SLUG next to it.
+
+A file starts with "key: value" lines (title, position, unlisted, mtime),
+and each paragraph after them ends with a line that only has a form feed
+(^L, which is also a page break in Emacs). For example:
+
+    title: Units of Z[i]
+    position: 1024
+    ^L
+    First paragraph
+    ^L
+"""
+
+from pathlib import Path
+from sqlops import Db, is_valid_slug
+from page_edit import POSITION_GAP
+from page_edit_tree import TRASH
+from title_index import get_title_index
+
+SUFFIX = '.scrbl'
+SEPARATOR = '\f\n'
+HEADER_KEYS = ('title', 'position', 'unlisted', 'mtime')
+
+class PlainTextError(ValueError):
+    pass
+
+def write_page(path, row, paragraphs):
+    """Returns the number of paragraphs"""
+    count = 0
+    with open(str(path), 'w', encoding='utf-8', newline='') as f:
+        for key in HEADER_KEYS:
+            if row[key] is not None:
+                f.write('%s: %s\n' % (key, row[key]))
+        f.write(SEPARATOR)
+        for text in paragraphs:
+            if '\n' + SEPARATOR in '\n' + text + '\n':
+                raise PlainTextError('%s: a paragraph has a form feed line'
+                                     % path)
+            f.write(text)
+            f.write('\n')
+            f.write(SEPARATOR)
+            count += 1
+    return count
+
+def read_header(path):
+    header = {}
+    with open(str(path), 'r', encoding='utf-8', newline='') as f:
+        for line in f:
+            if line == SEPARATOR:
+                break
+            key, _, value = line.rstrip('\r\n').partition(': ')
+            if key not in HEADER_KEYS:
+                raise PlainTextError('%s: unknown header %r' % (path, key))
+            header[key] = value if key == 'title' else int(value)
+    if 'title' not in header:
+        raise PlainTextError('%s: needs a title' % path)
+    return header
+
+def read_paragraphs(path):
+    """Yields the paragraphs of the file one at a time"""
+    with open(str(path), 'r', encoding='utf-8', newline='') as f:
+        for line in f:
+            if line == SEPARATOR:
+                break
+        lines = []
+        for line in f:
+            if line == SEPARATOR:
+                yield ''.join(lines)[:-1]
+                lines = []
+            else:
+                lines.append(line)
+        if ''.join(lines).strip():
+            raise PlainTextError('%s: the last paragraph has no end' % path)
+
+def iterate_files(directory):
+    """Yields (path, parent path or None) of the page files, parents first"""
+    stack = [(Path(directory), None)]
+    while stack:
+        folder, parent = stack.pop()
+        for path in sorted(folder.glob('*' + SUFFIX)):
+            if not is_valid_slug(path.stem):
+                raise PlainTextError('%s: invalid slug' % path)
+            yield path, parent
+            children = path.with_suffix('')
+            if children.is_dir():
+                stack.append((children, path))
+
+class DbPlainText(Db):
+    def export_to(self, directory):
+        """Writes every page under `directory`, except the trash and the
+        pages in it. Returns the number of pages and paragraphs."""
+        directory = Path(directory)
+        pages = paragraphs = 0
+        with self.auto_rollback() as c:
+            # pages whose parent is gone go to the top, too
+            c.execute("""
+            SELECT id FROM toc WHERE (parent_id IS NULL
+            OR parent_id NOT IN (SELECT id FROM toc)) AND slug != ?
+            ORDER BY position, id
+            """, (TRASH,))
+            stack = [(page_id, directory) for (page_id,) in c.fetchall()]
+            reader = self.conn.cursor()
+            while stack:
+                page_id, folder = stack.pop()
+                c.execute('SELECT * FROM toc WHERE id = ?', (page_id,))
+                row = c.fetchone()
+                folder.mkdir(parents=True, exist_ok=True)
+                reader.execute("""
+                SELECT content FROM content
+                WHERE parent_id = ? AND position IS NOT NULL
+                ORDER BY position
+                """, (page_id,))
+                paragraphs += write_page(folder / (row['slug'] + SUFFIX), row,
+                                         (text for (text,) in reader))
+                pages += 1
+                c.execute('SELECT id FROM toc WHERE parent_id = ?',
+                          (page_id,))
+                stack.extend((child_id, folder / row['slug'])
+                             for (child_id,) in c.fetchall())
+        return pages, paragraphs
+
+    def import_from(self, directory):
+        """Adds the pages under `directory` to the notebook, in one
+        transaction. Returns the number of pages and paragraphs."""
+        page_ids = {}
+        with self.auto_rollback(immediate=True) as c:
+            for path, parent in iterate_files(directory):
+                header = read_header(path)
+                c.execute("""
+                INSERT INTO toc (parent_id, slug, title, position,
+                                 unlisted, mtime)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """, (page_ids.get(parent), path.stem, header['title'],
+                      header.get('position', 0), header.get('unlisted'),
+                      header.get('mtime')))
+                page_ids[path] = c.lastrowid
+            # indexing all the rows at the end is several times faster than
+            # indexing them one by one in the trigger
+            c.execute("""
+            SELECT sql FROM sqlite_master
+            WHERE type = 'trigger' AND name = 'search_insert'
+            """)
+            trigger_sql = c.fetchone()[0]
+            c.execute('DROP TRIGGER search_insert')
+            c.execute('SELECT coalesce(max(id), 0) FROM content')
+            last_id = c.fetchone()[0]
+            c.executemany("""
+            INSERT INTO content (parent_id, position, content)
+            VALUES (?, ?, ?)
+            """, ((page_id, (i + 1) * POSITION_GAP, text)
+                  for path, page_id in page_ids.items()
+                  for i, text in enumerate(read_paragraphs(path))))
+            paragraphs = c.rowcount
+            c.execute("""
+            INSERT INTO search (rowid, title, content)
+            SELECT id, title, content FROM search_source WHERE id > ?
+            """, (last_id,))
+            c.execute(trigger_sql)
+        get_title_index(self.address).invalidate()
+        return len(page_ids), paragraphs
@@ -0,0 +1,92 @@
+import pda
+import tokenizing
+from fragments import text_hash
+from sqlops import Db, is_busy
+
+def compile_program(text):
+    """Returns the bytecode of a paragraph, or None if it has errors"""
+    try:
+        return pda.PDA().compile(tokenizing.tokenize(text))
+    except (pda.PDAError, tokenizing.ParserError):
+        return None
+
+class Programs(object):
+    """Stored bytecode of some paragraphs, decoded on demand. A program is
+    only used for the text that it was compiled from."""
+    def __init__(self, blobs=None):
+        # content_id -> (hash, blob), and content_id -> (hash, program)
+        self.blobs = blobs or {}
+        self.compiled = {}
+
+    def get(self, content_id, text):
+        digest = text_hash(text)
+        compiled = self.compiled.get(content_id)
+        if compiled is not None and compiled[0] == digest:
+            return compiled[1]
+        stored = self.blobs.get(content_id)
+        if stored is None or stored[0] != digest:
+            # the text was changed after the program was stored
+            return None
+        try:
+            # None if it is from another version of the parser
+            return pda.decode(stored[1])
+        except (ValueError, IndexError, UnicodeDecodeError):
+            return None
+
+    def put(self, content_id, asm, text):
+        self.compiled[content_id] = (text_hash(text), asm)
+
+class DbBytecode(Db):
+    def load_programs(self, page_id):
+        with self.auto_rollback() as c:
+            c.execute("""
+            SELECT bytecode.content_id, hash, program FROM bytecode
+            INNER JOIN content ON content.id = bytecode.content_id
+            WHERE content.parent_id = ?
+            """, (page_id,))
+            return Programs({row[0]: (row[1], row[2]) for row in c})
+
+    def store_programs(self, programs):
+        """Writes the programs that were compiled after loading"""
+        if not programs.compiled:
+            return
+        try:
+            with self.write_transaction(wait=False) as c:
+                # the paragraph may have been deleted since it was read
+                c.executemany("""
+                INSERT OR REPLACE INTO bytecode (content_id, program, hash)
+                SELECT id, ?, ? FROM content WHERE id = ?
+                """, ((pda.encode(asm), digest, content_id)
+                      for content_id, (digest, asm)
+                      in programs.compiled.items()))
+        except Exception as e:
+            if not is_busy(e):
+                raise e from e
+
+    @staticmethod
+    def write_program(c, content_id, text):
+        """Returns the program, or None if the text has errors"""
+        asm = compile_program(text)
+        if asm is not None:
+            c.execute("""
+            INSERT OR REPLACE INTO bytecode (content_id, program, hash)
+            VALUES (?, ?, ?)
+            """, (content_id, pda.encode(asm), text_hash(text)))
+        return asm
+
+    @staticmethod
+    def write_programs(c, pairs):
+        """write_program for many (content_id, text) pairs at once.
+        Returns content_id -> program, for the texts without errors."""
+        compiled = {}
+        rows = []
+        for content_id, text in pairs:
+            asm = compile_program(text)
+            if asm is not None:
+                compiled[content_id] = asm
+                rows.append((content_id, pda.encode(asm), text_hash(text)))
+        c.executemany("""
+        INSERT OR REPLACE INTO bytecode (content_id, program, hash)
+        VALUES (?, ?, ?)
+        """, rows)
+        return compiled
@@ -0,0 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
+from flask import request
+from parsing import new_parser, compile_notes, ParserAcc
+from fragments import parse_fragments
+
+_executor = None
+_executor_workers = 0
+
+def get_executor(workers):
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ProcessPoolExecutor(workers)
+        _executor_workers = workers
+    return _executor
+
+def split_by_size(items, n, size_of):
+    """Split items into at most n contiguous chunks of about the same size"""
+    target = sum(map(size_of, items)) / n
+    chunks = []
+    chunk = []
+    size = 0
+    for item in items:
+        chunk.append(item)
+        size += size_of(item)
+        if size >= target and len(chunks) < n - 1:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+# these run in the worker processes
+
+def _parse_chunk(slug, engine, tokenizer, pairs):
+    parser = new_parser(slug, engine, tokenizer)
+    fragments, _ = parse_fragments(parser, pairs)
+    return fragments
+
+def _compile_chunk(url_root, titles, asts):
+    # url_for needs a request context
+    from application import app
+    parser_acc = ParserAcc()
+    for slug, title in titles.items():
+        parser_acc.put_title(slug, title)
+    with app.test_request_context(base_url=url_root):
+        return [''.join(compile_notes(ast, parser_acc)) for ast in asts]
+
+class RenderPool(object):
+    """Parses and compiles paragraphs in worker processes"""
+    def __init__(self, workers, threshold, engine=None, tokenizer=None):
+        self.workers = workers or 0
+        self.threshold = threshold or 0
+        self.engine = engine
+        self.tokenizer = tokenizer
+
+    def wants(self, pairs):
+        """Small pages stay on the serial path"""
+        if self.workers < 2 or len(pairs) < 2:
+            return False
+        return sum(len(string) for string, _ in pairs) >= self.threshold
+
+    def parse_fragments(self, slug, pairs):
+        """Same as fragments.parse_fragments, but in parallel"""
+        executor = get_executor(self.workers)
+        chunks = split_by_size(pairs, self.workers, lambda p: len(p[0]))
+        futures = [executor.submit(_parse_chunk, slug, self.engine,
+                                   self.tokenizer, chunk)
+                   for chunk in chunks]
+        fragments = []
+        merged = ParserAcc()
+        for future in futures:
+            for fragment in future.result():
+                for link in fragment.slugs:
+                    merged.add_slug(link)
+                fragments.append(fragment)
+        return fragments, merged
+
+    def compile_fragments(self, fragments, parser_acc):
+        """Same as fragments.compile_fragments, but in parallel.
+        The titles in parser_acc must be loaded before calling this."""
+        executor = get_executor(self.workers)
+        titles = dict(parser_acc.slug_title_map)
+        chunks = split_by_size(fragments, self.workers, lambda f: len(f.text))
+        futures = [executor.submit(_compile_chunk, request.url_root, titles,
+                                   [f.ast for f in chunk])
+                   for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            for fragment, html in zip(chunk, future.result()):
+                fragment.html = html
@@ -1,5 +1,8 @@
 BEGIN TRANSACTION;
 -- Schema
+-- Sibling pages are ordered by "position", which is added by migrations.py,
+-- and toc_closure holds the ancestors of each page. toc.next_id and
+-- toc.first_child_id are left over from the linked lists before them.
 CREATE TABLE IF NOT EXISTS "toc" (
        "id" INTEGER NOT NULL UNIQUE,
        "parent_id" INTEGER,
@@ -13,6 +16,9 @@ CREATE TABLE IF NOT EXISTS "toc" (
        "first_content_id" INTEGER,
        PRIMARY KEY("id")
 );
+-- The paragraphs of a page are ordered by "position", which is added by
+-- migrations.py. toc.first_content_id and content.next_id are left over
+-- from the linked list that came before it, and are not kept up to date.
 CREATE TABLE IF NOT EXISTS "content" (
        "id" INTEGER NOT NULL UNIQUE,
        "parent_id" INTEGER NOT NULL,
@@ -28,4 +34,185 @@ CREATE TABLE IF NOT EXISTS "metadata" (
        "value_blob" blob,
        PRIMARY KEY("key")
 );
+-- Bumped whenever a slug or a title changes (see title_index.py)
+INSERT OR IGNORE INTO "metadata" ("key", "value_int")
+VALUES ('toc_generation', 0);
+CREATE TRIGGER IF NOT EXISTS "toc_generation_insert" AFTER INSERT ON toc
+BEGIN
+       UPDATE metadata SET value_int = value_int + 1
+       WHERE key = 'toc_generation';
+END;
+CREATE TRIGGER IF NOT EXISTS "toc_generation_delete" AFTER DELETE ON toc
+BEGIN
+       UPDATE metadata SET value_int = value_int + 1
+       WHERE key = 'toc_generation';
+END;
+CREATE TRIGGER IF NOT EXISTS "toc_generation_update"
+AFTER UPDATE OF slug, title ON toc
+WHEN OLD.slug IS NOT NEW.slug OR OLD.title IS NOT NEW.title
+BEGIN
+       UPDATE metadata SET value_int = value_int + 1
+       WHERE key = 'toc_generation';
+END;
+-- ... and whenever the tree changes (see toc_cache.py)
+CREATE TRIGGER IF NOT EXISTS "toc_generation_tree"
+AFTER UPDATE OF parent_id, position, unlisted ON toc
+WHEN OLD.parent_id IS NOT NEW.parent_id OR OLD.position IS NOT NEW.position
+OR OLD.unlisted IS NOT NEW.unlisted
+BEGIN
+       UPDATE metadata SET value_int = value_int + 1
+       WHERE key = 'toc_generation';
+END;
+-- One row for each page and each of its ancestors (and itself, at depth 0)
+CREATE TABLE IF NOT EXISTS "toc_closure" (
+       "ancestor" INTEGER NOT NULL,
+       "descendant" INTEGER NOT NULL,
+       "depth" INTEGER NOT NULL,
+       PRIMARY KEY("ancestor", "depth", "descendant")
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS "toc_closure_descendant"
+ON "toc_closure" ("descendant", "depth");
+CREATE TRIGGER IF NOT EXISTS "toc_closure_insert" AFTER INSERT ON toc
+BEGIN
+       INSERT INTO toc_closure (ancestor, descendant, depth)
+       SELECT NEW.id, NEW.id, 0
+       UNION ALL
+       SELECT ancestor, NEW.id, depth + 1 FROM toc_closure
+       WHERE descendant = NEW.parent_id;
+END;
+CREATE TRIGGER IF NOT EXISTS "toc_closure_delete" AFTER DELETE ON toc
+BEGIN
+       DELETE FROM toc_closure
+       WHERE descendant = OLD.id OR ancestor = OLD.id;
+END;
+CREATE TRIGGER IF NOT EXISTS "toc_closure_cycle"
+BEFORE UPDATE OF parent_id ON toc
+WHEN EXISTS (SELECT 1 FROM toc_closure
+             WHERE ancestor = NEW.id AND descendant = NEW.parent_id)
+BEGIN
+       SELECT RAISE(ABORT, 'A page cannot be moved under itself');
+END;
+-- moves the whole subtree: cut it from the old ancestors, then join it to
+-- the new ones
+CREATE TRIGGER IF NOT EXISTS "toc_closure_move"
+AFTER UPDATE OF parent_id ON toc
+WHEN OLD.parent_id IS NOT NEW.parent_id
+BEGIN
+       DELETE FROM toc_closure
+       WHERE descendant IN (SELECT descendant FROM toc_closure
+                            WHERE ancestor = NEW.id)
+       AND ancestor IN (SELECT ancestor FROM toc_closure
+                        WHERE descendant = NEW.id AND ancestor != NEW.id);
+       INSERT INTO toc_closure (ancestor, descendant, depth)
+       SELECT above.ancestor, below.descendant, above.depth + below.depth + 1
+       FROM toc_closure AS above, toc_closure AS below
+       WHERE above.descendant = NEW.parent_id AND below.ancestor = NEW.id;
+END;
+-- Rendered HTML of each paragraph
+CREATE TABLE IF NOT EXISTS "fragment" (
+       "content_id" INTEGER NOT NULL UNIQUE,
+       "hash" TEXT NOT NULL,
+       "html" TEXT NOT NULL,
+       PRIMARY KEY("content_id"),
+       FOREIGN KEY("content_id") REFERENCES content(id) ON DELETE CASCADE
+);
+-- Page links in a fragment, and the titles they were rendered with
+CREATE TABLE IF NOT EXISTS "fragment_dep" (
+       "content_id" INTEGER NOT NULL,
+       "slug" TEXT NOT NULL,
+       "title" TEXT,
+       PRIMARY KEY("content_id", "slug"),
+       FOREIGN KEY("content_id") REFERENCES fragment(content_id)
+               ON DELETE CASCADE
+);
+-- Bytecode of each paragraph for the PDA engine (see pda.encode). The hash
+-- of the text it was compiled from is added by migrations.py.
+CREATE TABLE IF NOT EXISTS "bytecode" (
+       "content_id" INTEGER NOT NULL UNIQUE,
+       "program" BLOB NOT NULL,
+       PRIMARY KEY("content_id"),
+       FOREIGN KEY("content_id") REFERENCES content(id) ON DELETE CASCADE
+);
+-- Page links in each paragraph, for "what links here"
+CREATE TABLE IF NOT EXISTS "links" (
+       "from_page" INTEGER NOT NULL,
+       "from_content" INTEGER NOT NULL,
+       "to_slug" TEXT NOT NULL,
+       PRIMARY KEY("from_content", "to_slug"),
+       FOREIGN KEY("from_page") REFERENCES toc(id) ON DELETE CASCADE,
+       FOREIGN KEY("from_content") REFERENCES content(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "links_to_slug" ON "links" ("to_slug");
+-- Every @math and @Math expression, by normalized TeX (see page_math.py)
+CREATE TABLE IF NOT EXISTS "math" (
+       "tex" TEXT NOT NULL,
+       "content_id" INTEGER NOT NULL,
+       "display" INTEGER NOT NULL,
+       "page_id" INTEGER NOT NULL,
+       PRIMARY KEY("tex", "content_id", "display"),
+       FOREIGN KEY("content_id") REFERENCES content(id) ON DELETE CASCADE,
+       FOREIGN KEY("page_id") REFERENCES toc(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "math_content_id" ON "math" ("content_id");
+-- Saved versions of each page (see page_history.py): the paragraphs as a
+-- JSON list when "snapshot" is 1, or else a delta from the revision before.
+-- "hash" is the hash of the paragraphs, to tell if the page changed since.
+CREATE TABLE IF NOT EXISTS "revision" (
+       "page_id" INTEGER NOT NULL,
+       "number" INTEGER NOT NULL,
+       "mtime" INTEGER,
+       "slug" TEXT NOT NULL,
+       "title" TEXT NOT NULL,
+       "snapshot" INTEGER NOT NULL,
+       "data" TEXT NOT NULL,
+       "hash" TEXT NOT NULL,
+       PRIMARY KEY("page_id", "number"),
+       FOREIGN KEY("page_id") REFERENCES toc(id) ON DELETE CASCADE
+);
+-- Pages in the trash (see page_edit_tree.py), and where they were taken from
+CREATE TABLE IF NOT EXISTS "trash" (
+       "page_id" INTEGER NOT NULL,
+       "parent_id" INTEGER,
+       "position" INTEGER NOT NULL,
+       "mtime" INTEGER,
+       PRIMARY KEY("page_id"),
+       FOREIGN KEY("page_id") REFERENCES toc(id) ON DELETE CASCADE
+);
+-- Full-text search over the paragraphs and the titles of their pages
+CREATE VIEW IF NOT EXISTS "search_source" AS
+SELECT content.id AS id, toc.title AS title, content.content AS content
+FROM content INNER JOIN toc ON toc.id = content.parent_id;
+CREATE VIRTUAL TABLE IF NOT EXISTS "search" USING fts5(
+       title, content,
+       content='search_source', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS "search_insert" AFTER INSERT ON content
+BEGIN
+       INSERT INTO search (rowid, title, content)
+       SELECT NEW.id, title, NEW.content FROM toc WHERE id = NEW.parent_id;
+END;
+CREATE TRIGGER IF NOT EXISTS "search_delete" AFTER DELETE ON content
+BEGIN
+       INSERT INTO search (search, rowid, title, content)
+       SELECT 'delete', OLD.id, title, OLD.content FROM toc
+       WHERE id = OLD.parent_id;
+END;
+CREATE TRIGGER IF NOT EXISTS "search_update" AFTER UPDATE OF content, parent_id
+ON content
+BEGIN
+       INSERT INTO search (search, rowid, title, content)
+       SELECT 'delete', OLD.id, title, OLD.content FROM toc
+       WHERE id = OLD.parent_id;
+       INSERT INTO search (rowid, title, content)
+       SELECT NEW.id, title, NEW.content FROM toc WHERE id = NEW.parent_id;
+END;
+CREATE TRIGGER IF NOT EXISTS "search_title" AFTER UPDATE OF title ON toc
+WHEN OLD.title IS NOT NEW.title
+BEGIN
+       INSERT INTO search (search, rowid, title, content)
+       SELECT 'delete', id, OLD.title, content FROM content
+       WHERE parent_id = OLD.id;
+       INSERT INTO search (rowid, title, content)
+       SELECT id, NEW.title, content FROM content WHERE parent_id = NEW.id;
+END;
 COMMIT;
@@ -39,3 +39,9 @@ def compile_tree(current):
         _compile_tree_private(node, acc)
     acc.append('</ul>')
     return acc
+
+def compile_tree_cached(toc_snapshot, page_id, current):
+    """Same as compile_tree, but joined, and computed once for each page until
+    the tree changes. `current` must be built from `toc_snapshot`."""
+    return toc_snapshot.memoize(('sidebar', page_id),
+                                lambda: ''.join(compile_tree(current)))
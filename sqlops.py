@@ -3,67 +3,52 @@ from pathlib import Path
 import re
 from contextlib import contextmanager
 from collections import deque
+from threading import Lock
+from urllib.request import pathname2url
+import migrations
 
 res_dir = Path(__file__).absolute().parent
 slug_re = re.compile('^[a-zA-Z0-9_\\-]{1,100}$')
 
 toc_cols = ('id', 'parent_id', 'next_id', 'first_child_id', 'first_content_id',
-            'slug', 'title', 'mtime', 'unlisted', 'content_lock')
+            'slug', 'title', 'mtime', 'unlisted', 'content_lock', 'position')
 toc_cols_fullname = map(lambda s: 'toc.{0} as {0}'.format(s), toc_cols)
 
 toc_cols_str = ', '.join(toc_cols)
 toc_cols_fullname_str = ', '.join(toc_cols_fullname)
 
-cte_template = """
-{{name}} (n, {0}) AS (
-SELECT 0 as n, {1} FROM toc WHERE id = :id
-UNION ALL
-SELECT n + 1, {1} FROM toc
-INNER JOIN {{name}} ON {{comp}}
-WHERE n < {{N}}
-)""".format(toc_cols_str, toc_cols_fullname_str)
-
-class QueryBuilder:
-    def __init__(self):
-        self.current_i = -1
-        self.tables = []
-
-    def get_name(self):
-        self.current_i += 1
-        return 'cte_%d' % self.current_i
-
-    def _append_fmt(self, fmt_str, N):
-        name = self.get_name()
-        self.tables.append(cte_template.format(
-            name=name,
-            comp=fmt_str.format(name),
-            N=N
-        ))
-
-    def forward(self):
-        self._append_fmt('{}.next_id = toc.id', 5)
-        return self
-
-    def backward(self):
-        self._append_fmt('toc.next_id = {}.id', 5)
-        return self
-
-    def upward(self):
-        self._append_fmt('{}.parent_id = toc.id', 10)
-        return self
-
-    def downward(self):
-        self._append_fmt('toc.parent_id = {}.id', 1)
-        return self
-
-    def __str__(self):
-        selects = ['SELECT {} FROM cte_{}'.format(toc_cols_str, i)
-                   for i in range(len(self.tables))]
-
-        return 'WITH {} \n {}'.format(
-            ','.join(self.tables),
-            '\n UNION '.join(selects)
-        )
+# siblings on each side of the page that show up in the sidebar
+SIBLING_WINDOW = 5
+
+# The page, its ancestors, its children, and a window of its siblings, with
+# one more sibling than the window on each side to tell if there are more.
+# Pages are served from toc_cache.TocSnapshot, which gives the same rows
+# from memory; this is the reference that test_toc_cache checks it against.
+tree_query = """
+SELECT {0} FROM toc_closure
+INNER JOIN toc ON toc.id = toc_closure.ancestor
+WHERE toc_closure.descendant = :id
+UNION
+SELECT {0} FROM toc_closure
+INNER JOIN toc ON toc.id = toc_closure.descendant
+WHERE toc_closure.ancestor = :id AND toc_closure.depth = 1
+UNION
+SELECT * FROM (
+    SELECT {0} FROM toc AS page
+    INNER JOIN toc ON toc.parent_id IS page.parent_id
+    AND (toc.position, toc.id) < (page.position, page.id)
+    WHERE page.id = :id
+    ORDER BY toc.position DESC, toc.id DESC LIMIT {1}
+)
+UNION
+SELECT * FROM (
+    SELECT {0} FROM toc AS page
+    INNER JOIN toc ON toc.parent_id IS page.parent_id
+    AND (toc.position, toc.id) > (page.position, page.id)
+    WHERE page.id = :id
+    ORDER BY toc.position, toc.id LIMIT {1}
+)
+""".format(toc_cols_fullname_str, SIBLING_WINDOW + 1)
 
 class TreeNode:
     def __init__(self, title, slug,
@@ -95,10 +80,20 @@ class TreeNode:
     def link(self):
         return slug_to_link(self.slug)
 
+def sibling_order(row):
+    return row['position'], row['id']
+
 class Tree:
-    def __init__(self, rows, page_id):
+    """The rows around a page (see tree_query), as a tree of TreeNodes"""
+    def __init__(self, rows, page_id, window=SIBLING_WINDOW):
         self.rows = rows
         self.page_id = page_id
+        self.window = window
+        self.children = {}
+        for row in rows.values():
+            self.children.setdefault(row['parent_id'], []).append(row)
+        for siblings in self.children.values():
+            siblings.sort(key=sibling_order)
 
     def __contains__(self, element):
         if element is None:
@@ -112,25 +107,46 @@ class Tree:
         else:
             return self.rows.get(key, default)
 
+    def siblings(self):
+        """Returns the siblings of the page, and where the page is in them"""
+        parent_id = self.rows[self.page_id]['parent_id']
+        siblings = self.children[parent_id]
+        for i, row in enumerate(siblings):
+            if row['id'] == self.page_id:
+                return siblings, i
+
+    def neighbours(self):
+        """The rows before and after the page, or None"""
+        siblings, i = self.siblings()
+        before = siblings[i - 1] if i > 0 else None
+        after = siblings[i + 1] if i + 1 < len(siblings) else None
+        return before, after
+
     def into(self):
         # start from the top
-        top_level_rows = filter(lambda r: r['parent_id'] not in self,
-                                self.rows.values())
+        top_level_rows = sorted(filter(lambda r: r['parent_id'] not in self,
+                                       self.rows.values()),
+                                key=sibling_order)
         # root
         root = TreeNode(None, None)
         self.make_children(top_level_rows, root)
         return root
 
     def iterate_children(self, parent_row):
-        front_row = self.get(parent_row['first_child_id'])
-        while front_row is not None:
-            yield front_row
-            front_row = self.get(front_row['next_id'])
+        return self.children.get(parent_row['id'], ())
 
     def make_children(self, current_rows, acc):
-        last_row = None
+        current_rows = list(current_rows)
+        more_before = more_after = False
+        if self.page_id in (row['id'] for row in current_rows):
+            # the query fetched one sibling too many on each side
+            siblings, i = self.siblings()
+            more_before = i > self.window
+            more_after = len(siblings) - i - 1 > self.window
+            current_rows = siblings[max(0, i - self.window):i + self.window + 1]
+        if more_before:
+            acc.append(TreeNode(None, '...'))
         for row in current_rows:
-            last_row = row
             children = self.iterate_children(row)
             node = TreeNode(row['title'],
                             row['slug'],
@@ -138,34 +154,19 @@ class Tree:
                             private=(row['unlisted'] == 1))
             self.make_children(children, node)
             acc.append(node)
-        # detect broken linked list
-        # we can have no child at all, so we need to check if last_row is None
-        if last_row and last_row['next_id']:
+        if more_after:
             acc.append(TreeNode(None, '...'))
 
 class Content:
+    """The paragraphs of a page, loaded in order"""
     def __init__(self):
-        self.content_rows = {}
-        self.content_id = None
-
-    def register_content_id(self, content_id):
-        self.content_id = content_id
+        self.content_rows = []
 
     def load_content_row(self, row):
-        self.content_rows[row['id']] = row
+        self.content_rows.append(row)
 
     def content_row_iter(self):
-        if self.content_id is None:
-            return
-
-        current = self.content_rows[self.content_id]
-        while current is not None:
-            yield current
-            next_id = current['next_id']
-            if next_id is not None:
-                current = self.content_rows[next_id]
-            else:
-                current = None
+        return iter(self.content_rows)
 
     def content_list_iter(self):
         return map(lambda r: r['content'], self.content_row_iter())
@@ -176,6 +177,9 @@ class Content:
     def content_pair_iter(self):
         return zip(self.content_list_iter(), self.content_id_iter())
 
+    def content_position_iter(self):
+        return map(lambda r: r['position'], self.content_row_iter())
+
 def is_valid_slug(slug):
     return slug_re.match(slug)
 
@@ -185,18 +189,146 @@ def slug_to_link(slug):
 class PageNotFoundError(sqlite3.DatabaseError):
     pass
 
+# PRAGMAs that can be set in the config file, in the order they are run
+PRAGMA_KEYS = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size',
+               'busy_timeout')
+# these change the database file, not just the connection
+PERSISTENT_PRAGMAS = frozenset(['journal_mode'])
+
+def connect(address, pragmas=(), readonly=False):
+    if readonly:
+        conn = sqlite3.connect('file:%s?mode=ro' % pathname2url(address),
+                               uri=True, isolation_level=None,
+                               check_same_thread=False)
+    else:
+        conn = sqlite3.connect(address, isolation_level=None,
+                               check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    for key, value in pragmas:
+        if readonly and key in PERSISTENT_PRAGMAS:
+            continue
+        # the values are checked by the config loader
+        conn.execute('PRAGMA %s = %s' % (key, value))
+    return conn
+
+def read_schema():
+    with open(str(res_dir / 'schema.sql'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+class ConnectionPool(object):
+    """Idle connections to one database, most recently used first.
+    A connection is used by one thread at a time."""
+    max_idle = 8
+
+    def __init__(self, address, readonly=False):
+        self.address = address
+        self.readonly = readonly
+        self.lock = Lock()
+        self.idle = []
+        self.pragmas = []
+        self.schema_ready = False
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        if self.readonly and not self.schema_ready:
+            # the tables are created by a writable connection
+            writable = get_pool(self.address)
+            writable.release(writable.acquire())
+            self.schema_ready = True
+        conn = connect(self.address, self.pragmas, self.readonly)
+        if not self.schema_ready:
+            # another thread may get here too, but the schema is idempotent
+            conn.executescript(read_schema())
+            migrations.migrate(conn)
+            self.schema_ready = True
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            # e.g. a streamed response that was not read to the end
+            conn.execute('ROLLBACK')
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+_pools = {}
+_pools_lock = Lock()
+
+def get_pool(address, readonly=False):
+    if address == ':memory:':
+        # every connection has its own database
+        return None
+    with _pools_lock:
+        pool = _pools.get((address, readonly))
+        if pool is None:
+            pool = _pools[address, readonly] = \
+                ConnectionPool(address, readonly)
+        return pool
+
+def configure(address, config):
+    """Sets the PRAGMAs for new connections to `address`.
+    config: a mapping that has PRAGMA_KEYS, None meaning the default."""
+    pragmas = [(key, config[key]) for key in PRAGMA_KEYS
+               if config[key] is not None]
+    for readonly in (False, True):
+        pool = get_pool(address, readonly)
+        if pool is not None:
+            pool.pragmas = pragmas
+            pool.close_all()
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and \
+        'database is locked' in str(error)
+
 class Db:
-    def __init__(self, address):
-        self.conn = sqlite3.connect(address, isolation_level=None)
-        self.conn.row_factory = sqlite3.Row
-        c = self.conn.cursor()
-        c.execute('PRAGMA foreign_keys = ON')
-        self.create_tables()
+    def __init__(self, address, readonly=False):
+        self.address = address
+        self.pool = get_pool(address, readonly)
+        self.readonly = readonly and self.pool is not None
+        if self.pool is None:
+            self.conn = connect(address)
+            self.create_tables()
+        else:
+            self.conn = self.pool.acquire()
 
     @contextmanager
-    def auto_rollback(self):
+    def write_transaction(self, wait=True):
+        """Same as auto_rollback, but on a writable connection, and takes
+        the write lock at once. With wait=False, raises at once if the
+        database is locked (see is_busy); that's for writing caches."""
+        if self.readonly:
+            with Db(self.address) as db, db.write_transaction(wait) as c:
+                yield c
+            return
+
+        timeout = None
+        if not wait:
+            timeout = self.conn.execute('PRAGMA busy_timeout').fetchone()[0]
+            self.conn.execute('PRAGMA busy_timeout = 0')
+        try:
+            with self.auto_rollback(immediate=True) as c:
+                yield c
+        finally:
+            if timeout is not None:
+                self.conn.execute('PRAGMA busy_timeout = %d' % timeout)
+
+    @contextmanager
+    def auto_rollback(self, immediate=False):
+        # in WAL mode, a deferred transaction that starts writing after
+        # somebody else has written fails at once instead of waiting
         c = self.conn.cursor()
-        c.execute('BEGIN')
+        c.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
         try:
             yield c
             c.execute('COMMIT')
@@ -205,13 +337,18 @@ class Db:
             raise e from e
 
     def create_tables(self):
-        with open(str(res_dir / 'schema.sql'), 'r', encoding='utf-8') as f:
-            schema_sql = f.read()
         c = self.conn.cursor()
-        c.executescript(schema_sql)
+        c.executescript(read_schema())
+        migrations.migrate(self.conn)
 
     def close(self):
-        self.conn.close()
+        if self.conn is None:
+            return
+        if self.pool is None:
+            self.conn.close()
+        else:
+            self.pool.release(self.conn)
+        self.conn = None
 
     def __enter__(self):
         return self
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""/view throughput while another thread keeps saving a page, with the
+default SQLite settings and with the profile from settings.sample.
+Usage: bench_concurrency.py [seconds] [readers]"""
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import tempfile
+import time
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+sys.path.append(str(res_dir / 'test'))
+
+import application
+import import_test_data
+from page_edit import EditPageDbWriter
+from sqlops import configure, PRAGMA_KEYS
+
+config_keys = ('tokenizer', 'parser', 'stream_view', 'render_workers',
+               'render_pool_threshold', 'read_only_view') + PRAGMA_KEYS
+
+profiles = {
+    'default': {},
+    'wal': {'journal_mode': 'wal', 'synchronous': 'normal',
+            'mmap_size': 268435456, 'cache_size': -16000,
+            'busy_timeout': 5000, 'read_only_view': True},
+}
+
+class Form(dict):
+    def getlist(self, key):
+        return self[key]
+
+def write(db_uri, deadline):
+    count = errors = 0
+    lock = ''
+    while time.perf_counter() < deadline:
+        texts = ['Paragraph %d, @math{x^%d}' % (count, i) for i in range(20)]
+        with EditPageDbWriter(db_uri) as db:
+            try:
+                db.handle_change(Form(old_slug='home', new_slug='home',
+                                      title='Home', content_lock=lock,
+                                      text=texts))
+                count += 1
+            except Exception as e:
+                print(e, file=sys.stderr)
+                errors += 1
+            c = db.conn.execute("SELECT content_lock FROM toc "
+                                "WHERE slug = 'home'")
+            lock = c.fetchone()[0]
+    return count, errors
+
+def read(deadline):
+    client = application.app.test_client()
+    count = errors = 0
+    while time.perf_counter() < deadline:
+        try:
+            ok = client.get('/view?:=home').status_code == 200
+        except Exception as e:
+            print(e, file=sys.stderr)
+            ok = False
+        if ok:
+            count += 1
+        else:
+            errors += 1
+    return count, errors
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    application.app.logger.disabled = True
+    for name, profile in profiles.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            db_uri = str(Path(tmp) / 'bench.db')
+            config = dict.fromkeys(config_keys)
+            config.update(profile)
+            config['db_uri'] = db_uri
+            configure(db_uri, config)
+            import_test_data.prepare(db_uri)
+            import_test_data.db.close()
+            application.app_config = config
+
+            deadline = time.perf_counter() + seconds
+            with ThreadPoolExecutor(readers + 1) as executor:
+                writer = executor.submit(write, db_uri, deadline)
+                futures = [executor.submit(read, deadline)
+                           for _ in range(readers)]
+                reads = [f.result() for f in futures]
+                writes = writer.result()
+            print('%-8s reads %8.1f/s (%d errors) writes %6.1f/s '
+                  '(%d errors)' % (
+                      name, sum(r[0] for r in reads) / seconds,
+                      sum(r[1] for r in reads),
+                      writes[0] / seconds, writes[1]))
+
+if __name__ == '__main__':
+    main()
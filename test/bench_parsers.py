@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Parse time of the pyparsing `Parser` vs. the PDA engine on large inputs"""
+
+from pathlib import Path
+import sys
+import timeit
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+
+from parsing import new_parser
+
+def load_units(repeat):
+    units = sorted((res_dir / 'test/units').glob('*.scrbl'))
+    text = '\n\n'.join(path.read_text() for path in units)
+    return '\n\n'.join([text] * repeat)
+
+def main():
+    engines = (('pyparsing', None), ('pyparsing', 'regex'), ('pda', None))
+    for repeat in (1, 10, 100):
+        text = load_units(repeat)
+        for engine, tokenizer in engines:
+            parser = new_parser('bench', engine, tokenizer)
+            number = max(1, 50 // repeat)
+            seconds = timeit.timeit(lambda: parser.parse_string(text, 1),
+                                    number=number) / number
+            print('%-10s %-10s %8d chars %10.2f ms' % (
+                engine, tokenizer or '-', len(text), seconds * 1000
+            ))
+
+if __name__ == '__main__':
+    main()
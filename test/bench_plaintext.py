@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Export and import speed of the plain text format, and peak memory.
+Usage: bench_plaintext.py [paragraphs]"""
+
+from pathlib import Path
+import random
+import resource
+import sys
+import tempfile
+import time
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+
+from plaintext import DbPlainText
+
+words = ('ring unit ideal field group norm prime integer element '
+         'module algebra kernel image homomorphism').split()
+
+def fill(db, paragraphs):
+    rng = random.Random(162)
+    c = db.conn.cursor()
+    c.execute('BEGIN')
+    c.executemany('INSERT INTO toc (id, parent_id, slug, title, position) '
+                  'VALUES (?, ?, ?, ?, ?)',
+                  ((i, i // 10 if i else None, 'page-%d' % i, 'Page %d' % i, i)
+                   for i in range(paragraphs // 100 + 1)))
+    c.executemany("""
+    INSERT INTO content (parent_id, position, content) VALUES (?, ?, ?)
+    """, ((i // 100, i, ' '.join(rng.choice(words) for _ in range(40)))
+          for i in range(paragraphs)))
+    c.execute('COMMIT')
+
+def timed(function, *args):
+    start = time.perf_counter()
+    pages, paragraphs = function(*args)
+    seconds = time.perf_counter() - start
+    return '%d pages, %d paragraphs in %.2f s (%.0f paragraphs/s)' % (
+        pages, paragraphs, seconds, paragraphs / seconds)
+
+def main():
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        with DbPlainText(str(tmp / 'a.db')) as db:
+            fill(db, paragraphs)
+            print('export', timed(db.export_to, tmp / 'notes'))
+        with DbPlainText(str(tmp / 'b.db')) as db:
+            print('import', timed(db.import_from, tmp / 'notes'))
+    print('peak memory %.1f MB' % (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+if __name__ == '__main__':
+    main()
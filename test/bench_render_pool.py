@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Serial vs. process-pool compilation of pages of different sizes.
+The crossover tells where `render_pool_threshold` should be.
+Usage: bench_render_pool.py [workers]"""
+
+from pathlib import Path
+import os
+import sys
+import time
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+
+from application import app
+from parsing import new_parser
+from fragments import parse_fragments, compile_fragments
+from render_pool import RenderPool
+
+def load_pairs(n):
+    units = sorted((res_dir / 'test/units').glob('*.scrbl'))
+    texts = [path.read_text() for path in units]
+    return [(texts[i % len(texts)], i) for i in range(n)]
+
+def serial(pairs, engine):
+    parser = new_parser('bench', engine)
+    fragments, parser_acc = parse_fragments(parser, pairs)
+    compile_fragments(fragments, parser_acc)
+
+def parallel(pairs, pool):
+    fragments, parser_acc = pool.parse_fragments('bench', pairs)
+    pool.compile_fragments(fragments, parser_acc)
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    print('%d workers' % workers)
+    for engine in ('pyparsing', 'pda'):
+        pool = RenderPool(workers, 0, engine)
+        with app.test_request_context():
+            parallel(load_pairs(workers), pool)  # start the workers
+            for n in (2, 10, 50, 200, 1000, 2000):
+                pairs = load_pairs(n)
+                chars = sum(len(string) for string, _ in pairs)
+                print('%-10s %5d paragraphs %8d chars '
+                      'serial %9.2f ms pool %9.2f ms' % (
+                          engine, n, chars,
+                          timed(serial, pairs, engine) * 1000,
+                          timed(parallel, pairs, pool) * 1000
+                      ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Save latency after pasting many paragraphs into a page: the bulk
+`patch_page` vs. statements for each paragraph, and the whole save with
+rendering. Compiling the bytecode of the new
+paragraphs is part of both patch times.
+Usage: bench_save.py [engine]"""
+
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+sys.path.append(str(res_dir / 'test'))
+
+from sqlite3 import IntegrityError
+from werkzeug.datastructures import MultiDict
+from application import app
+from page_edit import EditPageDbWriter, POSITION_GAP
+from programs import DbBytecode
+from parsing import new_parser
+import import_test_data
+
+# lo: the position to insert after (NULL for the front)
+# hi: the position of the paragraph that follows (NULL for the end)
+insert_query = """
+INSERT INTO content (parent_id, position, content)
+SELECT :pid, CASE
+       WHEN lo IS NULL AND hi IS NULL THEN :gap
+       WHEN hi IS NULL THEN lo + :gap
+       WHEN lo IS NULL THEN hi - :gap
+       ELSE (lo + hi) / 2
+       END, :content
+FROM (SELECT lo, (
+    SELECT min(position) FROM content
+    WHERE parent_id = :pid AND position > coalesce(lo, -9223372036854775808)
+) AS hi FROM (
+    SELECT (
+        SELECT position FROM content
+        WHERE id = :after AND parent_id = :pid
+    ) AS lo
+))
+WHERE (:after IS NULL OR lo IS NOT NULL)
+AND (lo IS NULL OR hi IS NULL OR hi - lo >= 2)
+"""
+
+class OneByOne(EditPageDbWriter):
+    """How patch_page used to work: statements for each paragraph"""
+    def patch_page(self, c, patch):
+        content_ids = (pair[1] for pair in self.content_pair_iter())
+        last_id = None
+        inserted = []
+        for action, operand in patch:
+            if action == '+':
+                last_id = self.insert_paragraph(c, last_id, operand)
+                inserted.append((operand, last_id))
+            elif action == '-':
+                self.delete_paragraph(c, next(content_ids))
+            else:
+                last_id = next(content_ids)
+        return inserted
+
+    def delete_paragraph(self, c, paragraph_id):
+        c.execute('DELETE FROM content WHERE id = ? AND parent_id = ?',
+                  (paragraph_id, self.page_id))
+        if c.rowcount != 1:
+            raise IntegrityError('Row DNE')
+
+    def insert_paragraph(self, c, after_content_id, content):
+        """Inserts after the paragraph, or at the front if None.
+        Returns the id of the new paragraph."""
+        params = {'pid': self.page_id, 'after': after_content_id,
+                  'gap': POSITION_GAP, 'content': content}
+        c.execute(insert_query, params)
+        if c.rowcount != 1:
+            # no room between the neighbours
+            self.renumber(c)
+            c.execute(insert_query, params)
+        # bytecode.content_id is the rowid, so this keeps last_insert_rowid()
+        c.execute('SELECT last_insert_rowid()')
+        content_id = c.fetchone()[0]
+        asm = DbBytecode.write_program(c, content_id, content)
+        if asm is not None:
+            self.programs.put(content_id, asm, content)
+        return content_id
+
+    def renumber(self, c):
+        c.execute("""
+        SELECT id FROM content WHERE parent_id = ? AND position IS NOT NULL
+        ORDER BY position
+        """, (self.page_id,))
+        ids = [row[0] for row in c.fetchall()]
+        c.executemany('UPDATE content SET position = ? WHERE id = ?',
+                      (((i + 1) * POSITION_GAP, content_id)
+                       for i, content_id in enumerate(ids)))
+
+def pasted_texts(writer, n):
+    units = sorted((res_dir / 'test/units').glob('*.scrbl'))
+    texts = [path.read_text() for path in units]
+    with writer.auto_rollback() as c:
+        writer.register(c, 'home')
+    old = [text for text, _ in writer.content_pair_iter()]
+    pasted = ['%s\n\n%d' % (texts[i % len(texts)], i) for i in range(n)]
+    return old[:1] + pasted + old[1:]
+
+def time_patch(cls, db_uri, n):
+    """Rolled back afterwards, so that every run starts from the same page"""
+    with cls(db_uri) as writer:
+        texts = pasted_texts(writer, n)
+        c = writer.conn.cursor()
+        c.execute('BEGIN')
+        try:
+            writer.register(c, 'home')
+            patch = list(writer.generate_patch(texts))
+            start = time.perf_counter()
+            writer.patch_page(c, patch)
+            return time.perf_counter() - start
+        finally:
+            c.execute('ROLLBACK')
+
+def time_save(db_uri, n, engine):
+    with EditPageDbWriter(db_uri) as writer:
+        texts = pasted_texts(writer, n)
+        with writer.auto_rollback() as c:
+            c.execute("SELECT content_lock FROM toc WHERE slug = 'home'")
+            lock = c.fetchone()[0] or ''
+        form = MultiDict([('old_slug', 'home'), ('new_slug', 'home'),
+                          ('title', 'Home'), ('content_lock', lock)] +
+                         [('text', text) for text in texts])
+        start = time.perf_counter()
+        with app.test_request_context():
+            writer.handle_change(form, new_parser('home', engine))
+        return time.perf_counter() - start
+
+def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'pda'
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (10, 100, 300, 1000):
+            db_uri = str(Path(tmp) / ('bench-%d.db' % n))
+            import_test_data.prepare(db_uri)
+            import_test_data.db.close()
+            print('%5d paragraphs  one by one %8.2f ms  bulk %8.2f ms  '
+                  'whole save (%s) %8.2f ms' % (
+                      n,
+                      time_patch(OneByOne, db_uri, n) * 1000,
+                      time_patch(EditPageDbWriter, db_uri, n) * 1000,
+                      engine, time_save(db_uri, n, engine) * 1000
+                  ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Search time on a notebook with many paragraphs.
+Usage: bench_search.py [paragraphs]"""
+
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+
+from page_search import DbSearch
+
+words = ('ring unit ideal field group norm prime integer element '
+         'module algebra kernel image homomorphism').split()
+
+def fill(db, paragraphs):
+    rng = random.Random(162)
+    c = db.conn.cursor()
+    c.execute('BEGIN')
+    c.executemany('INSERT INTO toc (id, slug, title) VALUES (?, ?, ?)',
+                  ((i, 'page-%d' % i, 'Page %d' % i)
+                   for i in range(paragraphs // 100 + 1)))
+    c.executemany("""
+    INSERT INTO content (id, parent_id, next_id, content) VALUES (?, ?, ?, ?)
+    """, ((i, i // 100, None, ' '.join(rng.choice(words) for _ in range(40)))
+          for i in range(paragraphs)))
+    c.execute('COMMIT')
+
+def main():
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        with DbSearch(str(Path(tmp) / 'bench.db')) as db:
+            start = time.perf_counter()
+            fill(db, paragraphs)
+            print('%d paragraphs indexed in %.2f s' % (
+                paragraphs, time.perf_counter() - start))
+            for query in ('page 42', 'ideal kernel', 'unit'):
+                after = None
+                for page in range(3):
+                    start = time.perf_counter()
+                    results = db.search(query, after)
+                    print('%-14s page %d %8.2f ms' % (
+                        query, page, (time.perf_counter() - start) * 1000))
+                    after = (results[-1].rank, results[-1].content_id)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Throughput of the tokenizers: pyparsing vs. regex (for `Parser`), and
+per-character vs. bulk mode (for the PDA)"""
+
+from pathlib import Path
+import sys
+import timeit
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+
+from parsing import TOKENIZERS
+from tokenizing import tokenize
+
+tokenizers = dict(TOKENIZERS)
+tokenizers['pda-char'] = lambda s: tokenize(s, bulk=False)
+tokenizers['pda-bulk'] = lambda s: tokenize(s, bulk=True)
+
+def load_units(repeat):
+    units = sorted((res_dir / 'test/units').glob('*.scrbl'))
+    text = '\n\n'.join(path.read_text() for path in units)
+    return '\n\n'.join([text] * repeat)
+
+# lecture notes are mostly words, with a formula here and there
+prose = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do '
+         'eiusmod tempor @math{x^2 + y^2} incididunt ut labore et dolore.\n'
+         '  Ut enim ad minim veniam, quis nostrud exercitation.\n\n')
+
+def main():
+    inputs = [load_units(repeat) for repeat in (1, 10, 100)]
+    inputs.append(prose * 1000)
+    for text in inputs:
+        repeat = len(text) // 2000 + 1
+        for name, function in sorted(tokenizers.items()):
+            number = max(1, 100 // repeat)
+            seconds = timeit.timeit(lambda: list(function(text)),
+                                    number=number) / number
+            print('%-10s %8d chars %10.2f ms %10.2f MB/s' % (
+                name, len(text), seconds * 1000, len(text) / seconds / 1e6
+            ))
+
+if __name__ == '__main__':
+    main()
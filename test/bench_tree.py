@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Moving, trashing, restoring and deleting a big branch of the page tree.
+The branch is a bushy tree of pages under "math", with a few paragraphs on
+each page. Usage: bench_tree.py [pages]"""
+
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+sys.path.append(str(res_dir / 'test'))
+
+from page_edit_tree import DbEditTree
+import import_test_data
+
+FANOUT = 8
+PARAGRAPHS = 3
+
+def grow(db, n):
+    """Adds n pages under "math", FANOUT children per page"""
+    c = db.conn.cursor()
+    c.execute('BEGIN')
+    c.execute('SELECT max(id) FROM toc')
+    first = c.fetchone()[0] + 1
+    c.executemany("""
+    INSERT INTO toc (id, parent_id, slug, title, position) VALUES (?, ?, ?, ?, ?)
+    """, ((first + i, 1 if i < FANOUT else first + i // FANOUT - 1,
+           'page-%d' % i, 'Page %d' % i, (i % FANOUT + 1) * 1024)
+          for i in range(n)))
+    c.executemany("""
+    INSERT INTO content (parent_id, position, content) VALUES (?, ?, ?)
+    """, ((first + i, (j + 1) * 1024, 'Paragraph %d of page %d' % (j, i))
+          for i in range(n) for j in range(PARAGRAPHS)))
+    c.execute('COMMIT')
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    print('%-10s %8.2f ms' % (label, (time.perf_counter() - start) * 1000))
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_uri = str(Path(tmp) / 'bench.db')
+        import_test_data.prepare(db_uri)
+        import_test_data.db.close()
+        with DbEditTree(db_uri) as db:
+            grow(db, n)
+            print('%d pages under "math", %d paragraphs each' %
+                  (n, PARAGRAPHS))
+            timed('move', db.move_page, 'math')
+            timed('move back', db.move_page, 'math', 'home')
+            timed('trash', db.recycle_page, 'math')
+            timed('restore', db.restore_page, 'math')
+            timed('delete', db.delete_page, 'math')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Requests per second of /view on the test data, in one thread and in
+several threads (like the threaded development server).
+Usage: bench_view.py [seconds]"""
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import tempfile
+import time
+
+res_dir = Path(__file__).absolute().parent.parent
+sys.path.append(str(res_dir))
+sys.path.append(str(res_dir / 'test'))
+
+import application
+import import_test_data
+
+config_keys = ('tokenizer', 'parser', 'stream_view', 'render_workers',
+               'render_pool_threshold', 'read_only_view')
+
+def run(client, urls, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for url in urls:
+            assert client.get(url).status_code == 200
+            count += 1
+    return count
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    urls = ['/view?:=home', '/view?:=units-of-zi']
+    with tempfile.TemporaryDirectory() as tmp:
+        db_uri = str(Path(tmp) / 'bench.db')
+        import_test_data.prepare(db_uri)
+        import_test_data.db.close()
+        config = dict.fromkeys(config_keys)
+        config['db_uri'] = db_uri
+        application.app_config = config
+
+        client = application.app.test_client()
+        run(client, urls, 0.5)  # fill the fragment store
+        count = run(client, urls, seconds)
+        print('1 thread  %8.1f requests/s' % (count / seconds))
+
+        threads = 4
+        with ThreadPoolExecutor(threads) as executor:
+            futures = [executor.submit(run, application.app.test_client(),
+                                       urls, seconds)
+                       for _ in range(threads)]
+            count = sum(f.result() for f in futures)
+        print('%d threads %8.1f requests/s' % (threads, count / seconds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import pytest
+import import_test_data
+import application
+
+config_keys = ('tokenizer', 'parser', 'stream_view', 'render_workers',
+               'render_pool_threshold', 'read_only_view', 'backup_dir',
+               'backup_keep')
+
+@pytest.fixture
+def db_uri(tmp_path):
+    """A new database with the test data"""
+    db_uri = str(tmp_path / 'test.db')
+    import_test_data.prepare(db_uri).close()
+    yield db_uri
+
+@pytest.fixture
+def app_config(db_uri):
+    """application.app_config for `db_uri`, with every other key unset.
+    The old config is put back afterwards."""
+    old_config = application.app_config
+    config = dict.fromkeys(config_keys)
+    config['db_uri'] = db_uri
+    application.app_config = config
+    yield config
+    application.app_config = old_config
@@ -26,11 +26,10 @@ class DbTest(sqlops.Db):
         c = self.conn.cursor()
         c.execute('BEGIN')
         for i, s in enumerate(content):
-            next_id = i + id_start + 1 if i < len(content) - 1 else None
             c.execute("""
-            INSERT INTO content (id, next_id, parent_id, content)
+            INSERT INTO content (id, position, parent_id, content)
             VALUES (?, ?, ?, ?)
-            """, (i + id_start, next_id, for_id, s))
+            """, (i + id_start, (i + 1) * 1024, for_id, s))
         c.execute('COMMIT')
 
     def import_test_data(self):
@@ -45,11 +44,12 @@ class DbTest(sqlops.Db):
 db = None
 
 def prepare(uri):
-    """Create tables and import test data"""
+    """Create tables and import test data. Returns the open database."""
     global db
     db = DbTest(uri)
     db.create_tables()
     db.import_test_data()
+    return db
 
 if __name__ == '__main__':
     db_path = res_dir / 'test/test.db'
@@ -0,0 +1,29 @@
+import pytest
+from backlinks import DbLinks
+from parsing import new_parser
+
+@pytest.fixture
+def db():
+    db = DbLinks(':memory:')
+    db.conn.executescript("""
+    INSERT INTO toc (id, slug, title, unlisted)
+    VALUES (1, 'home', 'Home', 0), (2, 'other', 'Other', 0),
+           (3, 'secret', 'Secret', 1);
+    INSERT INTO content (id, parent_id, next_id, content)
+    VALUES (10, 1, 11, 'See @page{other}'),
+           (11, 1, NULL, '@page{other} and @page{home}'),
+           (20, 2, NULL, '@page{home}'),
+           (30, 3, NULL, '@page{home}');
+    """)
+    yield db
+    db.close()
+
+def test_rebuild(db):
+    assert db.rebuild_links(new_parser) == 5
+    assert db.get_backlinks(1, 'home') == [('Other', '?:=other')]
+    assert db.get_backlinks(2, 'other') == [('Home', '?:=home')]
+
+def test_deleted_paragraph(db):
+    db.rebuild_links(new_parser)
+    db.conn.execute('DELETE FROM content WHERE id = 20')
+    assert db.get_backlinks(1, 'home') == []
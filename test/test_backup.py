@@ -0,0 +1,48 @@
+import pytest
+import sqlite3
+import application
+import backup
+
+def count_content(path):
+    conn = sqlite3.connect(str(path))
+    try:
+        return conn.execute('SELECT count(*) FROM content').fetchone()[0]
+    finally:
+        conn.close()
+
+def test_backup(db_uri, tmp_path):
+    path = backup.backup(db_uri, tmp_path, pages=1, pause=0)
+    assert path.parent == tmp_path
+    assert count_content(path) == count_content(db_uri)
+    assert not list(tmp_path.glob('*.partial'))
+
+def test_same_second(db_uri, tmp_path, monkeypatch):
+    monkeypatch.setattr(backup.time, 'time', lambda: 1000000000.5)
+    paths = [backup.backup(db_uri, tmp_path, pause=0) for _ in range(2)]
+    assert paths[0] != paths[1]
+    assert backup.list_backups(db_uri, tmp_path) == paths
+
+def test_rotate(db_uri, tmp_path):
+    for i in range(5):
+        name = backup.backup_name(db_uri, 1000000000 + i)
+        (tmp_path / name).write_bytes(b'')
+    # a database with a similar name, in the same directory
+    others = ['test-old-20000101-000000.db', 'test-20000101-000000.db-wal',
+              'test-20000101-000000-copy.db']
+    for name in others:
+        (tmp_path / name).write_bytes(b'')
+    deleted = backup.rotate(db_uri, tmp_path, 2)
+    assert len(deleted) == 3
+    assert all((tmp_path / name).exists() for name in others)
+    assert [p.name for p in backup.list_backups(db_uri, tmp_path)] == \
+        [backup.backup_name(db_uri, 1000000000 + i) for i in (3, 4)]
+
+def test_endpoint(app_config, db_uri, tmp_path):
+    app_config['backup_keep'] = 1
+    client = application.app.test_client()
+    assert client.post('/backup').status_code == 404
+    app_config['backup_dir'] = str(tmp_path / 'backups')
+    (tmp_path / 'backups').mkdir()
+    for _ in range(2):
+        assert client.post('/backup').status_code == 200
+    assert len(backup.list_backups(db_uri, tmp_path / 'backups')) == 1
@@ -0,0 +1,49 @@
+import pytest
+import sqlite3
+from sqlops import Db, get_pool, configure, PRAGMA_KEYS
+
+def test_reuse(tmp_path):
+    address = str(tmp_path / 'pool.db')
+    with Db(address) as db:
+        conn = db.conn
+    with Db(address) as db:
+        assert db.conn is conn
+        with Db(address) as other:
+            assert other.conn is not conn
+    assert len(get_pool(address).idle) == 2
+
+def test_release_open_transaction(tmp_path):
+    address = str(tmp_path / 'pool.db')
+    db = Db(address)
+    c = db.conn.cursor()
+    c.execute('BEGIN')
+    c.execute("INSERT INTO toc (id, slug, title) VALUES (1, 'a', 'A')")
+    db.close()
+    with Db(address) as db:
+        assert not db.conn.in_transaction
+        assert db.conn.execute('SELECT count(*) FROM toc').fetchone()[0] == 0
+
+def test_memory_is_not_shared():
+    with Db(':memory:') as db:
+        db.conn.execute("INSERT INTO toc (id, slug, title) VALUES (1, 'a', 'A')")
+    with Db(':memory:') as db:
+        assert db.conn.execute('SELECT count(*) FROM toc').fetchone()[0] == 0
+
+def test_pragmas(tmp_path):
+    address = str(tmp_path / 'pool.db')
+    config = dict.fromkeys(PRAGMA_KEYS)
+    config.update(journal_mode='wal', busy_timeout=1234)
+    configure(address, config)
+    with Db(address) as db:
+        assert db.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.conn.execute('PRAGMA busy_timeout').fetchone()[0] == 1234
+
+def test_read_only(tmp_path):
+    address = str(tmp_path / 'pool.db')
+    with Db(address, readonly=True) as db:
+        with pytest.raises(sqlite3.OperationalError):
+            db.conn.execute("INSERT INTO toc (id, slug, title) "
+                            "VALUES (1, 'a', 'A')")
+        with db.write_transaction() as c:
+            c.execute("INSERT INTO toc (id, slug, title) VALUES (1, 'a', 'A')")
+        assert db.conn.execute('SELECT count(*) FROM toc').fetchone()[0] == 1
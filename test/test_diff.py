@@ -8,3 +8,13 @@ def test_lcs():
     assert lcs('ABCDEF', 'D') == 1
     assert lcs('', 'ABCD') == 0
     assert lcs('AaAaAa', '') == 0
+
+def test_long_diff():
+    # deeper than the recursion limit
+    old = ['p%d' % i for i in range(1200)]
+    new = old[:600] + ['pasted'] + old[601:]
+    assert list(print_diff(old, new)) == (
+        [(' ', line) for line in old[:600]] +
+        [('-', 'p600'), ('+', 'pasted')] +
+        [(' ', line) for line in old[601:]]
+    )
@@ -0,0 +1,41 @@
+import pytest
+from fragments import DbFragment, Fragment
+from parsing import Cons, ParserAcc
+
+@pytest.fixture
+def db():
+    db = DbFragment(':memory:')
+    db.conn.executescript("""
+    INSERT INTO toc (id, slug, title, first_content_id)
+    VALUES (1, 'home', 'Home', 10), (2, 'other', 'Other', NULL);
+    INSERT INTO content (id, parent_id, next_id, content)
+    VALUES (10, 1, 11, 'See @page{other}'), (11, 1, NULL, 'Plain');
+    """)
+    acc = ParserAcc()
+    acc.put_title('other', 'Other')
+    fragments = [Fragment(10, 'See @page{other}', Cons('p', []),
+                          frozenset(['other'])),
+                 Fragment(11, 'Plain', Cons('p', []), frozenset())]
+    fragments[0].html = '<a>Other</a>'
+    fragments[1].html = '<span>Plain</span>'
+    db.store_fragments(fragments, acc)
+    yield db
+    db.close()
+
+pairs = [('See @page{other}', 10), ('Plain', 11)]
+
+def test_hit(db):
+    assert db.load_fragments(1, pairs) == {10: '<a>Other</a>',
+                                           11: '<span>Plain</span>'}
+
+def test_text_changed(db):
+    changed = [('See @page{other}', 10), ('Plain!', 11)]
+    assert db.load_fragments(1, changed) == {10: '<a>Other</a>'}
+
+def test_title_changed(db):
+    db.conn.execute("UPDATE toc SET title = 'New' WHERE slug = 'other'")
+    assert db.load_fragments(1, pairs) == {11: '<span>Plain</span>'}
+
+def test_page_deleted(db):
+    db.conn.execute("DELETE FROM toc WHERE slug = 'other'")
+    assert db.load_fragments(1, pairs) == {11: '<span>Plain</span>'}
@@ -0,0 +1,83 @@
+import pytest
+import sqlite3
+import migrations
+from sqlops import Db, read_schema
+
+@pytest.fixture
+def db():
+    db = Db(':memory:')
+    yield db
+    db.close()
+
+def plan(db, sql, params=()):
+    rows = db.conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    return [row[-1] for row in rows]
+
+def full_scans(db, sql, params=()):
+    # scanning a CTE is fine, scanning a table is not
+    return [line for line in plan(db, sql, params)
+            if line.startswith(('SCAN toc', 'SCAN content'))]
+
+def test_version(db):
+    c = db.conn.cursor()
+    assert migrations.read_version(c) == migrations.latest_version()
+    assert migrations.migrate(db.conn) == 0
+
+def test_old_database():
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    conn.executescript(read_schema())
+    assert migrations.migrate(conn) == len(migrations.MIGRATIONS)
+    assert migrations.migrate(conn) == 0
+    conn.close()
+
+def test_linked_list_to_position():
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    conn.executescript(read_schema())
+    conn.executescript("""
+    INSERT INTO toc (id, slug, title, first_content_id)
+    VALUES (1, 'a', 'A', 12), (2, 'b', 'B', NULL);
+    INSERT INTO content (id, parent_id, next_id, content)
+    VALUES (10, 1, NULL, 'last'), (11, 1, 10, 'middle'),
+           (12, 1, 11, 'first'), (13, 1, NULL, 'unreachable');
+    """)
+    migrations.migrate(conn)
+    rows = conn.execute("""
+    SELECT content FROM content WHERE parent_id = 1 AND position IS NOT NULL
+    ORDER BY position
+    """).fetchall()
+    assert rows == [('first',), ('middle',), ('last',)]
+    conn.close()
+
+def test_linked_list_to_closure():
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    conn.executescript(read_schema())
+    conn.executescript("""
+    INSERT INTO toc (id, parent_id, next_id, first_child_id, slug, title)
+    VALUES (1, NULL, NULL, 2, 'root', 'Root'), (4, 1, NULL, 5, 'c', 'C'),
+           (3, 1, 4, NULL, 'b', 'B'), (2, 1, 3, NULL, 'a', 'A'),
+           (5, 4, NULL, NULL, 'd', 'D'), (6, 1, NULL, NULL, 'lost', 'Lost');
+    """)
+    migrations.migrate(conn)
+    rows = conn.execute("SELECT slug FROM toc WHERE parent_id = 1 "
+                        "ORDER BY position").fetchall()
+    assert rows == [('a',), ('b',), ('c',), ('lost',)]
+    rows = conn.execute("SELECT ancestor, depth FROM toc_closure "
+                        "WHERE descendant = 5 ORDER BY depth").fetchall()
+    assert rows == [(5, 0), (4, 1), (1, 2)]
+    conn.close()
+
+@pytest.mark.parametrize('query', [
+    'SELECT id, content FROM content WHERE parent_id = ? '
+    'AND position IS NOT NULL ORDER BY position',
+    'SELECT min(position) FROM content WHERE parent_id = ? AND position > 1',
+    'SELECT id FROM toc WHERE parent_id = ?',
+    'SELECT descendant FROM toc_closure WHERE ancestor = ? AND depth >= 0',
+    'SELECT ancestor FROM toc_closure WHERE descendant = ? ORDER BY depth',
+])
+def test_content_queries(db, query):
+    assert full_scans(db, query, (1,)) == []
+
+def test_linked_list_indexes(db):
+    assert db.conn.execute(
+        "SELECT name FROM sqlite_master WHERE name LIKE '%next_id'"
+    ).fetchall() == []
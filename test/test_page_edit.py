@@ -0,0 +1,117 @@
+import pytest
+import sqlite3
+import application
+from page_edit import EditPageDbWriter, plan_positions
+from page_view import DbTree
+from sqlops import Content
+
+@pytest.fixture(params=['pyparsing', 'pda'])
+def client(request, app_config):
+    app_config['parser'] = request.param
+    app_config['read_only_view'] = True
+    conn = sqlite3.connect(app_config['db_uri'])
+    yield application.app.test_client(), conn
+    conn.close()
+
+def save(client, texts):
+    return client.post('/edit', data={
+        'button': 'submit', 'old_slug': 'home', 'new_slug': 'home',
+        'title': 'Home', 'content_lock': '', 'text': texts
+    })
+
+def test_render_on_write(client):
+    client, conn = client
+    old = conn.execute('SELECT content FROM content WHERE parent_id = 0 '
+                       'ORDER BY id LIMIT 1').fetchone()[0]
+    response = save(client, [old, 'New @page{math}'])
+    assert response.status_code == 302
+    assert '/view' in response.headers['Location']
+
+    # only the new paragraph is rendered
+    rows = conn.execute("""
+    SELECT content, html FROM fragment
+    INNER JOIN content ON content.id = fragment.content_id
+    """).fetchall()
+    assert len(rows) == 1
+    assert rows[0][0] == 'New @page{math}'
+    assert '?:=math"' in rows[0][1]
+    assert 'class="dne"' not in rows[0][1]
+    assert conn.execute('SELECT slug, title FROM fragment_dep').fetchall() \
+        == [('math', 'Math')]
+
+def test_markup_error(client):
+    client, conn = client
+    response = save(client, ['Good', 'Line 1\nLine 2 @bold{'])
+    content_id = conn.execute("SELECT id FROM content "
+                              "WHERE content LIKE 'Line 1%'").fetchone()[0]
+    location = response.headers['Location']
+    assert '/edit' in location
+    assert '&id=%d&' % content_id in location
+    assert location.endswith('&line=2')
+
+def test_backlinks(client):
+    client, conn = client
+    save(client, ['See @page{math}'])
+    assert conn.execute('SELECT from_page, to_slug FROM links').fetchall() \
+        == [(0, 'math')]
+    html = client.get('/view?:=math').data.decode('utf-8')
+    assert 'What links here' in html
+    assert 'href="?:=home"' in html
+
+def test_math_catalogue(client):
+    client, conn = client
+    save(client, ['Units of @math{\\Z [i]}'])
+    response = client.get('/math?tex=%5CZ%5Bi%5D')
+    results = response.get_json()['results']
+    assert len(results) == 1
+    assert results[0]['title'] == 'Home'
+    assert client.get('/math?tex=%5CZ&prefix=1').get_json()['results'] == \
+        results
+
+def test_read_only_view(client):
+    client, conn = client
+    conn.execute('DELETE FROM fragment')
+    conn.commit()
+    assert client.get('/view?:=units-of-zi').status_code == 200
+    # the fragments are written on a separate connection
+    assert conn.execute('SELECT count(*) FROM fragment').fetchone()[0] == 6
+
+@pytest.fixture
+def writer(db_uri):
+    with EditPageDbWriter(db_uri) as db:
+        db.page_id = 0
+        yield db
+
+def paragraphs(writer):
+    page_info = Content()
+    with writer.auto_rollback() as c:
+        DbTree._load_content(c, 0, page_info)
+    return list(page_info.content_list_iter())
+
+def patch(writer, texts):
+    with writer.auto_rollback() as c:
+        writer.register(c, 'home')
+        return writer.patch_page(c, writer.generate_patch(texts))
+
+def test_plan_positions():
+    assert plan_positions([None, None]) == [1024, 2048]
+    assert plan_positions([None, 1024, None]) == [0, 1024, 2048]
+    assert plan_positions([10, None, None, 16]) == [10, 12, 14, 16]
+    assert plan_positions([10, None, None, 12]) == [1024, 2048, 3072, 4096]
+
+def test_bulk_patch(writer):
+    old = paragraphs(writer)
+    pasted = ['Pasted %d' % i for i in range(300)]
+    texts = old[:1] + pasted + old[2:]
+    inserted = patch(writer, texts)
+    assert [text for text, _ in inserted] == pasted
+    assert paragraphs(writer) == texts
+    # no room between the pasted paragraphs any more
+    texts = texts[:10] + ['Squeezed %d' % i for i in range(5)] + texts[10:]
+    patch(writer, texts)
+    assert paragraphs(writer) == texts
+    with writer.auto_rollback() as c:
+        # the paragraphs from test_data.sql have no bytecode
+        c.execute('SELECT count(*) FROM bytecode WHERE content_id IN '
+                  '(SELECT id FROM content WHERE parent_id = 0)')
+        assert c.fetchone()[0] == len(pasted) + 5
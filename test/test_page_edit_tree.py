@@ -0,0 +1,117 @@
+import pytest
+import sqlite3
+import application
+from page_edit_tree import DbEditTree, TRASH
+from title_index import get_title_index
+
+@pytest.fixture
+def db(app_config):
+    with DbEditTree(app_config['db_uri']) as db:
+        db.conn.execute("INSERT INTO toc (id, parent_id, slug, title, "
+                        "position) VALUES (3, 0, 'physics', 'Physics', 2048)")
+        yield db
+
+def parent_of(db, slug):
+    return db.conn.execute(
+        'SELECT parent.slug, toc.position FROM toc '
+        'LEFT JOIN toc AS parent ON parent.id = toc.parent_id '
+        'WHERE toc.slug = ?', (slug,)
+    ).fetchone()[:]
+
+def ancestors(db, slug):
+    return [row[0] for row in db.conn.execute(
+        'SELECT toc.slug FROM toc_closure '
+        'INNER JOIN toc ON toc.id = toc_closure.ancestor '
+        'WHERE descendant = (SELECT id FROM toc WHERE slug = ?) '
+        'ORDER BY depth', (slug,)
+    )]
+
+def count(db, query):
+    return db.conn.execute(query).fetchone()[0]
+
+def test_trash_and_restore(db):
+    before = parent_of(db, 'math')
+    db.recycle_page('math')
+    assert ancestors(db, 'units-of-zi') == ['units-of-zi', 'math', TRASH]
+    with pytest.raises(sqlite3.IntegrityError):
+        db.recycle_page('units-of-zi')
+    with pytest.raises(sqlite3.IntegrityError):
+        db.restore_page('units-of-zi')
+    db.restore_page('math')
+    assert parent_of(db, 'math') == before
+    assert ancestors(db, 'units-of-zi') == ['units-of-zi', 'math', 'home']
+    assert count(db, 'SELECT count(*) FROM trash') == 0
+
+def test_restore_without_parent(db):
+    db.recycle_page('units-of-zi')
+    db.recycle_page('math')
+    db.restore_page('units-of-zi')
+    assert parent_of(db, 'units-of-zi')[0] is None
+    db.recycle_page('units-of-zi')
+    assert db.empty_trash() == 2
+    assert count(db, "SELECT count(*) FROM toc WHERE slug = '%s'" % TRASH) == 1
+    assert count(db, 'SELECT count(*) FROM trash') == 0
+
+def test_delete(db):
+    db.conn.execute("INSERT INTO links (from_page, from_content, to_slug) "
+                    "VALUES (2, 100, 'home')")
+    assert db.delete_page('math') == 2
+    assert count(db, 'SELECT count(*) FROM toc') == 2
+    assert count(db, 'SELECT count(*) FROM content WHERE parent_id = 2') == 0
+    assert count(db, 'SELECT count(*) FROM links') == 0
+    assert count(db, 'SELECT count(*) FROM toc_closure '
+                     'WHERE ancestor IN (1, 2) OR descendant IN (1, 2)') == 0
+    assert count(db, "SELECT count(*) FROM search "
+                     "WHERE search MATCH 'title:units'") == 0
+
+def test_move(db):
+    db.move_page('math', 'physics')
+    assert parent_of(db, 'math') == ('physics', 1024)
+    assert ancestors(db, 'units-of-zi') == \
+        ['units-of-zi', 'math', 'physics', 'home']
+    with pytest.raises(sqlite3.IntegrityError):
+        db.move_page('physics', 'units-of-zi')
+    with pytest.raises(sqlite3.IntegrityError):
+        db.move_page(TRASH, 'home')
+    db.move_page('math')
+    assert parent_of(db, 'math') == (None, 1024)
+
+@pytest.mark.parametrize('change', [
+    lambda db: db.move_page('math', 'physics'),
+    lambda db: db.recycle_page('math'),
+    lambda db: db.restore_page('units-of-zi'),
+    lambda db: db.delete_page('units-of-zi'),
+    lambda db: db.empty_trash(),
+])
+def test_title_index(db, change):
+    db.recycle_page('units-of-zi')
+    index = get_title_index(db.address)
+    index.reload(db.conn.cursor())
+    change(db)
+    assert index.generation is None
+
+def test_endpoint(db):
+    client = application.app.test_client()
+    response = client.post('/tree', data={':': 'math', 'action': 'trash'})
+    assert response.status_code == 302
+    assert ancestors(db, 'math') == ['math', TRASH]
+    response = client.post('/tree', data={':': 'math', 'action': 'nothing'})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('form, message', [
+    ({':': 'home', 'action': 'move', 'parent_slug': 'math'},
+     b'A page cannot be moved under itself'),
+    ({':': 'math', 'action': 'restore'}, b'The page is not in the trash'),
+    ({':': 'physics', 'action': 'move', 'parent_slug': 'units-of-zi'},
+     b'Cannot move pages into the trash'),
+    ({':': 'nowhere', 'action': 'trash'}, b'No such page: nowhere'),
+    ({':': 'math', 'action': 'move', 'parent_slug': 'nowhere'},
+     b'No such page: nowhere'),
+])
+def test_endpoint_errors(db, form, message):
+    db.recycle_page('units-of-zi')
+    client = application.app.test_client()
+    response = client.post('/tree', data=form)
+    assert response.status_code == 400
+    assert response.data == message
+    assert ancestors(db, 'math') == ['math', 'home']
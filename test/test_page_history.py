@@ -0,0 +1,76 @@
+import pytest
+import random
+import application
+from werkzeug.datastructures import MultiDict
+from diff import print_diff
+from page_edit import EditPageDbWriter
+from page_history import DbHistory, encode_delta, apply_delta, SNAPSHOT_EVERY
+
+def test_delta():
+    rng = random.Random(162)
+    for _ in range(500):
+        old = [rng.choice('abcd') for _ in range(rng.randint(0, 8))]
+        new = [rng.choice('abcd') for _ in range(rng.randint(0, 8))]
+        assert apply_delta(old, encode_delta(print_diff(old, new))) == new
+
+def save(db_uri, texts):
+    with EditPageDbWriter(db_uri) as db, \
+         application.app.test_request_context():
+        c = db.conn.cursor()
+        c.execute("SELECT content_lock FROM toc WHERE slug = 'home'")
+        lock = c.fetchone()[0] or ''
+        db.handle_change(MultiDict(
+            [('old_slug', 'home'), ('new_slug', 'home'), ('title', 'Home'),
+             ('content_lock', lock)] + [('text', text) for text in texts]
+        ))
+
+def test_revisions(db_uri):
+    rng = random.Random(162)
+    texts = ['First paragraph', 'Second paragraph', 'Third paragraph',
+             'Fourth paragraph']
+    saved = [list(texts)]
+    for i in range(40):
+        texts.insert(rng.randint(0, len(texts)), 'Edit %d' % i)
+        if rng.random() < 0.3:
+            texts.pop(rng.randrange(len(texts)))
+        save(db_uri, texts)
+        saved.append(list(texts))
+
+    with DbHistory(db_uri) as db:
+        for number, expected in enumerate(saved, 1):
+            row, paragraphs = db.load_revision('home', number)
+            assert paragraphs == expected
+        assert db.load_revision('home', len(saved) + 1) is None
+        c = db.conn.cursor()
+        c.execute("SELECT number FROM revision WHERE snapshot = 1")
+        snapshots = [row[0] for row in c]
+        assert len(saved) // SNAPSHOT_EVERY <= len(snapshots)
+        assert len(snapshots) < len(saved) // 2
+        assert all(b - a <= SNAPSHOT_EVERY
+                   for a, b in zip(snapshots, snapshots[1:] + [len(saved)]))
+        # keyset pagination
+        first = db.list_revisions('home', None, 30)
+        rest = db.list_revisions('home', first[-1]['number'], 30)
+        assert [row['number'] for row in first + rest] == \
+            list(range(len(saved), 0, -1))
+
+def test_changed_elsewhere(db_uri):
+    save(db_uri, ['One'])
+    with DbHistory(db_uri) as db:
+        db.conn.execute("UPDATE content SET content = 'Two' "
+                        "WHERE parent_id = 0")
+    save(db_uri, ['Two', 'Three'])
+    with DbHistory(db_uri) as db:
+        assert db.load_revision('home', 3)[1] == ['Two']
+        assert db.load_revision('home', 4)[1] == ['Two', 'Three']
+
+def test_endpoints(app_config, db_uri):
+    app_config['read_only_view'] = True
+    save(db_uri, ['One @math{x}'])
+    client = application.app.test_client()
+    response = client.get('/history?:=home')
+    assert b'Revision 2' in response.data
+    response = client.get('/revision?:=home&n=2')
+    assert response.status_code == 200
+    assert b'One' in response.data
+    assert client.get('/revision?:=home&n=3').status_code == 404
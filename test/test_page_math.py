@@ -0,0 +1,46 @@
+import pytest
+from page_math import DbMath, normalize_tex
+from fragments import Fragment
+
+def test_normalize_tex():
+    assert normalize_tex(' \\Z [ i ] ') == '\\Z[i]'
+    assert normalize_tex('\\alpha   x') == '\\alpha x'
+    assert normalize_tex('\\alpha \\beta') == '\\alpha\\beta'
+    assert normalize_tex('\\alpha 2') == '\\alpha2'
+    assert normalize_tex('a\n+\tb') == 'a+b'
+
+@pytest.fixture
+def db():
+    db = DbMath(':memory:')
+    db.conn.executescript("""
+    INSERT INTO toc (id, slug, title) VALUES (1, 'rings', 'Rings');
+    INSERT INTO content (id, parent_id, next_id, content)
+    VALUES (10, 1, 11, ''), (11, 1, NULL, '');
+    """)
+    fragments = [Fragment(10, '', None, frozenset()),
+                 Fragment(11, '', None, frozenset())]
+    fragments[0].math = [('\\Z [i]', False), ('\\Z[i]', False)]
+    fragments[1].math = [('\\Z[i]', True), ('\\Z[x]', False), ('\\Q', False)]
+    with db.auto_rollback() as c:
+        DbMath.write_math(c, 1, fragments)
+    yield db
+    db.close()
+
+def test_exact(db):
+    rows = db.lookup('\\Z[i]')
+    assert [(r['content_id'], r['display']) for r in rows] == \
+        [(10, 0), (11, 1)]
+
+def test_prefix(db):
+    assert [r['tex'] for r in db.lookup('\\Z', prefix=True)] == \
+        ['\\Z[i]', '\\Z[i]', '\\Z[x]']
+
+def test_deleted(db):
+    db.conn.execute('DELETE FROM content WHERE id = 10')
+    assert len(db.lookup('\\Z[i]')) == 1
+
+def test_uses_index(db):
+    plan = db.conn.execute("""
+    EXPLAIN QUERY PLAN SELECT * FROM math WHERE tex >= ? AND tex < ?
+    """, ('a', 'b')).fetchall()
+    assert 'USING' in plan[0][-1]
@@ -0,0 +1,83 @@
+import pytest
+import application
+from page_new import DbCreate
+
+@pytest.fixture
+def db(app_config):
+    with DbCreate(app_config['db_uri']) as db:
+        yield db
+
+def children(db, slug):
+    return [row[0] for row in db.conn.execute(
+        'SELECT slug FROM toc WHERE parent_id = '
+        '(SELECT id FROM toc WHERE slug = ?) ORDER BY position, id', (slug,)
+    )]
+
+def test_create_pages(db):
+    results = db.create_pages([
+        {'parent_slug': 'math', 'slug': 'course', 'title': 'Course'},
+        {'parent_slug': 'course', 'slug': 'lecture-1', 'title': 'Lecture 1',
+         'paragraphs': ['First', '  ', 'Second']},
+        {'parent_slug': 'course', 'slug': 'lecture-2', 'title': 'Lecture 2'},
+        {'parent_slug': 'course', 'slug': 'bad slug', 'title': 'Bad'},
+        {'parent_slug': 'bad-slug', 'slug': 'orphan', 'title': 'Orphan'},
+        {'slug': 'lecture-1', 'title': 'Again'},
+        {'slug': 'home', 'title': 'Taken'},
+        {'slug': 'no-title', 'title': ' '},
+    ])
+    errors = [error for _, error in results]
+    assert errors[:3] == [None, None, None]
+    assert all(errors[3:])
+    assert children(db, 'math') == ['units-of-zi', 'course']
+    assert children(db, 'course') == ['lecture-1', 'lecture-2']
+    assert [row[0] for row in db.conn.execute(
+        'SELECT content FROM content WHERE parent_id = ? ORDER BY position',
+        (results[1][0],)
+    )] == ['First', 'Second']
+    assert db.conn.execute(
+        'SELECT count(*) FROM toc_closure WHERE ancestor = 0 '
+        "AND descendant IN (SELECT id FROM toc WHERE slug LIKE 'lecture-%')"
+    ).fetchone()[0] == 2
+    assert db.conn.execute(
+        "SELECT count(*) FROM search WHERE search MATCH 'Second'"
+    ).fetchone()[0] == 2
+
+def test_endpoints(db):
+    client = application.app.test_client()
+    response = client.post('/new', json={'pages': [
+        {'slug': 'top', 'title': 'Top', 'paragraphs': ['Hello']},
+        {'slug': 'top', 'title': 'Top again'},
+    ]})
+    results = response.get_json()['results']
+    assert [r['status'] for r in results] == ['created', 'error']
+    assert results[0]['id'] is not None
+    assert client.post('/new', json=[]).status_code == 400
+    response = client.post('/new', data={'slug': 'form', 'title': 'Form',
+                                         'parent_slug': 'top'})
+    assert response.status_code == 302
+    assert children(db, 'top') == ['form']
+    response = client.post('/new', data={'slug': 'form', 'title': 'Form'})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('parser', ['pyparsing', 'pda'])
+def test_rendered_like_the_editor(db, app_config, parser):
+    app_config['parser'] = parser
+    client = application.app.test_client()
+    response = client.post('/new', json={'pages': [
+        {'slug': 'lecture', 'title': 'Lecture',
+         'paragraphs': ['Back to @page{home}', 'Units of @math{\\Z [i]}']},
+    ]})
+    page_id = response.get_json()['results'][0]['id']
+
+    html = client.get('/view?:=home').data.decode('utf-8')
+    assert 'What links here' in html
+    assert 'href="?:=lecture"' in html
+    results = client.get('/math?tex=%5CZ%5Bi%5D').get_json()['results']
+    assert [r['title'] for r in results] == ['Lecture']
+
+    count = lambda query: db.conn.execute(query, (page_id,)).fetchone()[0]
+    assert count('SELECT count(*) FROM fragment WHERE content_id IN '
+                 '(SELECT id FROM content WHERE parent_id = ?)') == 2
+    assert count('SELECT count(*) FROM bytecode WHERE content_id IN '
+                 '(SELECT id FROM content WHERE parent_id = ?)') == 2
+    assert count('SELECT max(number) FROM revision WHERE page_id = ?') == 1
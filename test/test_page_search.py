@@ -0,0 +1,47 @@
+import pytest
+from page_search import DbSearch, to_match_query
+
+@pytest.fixture
+def db():
+    db = DbSearch(':memory:')
+    db.conn.executescript("""
+    INSERT INTO toc (id, slug, title) VALUES (1, 'rings', 'Rings'),
+                                             (2, 'other', 'Other');
+    """)
+    db.conn.executemany("""
+    INSERT INTO content (id, parent_id, next_id, content) VALUES (?, ?, ?, ?)
+    """, [(i, 2, None, 'a unit <b> %d' % i) for i in range(1, 46)] +
+         [(100, 1, None, 'nothing here')])
+    yield db
+    db.close()
+
+def test_title_and_content(db):
+    results = db.search('rings')
+    assert [r.content_id for r in results] == [100]
+    assert str(results[0].title) == '<mark>Rings</mark>'
+    results = db.search('unit 7')
+    assert str(results[0].snippet) == 'a <mark>unit</mark> &lt;b&gt; ' \
+                                      '<mark>7</mark>'
+
+def test_pagination(db):
+    seen = []
+    after = None
+    while True:
+        results = db.search('unit', after, 20)
+        if not results:
+            break
+        seen += [r.content_id for r in results]
+        after = (results[-1].rank, results[-1].content_id)
+    assert sorted(seen) == list(range(1, 46))
+    assert len(seen) == 45
+
+def test_edits(db):
+    db.conn.execute("UPDATE toc SET title = 'Groups' WHERE id = 1")
+    assert db.search('rings') == []
+    assert [r.content_id for r in db.search('groups')] == [100]
+    db.conn.execute('DELETE FROM content WHERE id = 100')
+    assert db.search('groups') == []
+
+def test_syntax():
+    assert to_match_query('') == ''
+    assert to_match_query(' a "b" NOT ') == '"a" """b""" "NOT"'
@@ -0,0 +1,39 @@
+import pytest
+import sqlite3
+import application
+
+def first_index(chunks, marker):
+    return next(i for i, chunk in enumerate(chunks) if marker in chunk)
+
+@pytest.mark.parametrize('parser', ['pyparsing', 'pda'])
+def test_stream_view(app_config, parser):
+    app_config['parser'] = parser
+    client = application.app.test_client()
+    url = '/view?:=units-of-zi'
+    # streamed first, so that the paragraphs are rendered as it goes
+    app_config['stream_view'] = True
+    response = client.get(url, buffered=False)
+    chunks = list(response.response)
+    app_config['stream_view'] = False
+    assert b''.join(chunks) == client.get(url).data
+
+    # one chunk per paragraph, after the header and the sidebar
+    paragraphs = [i for i, chunk in enumerate(chunks)
+                  if b'<!-- compilation starts -->' in chunk]
+    assert len(paragraphs) == 6
+    assert first_index(chunks, b'[[ Sidebar: ]]') < paragraphs[0]
+    assert first_index(chunks, b'<header>') < paragraphs[0]
+
+def test_changed_outside_editor(app_config):
+    app_config['parser'] = 'pda'
+    client = application.app.test_client()
+    url = '/view?:=home'
+    assert b'First paragraph' in client.get(url).data
+    conn = sqlite3.connect(app_config['db_uri'])
+    conn.execute("UPDATE content SET content = 'Changed paragraph' "
+                 "WHERE id = 1")
+    conn.commit()
+    conn.close()
+    data = client.get(url).data
+    assert b'Changed paragraph' in data
+    assert b'First paragraph' not in data
@@ -0,0 +1,61 @@
+import pytest
+from pathlib import Path
+from application import app
+from parsing import Parser, PDAParser, compile_notes
+
+units_dir = Path(__file__).absolute().parent / 'units'
+
+test_data = [path.read_text() for path in sorted(units_dir.glob('*.scrbl'))]
+
+def compile_html(parser, string):
+    with app.test_request_context():
+        ast = parser.parse_string(string, 1)
+        return ''.join(map(str, compile_notes(ast, parser.acc)))
+
+@pytest.fixture(params=test_data)
+def datum(request):
+    yield request.param
+
+def test_same_html(datum):
+    assert compile_html(PDAParser('test'), datum) == \
+        compile_html(Parser('test'), datum)
+
+@pytest.mark.parametrize('string', [
+    'x\n  y @math|{a\n  b}|',
+    '@math|{\n  a\n\n    b\n  }|',
+    '@bold{x\n  @bold{y}\n  z}',
+])
+def test_indentation(string):
+    assert str(PDAParser('test').parse_string(string, 1)) == \
+        str(Parser('test').parse_string(string, 1))
+    assert compile_html(PDAParser('test'), string) == \
+        compile_html(Parser('test'), string)
+
+def test_raw_indentation():
+    html = compile_html(PDAParser('test'), '@math|{a\n  b}|')
+    assert 'data-tex="a\n  b"' in html
+
+def test_links():
+    parser = PDAParser('test')
+    parser.parse_string('See @page{home} and @bold{@page{units: Units}}', 1)
+    assert parser.acc.slugs() == {'home', 'units'}
+
+@pytest.mark.parametrize('string, line', [
+    ('@unknown{x}', 1),
+    ('first\n\n@bold{never closed', 3),
+    ('closing } too much', 1),
+    ('@bold{x}\n@ what {', 2),
+])
+def test_errors(string, line):
+    ast = PDAParser('test').parse_string(string, 1)
+    exception = ast.params[0]
+    assert exception.data == '.exception'
+    assert exception.params[:3] == ['test', '1', str(line)]
+
+def test_raw_mode():
+    ast = PDAParser('test').parse_string('@math|{ @x{y} }|', 1)
+    assert ast.params[0].data == 'math'
+    # the strings that are only whitespace are dropped, as in Parser
+    assert ''.join(ast.params[0].params) == '@x{y}'
+    ast = PDAParser('test').parse_string('@math|{ a + b }|', 1)
+    assert ast.params[0].params == [' a + b ']
@@ -0,0 +1,40 @@
+import pytest
+import random
+from pathlib import Path
+from parsing import pyparsing_tokenize, regex_tokenize, LOCATED
+
+units_dir = Path(__file__).absolute().parent / 'units'
+
+test_data = [path.read_text() for path in sorted(units_dir.glob('*.scrbl'))]
+test_data += [
+    "@bold{@italic{x}} and @ {list} @Math|{ \\{ x \\} }|",
+    "tabs\tand\r\nCRLF\r\n\r\n  \n   indented",
+    "a|b|{c}|d }}| {{ @ bold { x }",
+    "email me @ home",
+    "too long: @" + "x" * 150 + "{}",
+]
+
+def normalize(tokens):
+    return [(t.locn_start, t.value, t.locn_end) if isinstance(t, LOCATED)
+            else t for t in tokens]
+
+@pytest.fixture(params=test_data)
+def datum(request):
+    yield request.param
+
+def test_same_tokens(datum):
+    expect = normalize(pyparsing_tokenize(datum))
+    assert normalize(regex_tokenize(datum)) == expect
+
+def test_random_strings():
+    rng = random.Random(162)
+    for _ in range(2000):
+        string = ''.join(rng.choice('@{}|\n \tab-_\r')
+                         for _ in range(rng.randint(1, 20)))
+        try:
+            expect = normalize(pyparsing_tokenize(string))
+        except Exception:
+            with pytest.raises(ValueError):
+                list(regex_tokenize(string))
+        else:
+            assert normalize(regex_tokenize(string)) == expect
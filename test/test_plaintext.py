@@ -0,0 +1,55 @@
+import pytest
+from plaintext import DbPlainText, PlainTextError, read_paragraphs
+from page_edit_tree import DbEditTree, TRASH
+
+@pytest.fixture
+def notes(db_uri):
+    with DbPlainText(db_uri) as db:
+        yield db
+
+def dump(db):
+    c = db.conn.cursor()
+    c.execute("""
+    SELECT toc.slug, parent.slug, toc.title, content.content FROM toc
+    LEFT JOIN toc AS parent ON parent.id = toc.parent_id
+    LEFT JOIN content ON content.parent_id = toc.id
+    ORDER BY toc.slug, content.position
+    """)
+    return c.fetchall()
+
+def test_round_trip(notes, tmp_path):
+    assert notes.export_to(tmp_path / 'out') == (3, 10)
+    assert (tmp_path / 'out/home/math/units-of-zi.scrbl').is_file()
+    with DbPlainText(str(tmp_path / 'copy.db')) as copy:
+        assert copy.import_from(tmp_path / 'out') == (3, 10)
+        assert dump(copy) == dump(notes)
+        c = copy.conn.cursor()
+        c.execute("SELECT count(*) FROM search WHERE search MATCH 'Second'")
+        assert c.fetchone()[0] == 1
+        # the trigger is back
+        c.execute("INSERT INTO content (parent_id, content) "
+                  "VALUES (1, 'Second thoughts')")
+        c.execute("SELECT count(*) FROM search WHERE search MATCH 'Second'")
+        assert c.fetchone()[0] == 2
+
+def test_round_trip_with_trash(notes, tmp_path):
+    with DbEditTree(notes.address) as tree:
+        tree.recycle_page('units-of-zi')
+    # the trash stays behind
+    assert notes.export_to(tmp_path / 'out') == (2, 4)
+    assert not list((tmp_path / 'out').rglob(TRASH + '*'))
+    with DbPlainText(str(tmp_path / 'copy.db')) as copy:
+        assert copy.import_from(tmp_path / 'out') == (2, 4)
+        assert dump(copy) == [row for row in dump(notes)
+                              if TRASH not in (row[0], row[1])]
+
+def test_form_feed(notes, tmp_path):
+    notes.conn.execute("UPDATE content SET content = 'a\n\f\nb' WHERE id = 1")
+    with pytest.raises(PlainTextError):
+        notes.export_to(tmp_path / 'out')
+
+def test_unfinished_file(tmp_path):
+    path = tmp_path / 'page.scrbl'
+    path.write_text('title: Page\n\f\nfirst\n\f\nsecond\n')
+    with pytest.raises(PlainTextError):
+        list(read_paragraphs(path))
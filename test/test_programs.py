@@ -0,0 +1,74 @@
+import pytest
+from pathlib import Path
+import pda
+from programs import DbBytecode, Programs, compile_program
+from fragments import parse_fragments, text_hash
+from parsing import new_parser
+
+units_dir = Path(__file__).absolute().parent / 'units'
+
+test_data = [path.read_text() for path in sorted(units_dir.glob('*.scrbl'))]
+test_data += ['', 'ünicode @math{\\alpha} ' + 'x' * 300]
+
+@pytest.fixture(params=test_data)
+def datum(request):
+    yield request.param
+
+def test_round_trip(datum):
+    asm = compile_program(datum)
+    assert pda.decode(pda.encode(asm)) == [tuple(i) for i in asm]
+
+def test_stale_version():
+    blob = bytearray(pda.encode(compile_program('text')))
+    digest = text_hash('text')
+    assert Programs({1: (digest, bytes(blob))}).get(1, 'text') is not None
+    assert Programs({1: (digest, bytes(blob))}).get(1, 'other') is None
+    blob[len(pda.BYTECODE_MAGIC)] += 1
+    assert Programs({1: (digest, bytes(blob))}).get(1, 'text') is None
+    assert Programs({1: (digest, b'junk')}).get(1, 'text') is None
+
+def test_markup_error():
+    assert compile_program('@bold{') is None
+
+@pytest.fixture
+def db():
+    db = DbBytecode(':memory:')
+    db.conn.executescript("""
+    INSERT INTO toc (id, slug, title, first_content_id)
+    VALUES (1, 'home', 'Home', 10);
+    INSERT INTO content (id, parent_id, next_id, content)
+    VALUES (10, 1, NULL, 'Plain');
+    """)
+    yield db
+    db.close()
+
+def test_replay(db):
+    parser = new_parser('home', 'pda')
+    programs = db.load_programs(1)
+    fragments, _ = parse_fragments(parser, [('Plain', 10)], programs)
+    db.store_programs(programs)
+    assert list(programs.compiled) == [10]
+
+    # the stored bytecode is used instead of compiling the text
+    with db.auto_rollback() as c:
+        c.execute('UPDATE bytecode SET program = ? WHERE content_id = 10',
+                  (pda.encode(compile_program('Replayed')),))
+    programs = db.load_programs(1)
+    replayed, _ = parse_fragments(parser, [('Plain', 10)], programs)
+    assert not programs.compiled
+    assert 'Replayed' in str(replayed[0].ast)
+    assert 'Plain' in str(fragments[0].ast)
+
+def test_changed_text(db):
+    parser = new_parser('home', 'pda')
+    with db.auto_rollback() as c:
+        DbBytecode.write_program(c, 10, 'Plain')
+        c.execute("UPDATE content SET content = 'Changed' WHERE id = 10")
+    # the program of the old text is not replayed for the new one
+    programs = db.load_programs(1)
+    fragments, _ = parse_fragments(parser, [('Changed', 10)], programs)
+    assert 'Changed' in str(fragments[0].ast)
+    db.store_programs(programs)
+    programs = db.load_programs(1)
+    assert programs.get(10, 'Changed') is not None
+    assert programs.get(10, 'Plain') is None
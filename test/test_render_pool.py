@@ -0,0 +1,47 @@
+import pytest
+from pathlib import Path
+from application import app
+from parsing import new_parser
+from fragments import parse_fragments, compile_fragments
+import render_pool
+from render_pool import RenderPool
+
+units_dir = Path(__file__).absolute().parent / 'units'
+
+pairs = [(path.read_text() + '\n\nSee @page{home} and @page{nowhere}', i)
+         for i, path in enumerate(sorted(units_dir.glob('*.scrbl')), 100)]
+
+def render(parse, compile_):
+    fragments, parser_acc = parse()
+    parser_acc.put_title('home', 'Home')
+    with app.test_request_context():
+        compile_(fragments, parser_acc)
+    return [(f.content_id, f.html) for f in fragments], parser_acc.slugs()
+
+@pytest.fixture
+def workers():
+    yield 2
+    if render_pool._executor is not None:
+        render_pool._executor.shutdown()
+        render_pool._executor = None
+
+@pytest.mark.parametrize('engine', ['pyparsing', 'pda'])
+def test_same_html(workers, engine):
+    pool = RenderPool(workers, 0, engine)
+    parallel = render(lambda: pool.parse_fragments('test', pairs),
+                      pool.compile_fragments)
+    serial = render(lambda: parse_fragments(new_parser('test', engine),
+                                            pairs),
+                    compile_fragments)
+    assert parallel == serial
+    assert parallel[1] == {'home', 'nowhere'}
+
+def test_wants():
+    size = sum(len(string) for string, _ in pairs)
+    assert RenderPool(2, size).wants(pairs)
+    assert not RenderPool(2, size + 1).wants(pairs)
+    assert not RenderPool(0, 0).wants(pairs)
+    assert not RenderPool(None, None).wants(pairs)
+    assert not RenderPool(1, 0).wants(pairs)
+    # a single paragraph is not worth sending to the workers
+    assert not RenderPool(2, 0).wants(pairs[:1])
@@ -0,0 +1,90 @@
+import pytest
+import sqlite3
+from werkzeug.datastructures import MultiDict
+from parsing import ParserAcc
+from title_index import TitleIndex, lookup_titles, read_generation, CHUNK_SIZE
+from title_index import get_title_index
+from page_edit import EditPageDbWriter
+from sqlops import Db
+
+@pytest.fixture
+def conn():
+    db = Db(':memory:')
+    db.conn.executemany('INSERT INTO toc (id, slug, title) VALUES (?, ?, ?)',
+                        ((i, 'page-%d' % i, 'Page %d' % i)
+                         for i in range(CHUNK_SIZE * 3)))
+    yield db.conn
+    db.close()
+
+def titles(index, c, slugs):
+    acc = ParserAcc()
+    for slug in slugs:
+        acc.add_slug(slug)
+    index.put_titles_in(c, slugs, acc)
+    return acc
+
+def test_many_slugs(conn):
+    slugs = ['page-%d' % i for i in range(CHUNK_SIZE * 3)] + ['nope']
+    acc = ParserAcc()
+    lookup_titles(conn.cursor(), slugs, acc)
+    assert len(acc.slug_title_map) == CHUNK_SIZE * 3
+    acc = titles(TitleIndex(), conn.cursor(), slugs)
+    assert len(acc.slug_title_map) == CHUNK_SIZE * 3
+    assert list(acc.unprocessed_slugs()) == ['nope']
+
+def test_generation(conn):
+    c = conn.cursor()
+    before = read_generation(c)
+    c.execute("UPDATE toc SET mtime = 1 WHERE id = 1")
+    c.execute("UPDATE toc SET title = 'Page 1' WHERE id = 1")
+    assert read_generation(c) == before
+    c.execute("UPDATE toc SET title = 'One' WHERE id = 1")
+    assert read_generation(c) == before + 1
+
+def test_stale(conn):
+    c = conn.cursor()
+    index = TitleIndex()
+    assert titles(index, c, ['page-1']).get('page-1') == 'Page 1'
+    # changed behind the back of the index
+    c.execute("UPDATE toc SET slug = 'one', title = 'One' WHERE id = 1")
+    acc = titles(index, c, ['page-1', 'one'])
+    assert acc.get('page-1') is None
+    assert acc.get('one') == 'One'
+
+def test_change(conn):
+    c = conn.cursor()
+    index = TitleIndex()
+    titles(index, c, [])
+    before = read_generation(c)
+    c.execute("UPDATE toc SET title = 'One' WHERE id = 1")
+    index.change('page-1', 'page-1', 'One', before, read_generation(c))
+    assert index.titles['page-1'] == 'One'
+    # skipped a change
+    c.execute("UPDATE toc SET title = 'Two' WHERE id = 2")
+    before = read_generation(c)
+    c.execute("UPDATE toc SET title = 'Three' WHERE id = 3")
+    index.change('page-3', 'page-3', 'Three', before, read_generation(c))
+    assert titles(index, c, ['page-2']).get('page-2') == 'Two'
+
+def test_change_elsewhere_then_save(db_uri):
+    index = get_title_index(db_uri)
+    with EditPageDbWriter(db_uri) as db:
+        c = db.conn.cursor()
+        # as the editor saves it
+        c.execute("UPDATE toc SET unlisted = 0 WHERE slug = 'home'")
+        assert titles(index, c, ['math']).get('math') == 'Math'
+        conn = sqlite3.connect(db_uri)
+        conn.execute("UPDATE toc SET title = 'Renamed Elsewhere' "
+                     "WHERE slug = 'math'")
+        conn.commit()
+        conn.close()
+        # a save that changes nothing does not bump the generation
+        texts = [row[0] for row in c.execute(
+            'SELECT content FROM content WHERE parent_id = 0 '
+            'ORDER BY position'
+        )]
+        db.handle_change(MultiDict(
+            [('old_slug', 'home'), ('new_slug', 'home'), ('title', 'Home'),
+             ('content_lock', '')] + [('text', text) for text in texts]
+        ))
+        assert titles(index, c, ['math']).get('math') == 'Renamed Elsewhere'
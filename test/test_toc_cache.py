@@ -0,0 +1,77 @@
+import pytest
+from sqlops import Db, Tree, tree_query
+from sidebar import compile_tree, compile_tree_cached
+from toc_cache import TocCache, tree_cols
+
+@pytest.fixture
+def db():
+    db = Db(':memory:')
+    c = db.conn.cursor()
+    c.execute("INSERT INTO toc (id, slug, title) VALUES (0, 'home', 'Home')")
+    for i in range(1, 16):
+        c.execute('INSERT INTO toc (id, parent_id, slug, title, position) '
+                  'VALUES (?, ?, ?, ?, ?)',
+                  (i, (i - 1) // 3, 'p%d' % i, 'P%d' % i, -i))
+    yield db
+    db.close()
+
+@pytest.fixture
+def cache(db):
+    cache = TocCache()
+    cache.refresh(db.conn.cursor())
+    yield cache
+
+def from_query(db, query, page_id):
+    rows = db.conn.execute(query, {'id': page_id}).fetchall()
+    return {row['id']: tuple(row[col] for col in tree_cols) for row in rows}
+
+def from_cache(rows):
+    return {row['id']: tuple(row[col] for col in tree_cols) for row in rows}
+
+def ancestors(db, page_id):
+    return [row[0] for row in db.conn.execute(
+        'SELECT ancestor FROM toc_closure WHERE descendant = ? '
+        'ORDER BY depth', (page_id,)
+    )]
+
+def test_same_rows_as_queries(db, cache):
+    for page_id in range(16):
+        assert from_cache(cache.tree_rows(page_id)) == \
+            from_query(db, tree_query, page_id)
+        assert [row['id'] for row in cache.path_rows(page_id)] == \
+            ancestors(db, page_id)
+
+def test_no_queries_when_unchanged(db, cache):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    cache.refresh(db.conn.cursor())
+    assert len(statements) == 1
+    assert cache.tree_rows(5)
+
+def test_refresh(db, cache):
+    db.conn.execute('UPDATE toc SET parent_id = 14 WHERE id = 2')
+    db.conn.execute('UPDATE toc SET unlisted = 1 WHERE id = 3')
+    db.conn.execute("UPDATE toc SET mtime = 1 WHERE id = 4")
+    generation = cache.generation
+    cache.refresh(db.conn.cursor())
+    assert cache.generation == generation + 2
+    assert [row['id'] for row in cache.path_rows(7)] == [7, 2, 14, 4, 1, 0]
+    assert from_cache(cache.tree_rows(2)) == from_query(db, tree_query, 2)
+    assert from_cache(cache.tree_rows(3)) == from_query(db, tree_query, 3)
+
+def sidebar(cache, page_id):
+    snapshot = cache.snapshot
+    rows = {row['id']: row for row in snapshot.tree_rows(page_id)}
+    return compile_tree_cached(snapshot, page_id, Tree(rows, page_id).into())
+
+def test_sidebar(db, cache):
+    html = sidebar(cache, 5)
+    assert html == ''.join(compile_tree(
+        Tree({row['id']: row for row in cache.tree_rows(5)}, 5).into()
+    ))
+    assert sidebar(cache, 5) is html
+    assert sidebar(cache, 6) is not html
+
+    db.conn.execute("UPDATE toc SET title = 'Renamed' WHERE id = 1")
+    cache.refresh(db.conn.cursor())
+    assert 'Renamed' in sidebar(cache, 5)
@@ -0,0 +1,35 @@
+import pytest
+import random
+from pathlib import Path
+from tokenizing import tokenize, InputTuple
+
+units_dir = Path(__file__).absolute().parent / 'units'
+
+test_data = [path.read_text() for path in sorted(units_dir.glob('*.scrbl'))]
+test_data += [
+    "line\r\n  \n\t \nbreaks }| |{ }} || @{}",
+    "trailing }",
+    "trailing |",
+    "trailing \n \n",
+]
+
+@pytest.fixture(params=test_data)
+def datum(request):
+    yield request.param
+
+def test_bulk_mode(datum):
+    assert list(tokenize(datum, bulk=True)) == \
+        list(tokenize(datum, bulk=False))
+
+def test_line_breaks():
+    # the indentation of the last line is kept, unless a command follows
+    assert list(tokenize('a\n  \n b')) == ['a', InputTuple('\n', 2), ' b']
+    assert list(tokenize('a\r\n  @b')) == ['a', InputTuple('\n', 1), '@', 'b']
+
+def test_random_strings():
+    rng = random.Random(162)
+    for _ in range(2000):
+        string = ''.join(rng.choice('@{}|\n\r \tab')
+                         for _ in range(rng.randint(0, 20)))
+        assert list(tokenize(string, bulk=True)) == \
+            list(tokenize(string, bulk=False))
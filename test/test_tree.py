@@ -0,0 +1,73 @@
+import pytest
+import sqlite3
+from sqlops import Db, Tree, tree_query
+
+@pytest.fixture
+def db():
+    db = Db(':memory:')
+    c = db.conn.cursor()
+    c.execute("INSERT INTO toc (id, slug, title) VALUES (0, 'home', 'Home')")
+    # twenty children of the home page, then a chain of grandchildren
+    for i in range(1, 21):
+        c.execute('INSERT INTO toc (id, parent_id, slug, title, position) '
+                  'VALUES (?, 0, ?, ?, ?)', (i, 'p%d' % i, 'P%d' % i, i))
+    for i in range(21, 26):
+        c.execute('INSERT INTO toc (id, parent_id, slug, title) '
+                  'VALUES (?, ?, ?, ?)', (i, i - 1 if i > 21 else 10,
+                                          'p%d' % i, 'P%d' % i))
+    yield db
+    db.close()
+
+def load_tree(db, page_id):
+    rows = db.conn.execute(tree_query, {'id': page_id}).fetchall()
+    return Tree({row['id']: row for row in rows}, page_id)
+
+def titles(node):
+    return [child.title or child.slug for child in node.children]
+
+def ancestors(db, page_id):
+    return [row[0] for row in db.conn.execute(
+        'SELECT ancestor FROM toc_closure WHERE descendant = ? '
+        'ORDER BY depth', (page_id,)
+    )]
+
+def test_sibling_window(db):
+    tree = load_tree(db, 10)
+    home = tree.into().children[0]
+    assert titles(home) == ['...', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10',
+                            'P11', 'P12', 'P13', 'P14', 'P15', '...']
+    assert titles(home.children[6]) == ['P21']
+    before, after = tree.neighbours()
+    assert (before['id'], after['id']) == (9, 11)
+
+def test_window_at_the_front(db):
+    tree = load_tree(db, 1)
+    home = tree.into().children[0]
+    assert titles(home) == ['P1', 'P2', 'P3', 'P4', 'P5', 'P6', '...']
+    assert tree.neighbours()[0] is None
+
+def test_deep_path(db):
+    tree = load_tree(db, 25)
+    node = tree.into()
+    path = []
+    while node.children:
+        node = [child for child in node.children if child.children or
+                child.selected][0]
+        path.append(node.title)
+    assert path == ['Home', 'P10', 'P21', 'P22', 'P23', 'P24', 'P25']
+
+def test_move(db):
+    db.conn.execute('UPDATE toc SET parent_id = 3 WHERE id = 22')
+    assert ancestors(db, 24) == [24, 23, 22, 3, 0]
+    assert ancestors(db, 21) == [21, 10, 0]
+
+def test_move_under_itself(db):
+    with pytest.raises(sqlite3.IntegrityError):
+        db.conn.execute('UPDATE toc SET parent_id = 24 WHERE id = 10')
+    assert ancestors(db, 24) == [24, 23, 22, 21, 10, 0]
+
+def test_delete(db):
+    db.conn.execute('DELETE FROM toc WHERE id = 25')
+    assert ancestors(db, 25) == []
+    assert db.conn.execute('SELECT count(*) FROM toc_closure '
+                           'WHERE ancestor = 25').fetchone()[0] == 0
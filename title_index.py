@@ -0,0 +1,82 @@
+from threading import Lock
+
+# SQLite's default limit on bound parameters is 999
+CHUNK_SIZE = 500
+
+def read_generation(c):
+    """The counter is bumped by a trigger whenever a page is added, removed,
+    renamed or moved, by this process or by anyone else"""
+    c.execute("SELECT value_int FROM metadata WHERE key = 'toc_generation'")
+    row = c.fetchone()
+    return row[0] if row else None
+
+def lookup_titles(c, slugs, parser_acc):
+    """Puts the titles of `slugs` in parser_acc, straight from toc"""
+    slugs = list(slugs)
+    for i in range(0, len(slugs), CHUNK_SIZE):
+        chunk = slugs[i:i + CHUNK_SIZE]
+        query = 'SELECT slug, title FROM toc WHERE slug in ({})'.format(
+            ','.join(map(lambda _: '?', chunk))
+        )
+        c.execute(query, chunk)
+        for row in c:
+            parser_acc.put_title(row[0], row[1])
+
+class TitleIndex(object):
+    """slug -> title of every page in one database"""
+    def __init__(self):
+        self.lock = Lock()
+        self.titles = {}
+        self.generation = None
+
+    def reload(self, c):
+        with self.lock:
+            generation = read_generation(c)
+            c.execute('SELECT slug, title FROM toc')
+            self.titles = {row[0]: row[1] for row in c}
+            self.generation = generation
+
+    def put_titles_in(self, c, slugs, parser_acc):
+        # stale if toc was changed somewhere else
+        if self.generation is None or read_generation(c) != self.generation:
+            self.reload(c)
+        titles = self.titles
+        for slug in slugs:
+            parser_acc.put_title(slug, titles.get(slug))
+
+    def change(self, old_slug, new_slug, title, before, after):
+        """Called after a write to toc is committed, with the generations
+        read at the start and at the end of its transaction. Pass None as
+        new_slug for deleted pages, and None as old_slug for new pages."""
+        with self.lock:
+            if self.generation is None:
+                return
+            if before != self.generation:
+                # missed some other change, reload next time
+                self.generation = None
+                return
+            # the transaction held the write lock, so the rest of the bump
+            # is this write's own
+            if old_slug is not None:
+                self.titles.pop(old_slug, None)
+            if new_slug is not None:
+                self.titles[new_slug] = title
+            self.generation = after
+
+    def invalidate(self):
+        """Reload next time; for writes that change many pages at once"""
+        with self.lock:
+            self.generation = None
+
+_indexes = {}
+_indexes_lock = Lock()
+
+def get_title_index(address):
+    if address == ':memory:':
+        # every connection has its own database
+        return TitleIndex()
+    with _indexes_lock:
+        index = _indexes.get(address)
+        if index is None:
+            index = _indexes[address] = TitleIndex()
+        return index
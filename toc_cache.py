@@ -0,0 +1,96 @@
+from threading import Lock
+from sqlops import SIBLING_WINDOW, sibling_order
+from title_index import read_generation
+
+# the columns that make up the tree; mtime and content_lock change on every
+# save, so they are read with the page instead
+tree_cols = ('id', 'parent_id', 'slug', 'title', 'unlisted', 'position')
+
+# values memoized for each snapshot, e.g. the sidebar of each page
+MEMO_SIZE = 4096
+
+class TocSnapshot(object):
+    """The tree as it was at one generation; never changed after loading"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.children = {}
+        self.index = {}
+        self.memo = {}
+        for row in rows.values():
+            self.children.setdefault(row['parent_id'], []).append(row)
+        for siblings in self.children.values():
+            siblings.sort(key=sibling_order)
+            for i, row in enumerate(siblings):
+                self.index[row['id']] = i
+
+    def path_rows(self, page_id):
+        """The page and its ancestors"""
+        result = []
+        row = self.rows.get(page_id)
+        while row is not None and len(result) <= len(self.rows):
+            result.append(row)
+            row = self.rows.get(row['parent_id'])
+        return result
+
+    def memoize(self, key, function):
+        """function() is computed once per snapshot, so it must only depend
+        on the tree. Stops remembering new keys after MEMO_SIZE."""
+        value = self.memo.get(key)
+        if value is None:
+            value = function()
+            if len(self.memo) < MEMO_SIZE:
+                self.memo[key] = value
+        return value
+
+    def tree_rows(self, page_id, window=SIBLING_WINDOW):
+        """The page, its ancestors, its children, and `window` + 1 siblings
+        on each side of it"""
+        row = self.rows.get(page_id)
+        if row is None:
+            return []
+        siblings = self.children[row['parent_id']]
+        i = self.index[page_id]
+        result = siblings[max(0, i - window - 1):i + window + 2]
+        result.extend(self.path_rows(row['parent_id']))
+        result.extend(self.children.get(page_id, ()))
+        return result
+
+class TocCache(object):
+    """Every page of one database, with the children of each page in order.
+    Gives the same rows as sqlops.tree_query."""
+    def __init__(self):
+        self.lock = Lock()
+        self.snapshot = TocSnapshot({})
+        self.generation = None
+
+    def reload(self, c):
+        with self.lock:
+            generation = read_generation(c)
+            c.execute('SELECT {} FROM toc'.format(', '.join(tree_cols)))
+            rows = {row[0]: dict(zip(tree_cols, row)) for row in c}
+            self.snapshot = TocSnapshot(rows)
+            self.generation = generation
+
+    def refresh(self, c):
+        # stale if toc was changed by anyone, including this process
+        if self.generation is None or read_generation(c) != self.generation:
+            self.reload(c)
+
+    def path_rows(self, page_id):
+        return self.snapshot.path_rows(page_id)
+
+    def tree_rows(self, page_id):
+        return self.snapshot.tree_rows(page_id)
+
+_caches = {}
+_caches_lock = Lock()
+
+def get_toc_cache(address):
+    if address == ':memory:':
+        # every connection has its own database
+        return TocCache()
+    with _caches_lock:
+        cache = _caches.get(address)
+        if cache is None:
+            cache = _caches[address] = TocCache()
+        return cache
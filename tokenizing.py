@@ -1,6 +1,6 @@
 from collections import deque, namedtuple
 from enum import IntEnum
-import io
+import re
 
 InputTuple = namedtuple('InputTuple', ('text', 'param'))
 
@@ -15,11 +15,20 @@ def token_iter(tokens):
 class ParserError(RuntimeError):
     pass
 
-def tokenize(string):
+# a run of plain text, a line break followed by whitespace, or one character
+# that the state machine cares about
+run_regex = re.compile('([^@{}|\n\r]+)|(\n\\s*)|(.)', re.DOTALL)
+# whitespace other than the indentation after the last line break
+indent_regex = re.compile('[^ \t]+')
+
+def tokenize(string, bulk=True):
     tokenizer = Tokenizer()
-    for ch in string:
-        yield from tokenizer.process_input(ch)
-    yield from tokenizer.process_input('')
+    if bulk:
+        yield from tokenizer.process_bulk(string)
+    else:
+        for ch in string:
+            yield from tokenizer.process_input(ch)
+        yield from tokenizer.process_input('')
 
 class State(IntEnum):
     TEXT = 1,
@@ -41,7 +50,8 @@ class Tokenizer:
     def __init__(self):
         self.queue = deque()
         self.line_break_count = 0
-        self.buf = io.StringIO()
+        self.indent = ''
+        self.buf = []
         # initial state
         self.state = State.TEXT
 
@@ -54,17 +64,53 @@ class Tokenizer:
         if some_string:
             self.queue.append(some_string)
 
-    def process_input(self, text):
+    def feed(self, text):
         routing_handler = Registry.routing_handlers[self.state]
 
         new_state = routing_handler(self, text)
         if new_state != self.state:
             self.state = new_state
 
+    def feed_run(self, run):
+        """Same as feeding the characters of `run` one by one, but `run`
+        must not contain any of '@{}|\\n\\r'"""
+        if self.state == State.LINE_BREAK:
+            run = run.lstrip()  # ignore whitespace
+            if not run:
+                return
+        if self.state != State.TEXT:
+            # the first character takes us back to State.TEXT
+            self.feed(run[0])
+            run = run[1:]
+        self.buf.append(run)
+
+    def process_input(self, text):
+        self.feed(text)
+
         # flush the output queue
         while len(self.queue) > 0:
             yield self.queue.popleft()
 
+    def process_bulk(self, string):
+        """Only runs the state machine on special characters"""
+        queue = self.queue
+        for match in run_regex.finditer(string):
+            run, line_breaks, ch = match.groups()
+            if run is not None:
+                self.feed_run(run)
+            elif line_breaks is not None:
+                # only the indentation of the last line is kept
+                self.feed('\n')
+                self.line_break_count += line_breaks.count('\n') - 1
+                self.indent = indent_regex.sub(
+                    '', line_breaks[line_breaks.rindex('\n') + 1:]
+                )
+            else:
+                self.feed(ch)
+            while queue:
+                yield queue.popleft()
+        yield from self.process_input('')
+
     def is_in_accepting_state(self):
         return self.state == State.TEXT
 
@@ -81,9 +127,10 @@ class Tokenizer:
             return State.OPEN_BRACE
         elif text == '\n':
             self.line_break_count = 1
+            self.indent = ''
             return State.LINE_BREAK
         else:
-            self.buf.write(text)
+            self.buf.append(text)
             return State.TEXT
 
     @Registry.routes_from(State.VERT)
@@ -108,18 +155,26 @@ class Tokenizer:
     def on_line_break(self, text):
         if text == '\n':
             self.line_break_count += 1
+            self.indent = ''
+            return State.LINE_BREAK
+        elif text in (' ', '\t'):  # the indentation of the next line
+            self.indent += text
             return State.LINE_BREAK
-        elif text.isspace():  # ignore whitespace
+        elif text.isspace():  # ignore other whitespace
             return State.LINE_BREAK
         else:
             # leaving
             self.output(InputTuple('\n', self.line_break_count))
             self.line_break_count = 0
+            if text and text not in '@{}|':
+                # the indentation starts the next run of text, as in
+                # parsing.Parser; a string of only whitespace would be
+                # dropped anyway
+                self.buf.append(self.indent)
+            self.indent = ''
             return self.on_text(text)
 
     def flush_buffer(self):
-        self.buf.seek(0)
-        result = self.buf.read()
-        self.buf.seek(0)
-        self.buf.truncate(0)
+        result = ''.join(self.buf)
+        self.buf.clear()
         return result